@@ -1,98 +1,185 @@
 import os
-import time
-import random
-import requests
+import json
+import asyncio
+import argparse
 import pandas as pd
-import fitz  # 用于检测PDF有效性
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from textmining.crawler import announcement_id, links_path
+from textmining.dedup import store_signature
+from textmining.position_index import store_pages
+from textmining.downloader import build_url, download_all
+from textmining.manifest import Manifest, doc_filename
+from textmining.metrics import finish, metrics, profiled
+from textmining.pdf_extract import EXTRACTOR_VERSION, ExtractionPool, check_and_extract, lost_stats  # 用于检测PDF有效性
+from textmining.rate_limiter import AdaptiveRateLimiter
 
 # ========== 参数设置 ==========
 YEAR = 2020
 BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
-EXCEL_PATH = os.path.join(BASE_DIR, "年报链接获取", f"{YEAR}_年报链接.xlsx")
+EXCEL_PATH = links_path(BASE_DIR, YEAR)
 PDF_DIR = os.path.join(BASE_DIR, f"年报PDF_{YEAR}")
 VALID_DIR = os.path.join(BASE_DIR, f"年报PDF_{YEAR}_有效")  # ✅ 有效PDF目录
+TXT_DIR = os.path.join(BASE_DIR, f"年报TXT_{YEAR}")  # --extract 时直接写入
+STATUS_LOG = os.path.join(BASE_DIR, f"下载日志_{YEAR}.jsonl")  # 每个文件一行的结构化状态
+BAD_LOG = os.path.join(BASE_DIR, f"坏文件日志_{YEAR}.txt")
 os.makedirs(PDF_DIR, exist_ok=True)
 os.makedirs(VALID_DIR, exist_ok=True)
 
-# ========== 下载函数 ==========
-def download_pdf(row):
-    name = f"{row['公司代码']}_{row['公司简称']}.pdf"
-    pdf_path = os.path.join(PDF_DIR, name)
-    link = str(row['PDF链接']).strip()
 
-    # 修正链接拼接
-    link = link.replace("cninfo.com.cnhttp", "cninfo.com.cn")
-    link = link.replace("http://", "https://")
-    url = link if link.startswith("http") else "https://static.cninfo.com.cn" + link
+def status_entry(result, check=None):
+    # 结构化状态：下载结果 + 有效性检测（+ 文本抽取）结果
+    entry = {
+        "file": os.path.basename(result["path"]),
+        "url": result.get("url"),
+        "download": result["status"],
+        "http_status": result.get("http_status"),
+        "attempts": result.get("attempts", 0),
+        "bytes": result.get("bytes", 0),
+        "resumed": result.get("resumed", False),
+        "validation": None,
+        "pages": None,
+        "extract": None,
+        "error": result.get("error"),
+    }
+    if check is not None:
+        entry["validation"] = "valid" if check["valid"] else "invalid"
+        entry["pages"] = check["pages"]
+        entry["extract"] = check["status"]
+        entry["error"] = check["error"]
+    return entry
 
-    if os.path.exists(pdf_path):
-        return f"✅ 已存在 {name}"
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                      "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15",
-        "Accept": "application/pdf",
-        "Referer": "https://www.cninfo.com.cn/",
-    }
+# ========== 并发下载 + 即时检测 ==========
+def download(df, args, manifest):
+    jobs = []
+    entries = []
+    queued = set()
+    for _, row in df.iterrows():
+        # 文件名带公告 ID：同一公司更正后重新披露的年报各存一份，由重复检测（03）判定保留哪份
+        name = doc_filename(row['公司代码'], row['公司简称'], announcement_id(row))
+        url = build_url(row['PDF链接'])
+        pdf_path = os.path.join(PDF_DIR, name)
+        if pdf_path in queued:
+            # 同一公告重复出现（文件名相同）：只下载第一条，避免两个任务写同一文件
+            entries.append(status_entry({"path": pdf_path, "url": url, "status": "duplicate"}))
+            continue
+        queued.add(pdf_path)
+        record = manifest.get_doc(name, YEAR)
+        if record.get("link") == url and os.path.exists(os.path.join(VALID_DIR, name)):
+            # 链接未变且已通过检测：无需重新下载
+            entries.append(status_entry({"path": pdf_path, "url": url, "status": "skipped"}))
+            continue
+        if record.get("link") and record["link"] != url:
+            # 链接变化（如更正后重新披露）：删除旧文件以便重新下载
+            for old in (pdf_path, os.path.join(VALID_DIR, name)):
+                if os.path.exists(old):
+                    os.remove(old)
+        jobs.append((url, pdf_path))
+
+    # 防反爬：由限速器统一控制请求发出速率，遇到限流或错误自动降速
+    limiter = AdaptiveRateLimiter(
+        rate=args.rate, max_rate=args.max_rate,
+        concurrency=args.concurrency, max_concurrency=args.concurrency,
+    )
+    if args.extract:
+        os.makedirs(TXT_DIR, exist_ok=True)
+    progress = tqdm(total=len(jobs))
+    checks = {}
+    check_job = profiled(check_and_extract, args.profile, "validate")
+    # 抽取超时由父进程兜底：卡在 MuPDF 内部的检测进程会被结束并替换，该文件记为未通过
+    with ExtractionPool(args.workers) as pool:
+        def on_result(r):
+            # 每下载完一份立即交给进程池检测（与其余下载并行），不再事后遍历整个目录
+            progress.update(1)
+            if r["status"] in ("ok", "exists"):
+                name = os.path.basename(r["path"])
+                txt_path = os.path.join(TXT_DIR, name[:-4] + ".txt") if args.extract else None
+                timeout = (args.timeout or None) if args.extract else None
+                checks[r["path"]] = pool.submit(
+                    check_job, r["path"], os.path.join(VALID_DIR, name), txt_path, timeout, timeout=timeout,
+                    on_lost=lambda *lost, path=r["path"], txt=txt_path: dict(lost_stats(path, txt, *lost), valid=False))
 
-    for attempt in range(2):
-        try:
-            r = requests.get(url, headers=headers, timeout=12)
-            if r.status_code == 200 and "application/pdf" in r.headers.get("Content-Type", ""):
-                with open(pdf_path, "wb") as f:
-                    f.write(r.content)
-                return f"✅ 成功 {name}"
-            else:
-                return f"⚠️ 非PDF或无效链接 {name} ({r.status_code})"
-        except Exception as e:
-            time.sleep(1)
-            if attempt == 1:
-                return f"❌ 失败 {name}: {e}"
+        results = asyncio.run(download_all(
+            jobs,
+            on_result=on_result,
+            concurrency=args.concurrency,
+            per_host=args.per_host,
+            retries=args.retries,
+            backoff=args.backoff,
+            limiter=limiter,
+        ))
+        progress.close()
 
-# ========== 并发下载 ==========
-df = pd.read_excel(EXCEL_PATH)
-print(f"📄 共 {len(df)} 条年报链接，开始下载 {YEAR} 年 PDF ...")
+        # 记录链接与 PDF 指纹（检测时已顺带算出哈希），供后续阶段判断是否需要重做
+        for r in tqdm(results, desc="检测PDF文件"):
+            check = checks[r["path"]].result() if r["path"] in checks else None
+            entries.append(status_entry(r, check))
+            name = os.path.basename(r["path"])
+            metrics.record("download", name, status=r["status"], seconds=r["seconds"], bytes=r["bytes"],
+                           retries=max(r["attempts"] - 1, 0), http_status=r["http_status"])
+            if check is not None:
+                metrics.record("validate", name, status="valid" if check["valid"] else "invalid",
+                               seconds=check["seconds"], pages=check["pages"], bytes=check["bytes_in"],
+                               extract=check["status"], error=check["error"])
+            if check is None or not check["valid"]:
+                continue
+            fields = dict(link=r["url"], pdf_stat=check["pdf_stat"], pdf_sha256=check["pdf_sha256"])
+            if check["status"] == "ok":
+                # 同一次打开已抽取文本：登记 TXT，03_convert_to_txt.py 会直接跳过
+                fields.update(txt_stat=check["txt_stat"], txt_sha256=check["txt_sha256"],
+                              txt_source_pdf=check["pdf_sha256"], extractor_version=EXTRACTOR_VERSION)
+                store_signature(manifest, YEAR, name[:-4] + ".txt", check["txt_stat"], check)
+                store_pages(manifest, YEAR, name[:-4] + ".txt", check["txt_stat"], check)
+            manifest.update_doc(name, YEAR, commit=False, **fields)
+    manifest.commit()
+    return entries
 
-results = []
-with ThreadPoolExecutor(max_workers=12) as executor:
-    futures = [executor.submit(download_pdf, row) for _, row in df.iterrows()]
-    for i, future in enumerate(tqdm(as_completed(futures), total=len(futures))):
-        results.append(future.result())
-        time.sleep(random.uniform(0.05, 0.2))  # 防反爬
 
-# ========== 下载结果统计 ==========
-success = [r for r in results if "✅ 成功" in r or "✅ 已存在" in r]
-failed = [r for r in results if "❌" in r]
-print(f"\n✅ 成功 {len(success)} 份 | ❌ 失败 {len(failed)} 份 | 总计 {len(df)}")
+def main():
+    parser = argparse.ArgumentParser(description=f"下载 {YEAR} 年年报 PDF")
+    parser.add_argument("--concurrency", type=int, default=12, help="同时进行的下载数")
+    parser.add_argument("--per-host", type=int, default=6, help="单个主机的最大连接数")
+    parser.add_argument("--retries", type=int, default=4, help="失败后的最大重试次数")
+    parser.add_argument("--backoff", type=float, default=1.0, help="指数退避的初始等待秒数")
+    parser.add_argument("--rate", type=float, default=8.0, help="初始请求速率（次/秒）")
+    parser.add_argument("--max-rate", type=float, default=30.0, help="自适应提速的上限（次/秒）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="PDF 检测进程数（默认 CPU 核数）")
+    parser.add_argument("--extract", action="store_true", help="检测时顺带抽取文本到 TXT 目录（每份 PDF 只解析一次）")
+    parser.add_argument("--timeout", type=float, default=300, help="--extract 时单个 PDF 的抽取超时（秒，0 表示不限）")
+    parser.add_argument("--metrics", help="运行指标输出路径（.prom 为 Prometheus 格式，其他为 JSON lines）")
+    parser.add_argument("--profile", help="cProfile 结果输出目录（每个检测进程一个 .prof 文件）")
+    args = parser.parse_args()
 
-# =====================================================
-# ✅ 新增部分：下载完成后自动检测PDF完整性
-# =====================================================
+    df = pd.read_excel(EXCEL_PATH)
+    print(f"📄 共 {len(df)} 条年报链接，开始下载 {YEAR} 年 PDF ...")
+    with Manifest(BASE_DIR) as manifest:
+        entries = download(df, args, manifest)
 
-print(f"\n🔍 正在检测 PDF 有效性，请稍候...")
+    # ========== 结构化状态日志 ==========
+    with open(STATUS_LOG, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    bad_files = [e for e in entries if e["validation"] == "invalid"]
+    with open(BAD_LOG, "w", encoding="utf-8") as f:
+        for e in bad_files:
+            f.write(f"{e['file']}\t{e['error']}\n")
 
-bad_files = []
-for pdf_file in tqdm(os.listdir(PDF_DIR), desc="检测PDF文件"):
-    if not pdf_file.endswith(".pdf"):
-        continue
-    src_path = os.path.join(PDF_DIR, pdf_file)
-    try:
-        with fitz.open(src_path) as doc:
-            if len(doc) == 0:
-                raise ValueError("空文件")
-        # 检测通过：移动到有效目录
-        os.rename(src_path, os.path.join(VALID_DIR, pdf_file))
-    except Exception as e:
-        bad_files.append((pdf_file, str(e)))
+    # ========== 下载结果统计 ==========
+    success = [e for e in entries if e["download"] in ("ok", "exists", "skipped")]
+    failed = [e for e in entries if e["download"] == "failed"]
+    invalid = [e for e in entries if e["download"] == "invalid"]
+    repeated = [e for e in entries if e["download"] == "duplicate"]
+    print(f"\n✅ 成功 {len(success)} 份 | ❌ 失败 {len(failed)} 份 | ⚠️ 非PDF {len(invalid)} 份 | "
+          f"🔁 重复条目 {len(repeated)} 条 | 总计 {len(df)}")
+    print(f"🔍 检测完成！有效PDF：{len(os.listdir(VALID_DIR))} 份 | 坏文件：{len(bad_files)} 份")
+    if args.extract:
+        extracted = sum(1 for e in entries if e["extract"] == "ok")
+        print(f"📝 同步抽取文本 {extracted} 份，保存至：{TXT_DIR}")
+    print(f"📁 状态日志已保存：{STATUS_LOG}")
+    print(f"📁 坏文件日志已保存：{BAD_LOG}")
+    print(f"📂 有效文件目录：{VALID_DIR}")
+    finish(args.metrics)
 
-# 记录坏文件日志
-bad_log_path = os.path.join(BASE_DIR, f"坏文件日志_{YEAR}.txt")
-with open(bad_log_path, "w", encoding="utf-8") as f:
-    for name, err in bad_files:
-        f.write(f"{name}\t{err}\n")
 
-print(f"\n✅ 检测完成！有效PDF：{len(os.listdir(VALID_DIR))} 份 | 坏文件：{len(bad_files)} 份")
-print(f"📁 坏文件日志已保存：{bad_log_path}")
-print(f"📂 有效文件目录：{VALID_DIR}")
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
 import os
-import fitz  # PyMuPDF
+import time
+import argparse
 from tqdm import tqdm
+from textmining.corpus import CorpusWriter, corpus_dir, document_stat, open_year
+from textmining.dedup import detect_year, store_signature
+from textmining.manifest import Manifest, doc_key, split_doc_name
+from textmining.metrics import finish, metrics, profile_main
+from textmining.pdf_extract import EXTRACTOR_VERSION, convert_many, summarize_throughput
+from textmining.position_index import store_pages
 
 # ======================
 # 路径配置
@@ -9,45 +16,121 @@ YEAR = 2018
 BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
 PDF_DIR = os.path.join(BASE_DIR, f"年报PDF_{YEAR}_有效")
 TXT_DIR = os.path.join(BASE_DIR, f"年报TXT_{YEAR}")
+CORPUS_DIR = corpus_dir(BASE_DIR, YEAR)  # --corpus：压缩分片语料库，代替逐公司 TXT
 os.makedirs(TXT_DIR, exist_ok=True)
 
-# ======================
-# PDF 转 TXT
-# ======================
-def pdf_to_txt(pdf_path, txt_path):
-    try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            page_text = page.get_text("text").strip()
-            if len(page_text) > 30:  # 跳过空页或图片页
-                text += page_text + "\n"
-        doc.close()
-
-        if text.strip():
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(text)
-            return True
-        else:
-            return False
-    except Exception as e:
-        print(f"❌ 转换失败: {pdf_path}, 错误: {e}")
-        return False
 
 # ======================
 # 批量执行转换
 # ======================
-pdf_files = [f for f in os.listdir(PDF_DIR) if f.endswith(".pdf")]
+def main():
+    parser = argparse.ArgumentParser(description=f"{YEAR} 年年报 PDF 转 TXT")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="并行进程数（默认 CPU 核数）")
+    parser.add_argument("--timeout", type=float, default=300, help="单个 PDF 的转换超时（秒，0 表示不限）")
+    parser.add_argument("--corpus", action="store_true", help="写入压缩分片语料库（语料库_{YEAR}/）而不是逐个 TXT 文件")
+    parser.add_argument("--no-dedup", action="store_true", help="不做重复/修订年报检测")
+    parser.add_argument("--metrics", help="运行指标输出路径（.prom 为 Prometheus 格式，其他为 JSON lines）")
+    parser.add_argument("--profile", help="cProfile 结果输出目录（每个工作进程一个 .prof 文件）")
+    args = parser.parse_args()
+    with profile_main(args.profile if args.workers == 1 else None, "03"):
+        run(args)
+    finish(args.metrics)
+
+
+def run(args):
+    pdf_files = sorted(f for f in os.listdir(PDF_DIR) if f.endswith(".pdf"))
+    manifest = Manifest(BASE_DIR)
+    corpus = CorpusWriter(CORPUS_DIR, YEAR) if args.corpus else None
+    stored_pages = manifest.page_breaks(YEAR) if corpus is not None else {}
+
+    jobs = []
+    pdf_hashes = {}
+    plan_start = time.perf_counter()
+    for pdf_file in pdf_files:
+        pdf_path = os.path.join(PDF_DIR, pdf_file)
+        txt_name = pdf_file.replace(".pdf", ".txt")
+        txt_path = os.path.join(TXT_DIR, txt_name)
 
-for pdf_file in tqdm(pdf_files, desc=f"PDF 转 TXT ({YEAR})"):
-    pdf_path = os.path.join(PDF_DIR, pdf_file)
-    txt_name = pdf_file.replace(".pdf", ".txt")
-    txt_path = os.path.join(TXT_DIR, txt_name)
+        key = doc_key(pdf_file)
+        record = manifest.get_doc(pdf_file, YEAR)
+        pdf_stat, pdf_sha256 = manifest.fingerprint(pdf_path, record, "pdf")
+        pdf_hashes[pdf_path] = pdf_sha256
+        manifest.update_doc(pdf_file, YEAR, commit=False, pdf_stat=pdf_stat, pdf_sha256=pdf_sha256)
 
-    if not os.path.exists(txt_path):  # 防止重复转换
-        success = pdf_to_txt(pdf_path, txt_path)
-        if not success:
+        if corpus is not None:
+            if key in corpus.index and record.get("txt_stat") == document_stat(corpus.ref(key)) \
+                    and record.get("txt_source_pdf") == pdf_sha256 and record.get("extractor_version") == EXTRACTOR_VERSION:
+                continue
+            if os.path.exists(txt_path) and record.get("txt_source_pdf") in (None, pdf_sha256) \
+                    and record.get("extractor_version") in (None, EXTRACTOR_VERSION):
+                # 已有且仍然有效的 TXT：直接压缩导入，不重新抽取；抽取时记录的页边界一并带入
+                page_stat, breaks = stored_pages.get(txt_name, (None, None))
+                corpus.add_txt(key, split_doc_name(pdf_file)[1], txt_path,
+                               breaks if page_stat == document_stat(txt_path) else None)
+                ref = corpus.ref(key)
+                manifest.update_doc(pdf_file, YEAR, commit=False, txt_stat=document_stat(ref), txt_sha256=ref.sha256,
+                                    txt_source_pdf=pdf_sha256, extractor_version=EXTRACTOR_VERSION)
+                continue
+            jobs.append((pdf_path, None))
+            continue
+
+        # 防止重复转换：TXT 已存在且来源 PDF 与抽取器版本都未变时跳过
+        if os.path.exists(txt_path):
+            if not record.get("txt_source_pdf"):
+                # 清单启用前已转换的文件：直接登记，不重新抽取
+                txt_stat, txt_sha256 = manifest.fingerprint(txt_path, record, "txt")
+                manifest.update_doc(pdf_file, YEAR, commit=False, txt_stat=txt_stat, txt_sha256=txt_sha256,
+                                    txt_source_pdf=pdf_sha256, extractor_version=EXTRACTOR_VERSION)
+                continue
+            if record["txt_source_pdf"] == pdf_sha256 and record.get("extractor_version") == EXTRACTOR_VERSION:
+                continue
+        jobs.append((pdf_path, txt_path))
+    manifest.commit()
+    metrics.observe("phase", time.perf_counter() - plan_start, stage="convert", phase="plan")
+
+    start = time.perf_counter()
+    all_stats = []
+    for stats in tqdm(convert_many(jobs, args.workers, args.timeout or None, args.profile),
+                      total=len(jobs), desc=f"PDF 转 TXT ({YEAR})"):
+        all_stats.append(stats)
+        pdf_file = os.path.basename(stats["pdf"])
+        metrics.record("convert", pdf_file, status=stats["status"], seconds=stats["seconds"], pages=stats["pages"],
+                       bytes=stats["bytes_in"], bytes_out=stats["bytes_out"], error=stats["error"])
+        if stats["status"] == "ok" and corpus is not None:
+            key = doc_key(pdf_file)
+            corpus.add_frame(key, split_doc_name(pdf_file)[1], *stats["frame"])
+            ref = corpus.ref(key)
+            manifest.update_doc(pdf_file, YEAR, commit=False, txt_stat=document_stat(ref), txt_sha256=ref.sha256,
+                                txt_source_pdf=pdf_hashes[stats["pdf"]], extractor_version=EXTRACTOR_VERSION)
+            store_signature(manifest, YEAR, pdf_file.replace(".pdf", ".txt"), document_stat(ref), stats)
+        elif stats["status"] == "ok":
+            txt_path = os.path.join(TXT_DIR, pdf_file.replace(".pdf", ".txt"))
+            txt_stat, txt_sha256 = manifest.fingerprint(txt_path, {}, "txt")
+            store_signature(manifest, YEAR, pdf_file.replace(".pdf", ".txt"), txt_stat, stats, commit=False)
+            store_pages(manifest, YEAR, pdf_file.replace(".pdf", ".txt"), txt_stat, stats)
+            manifest.update_doc(pdf_file, YEAR, txt_stat=txt_stat, txt_sha256=txt_sha256,
+                                txt_source_pdf=pdf_hashes[stats["pdf"]], extractor_version=EXTRACTOR_VERSION)
+        if stats["status"] == "empty":
             print(f"⚠️ 跳过空文件: {pdf_file}")
+        elif stats["status"] == "timeout":
+            print(f"⏳ 转换超时，已跳过: {pdf_file}")
+        elif stats["status"] == "failed":
+            print(f"❌ 转换失败: {stats['pdf']}, 错误: {stats['error']}")
+
+    if corpus is not None:
+        corpus.close()
+    if not args.no_dedup:
+        # 抽取时已算好签名，这里只做 LSH 检测；结果写入清单，04 / 05 跳过重复的年报
+        with metrics.timer("phase", stage="convert", phase="dedup"):
+            detect_year(open_year(BASE_DIR, YEAR), manifest, YEAR)
+    manifest.close()
+
+    summary = summarize_throughput(all_stats, time.perf_counter() - start)
+    print(f"✅ 已完成 {YEAR} 年所有 PDF → TXT 转换！（本次转换 {summary['files']} 个文件）")
+    print(f"⚡ 吞吐：{summary['pages_per_sec']:.1f} 页/秒 | {summary['mb_per_sec']:.2f} MB/秒 "
+          f"（共 {summary['pages']} 页，{summary['mb']:.1f} MB，用时 {summary['seconds']:.1f} 秒）")
+    print(f"📁 输出目录: {CORPUS_DIR if corpus is not None else TXT_DIR}")
+
 
-print(f"✅ 已完成 {YEAR} 年所有 PDF → TXT 转换！")
-print(f"📁 输出目录: {TXT_DIR}")
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,188 @@
 import os
-import re
-import jieba
-import pandas as pd
+import argparse
 from tqdm import tqdm
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from textmining.analysis import (analyze_document, build_year_tables, counts_are_fresh,
+                                 init_worker, make_task, save_year_outputs)
+from textmining.corpus import open_year
+from textmining.companies import load_company_index
+from textmining.crawler import links_dir, parse_years
+from textmining.dedup import detect_year
+from textmining.keywords import dictionary
+from textmining.manifest import Manifest, doc_key, split_doc_name
+from textmining.metrics import finish, metrics, profile_main, profiled
+from textmining.panel import build_panel, panel_path, save_panel
+from textmining.position_index import index_dir, refresh_index
+from textmining.text_stream import DEFAULT_CHUNK_SIZE
+from textmining.token_cache import TokenCache
 
 # ===== 参数配置 =====
 YEAR = 2021
 BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
-TXT_DIR = os.path.join(BASE_DIR, f"年报TXT_{YEAR}")
-OUTPUT_DIR = os.path.join(BASE_DIR, f"分析结果_{YEAR}")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-OUTPUT_PATH = os.path.join(OUTPUT_DIR, f"{YEAR}_年报词频统计.xlsx")
-
-# ===== 定义关键词体系 =====
-keyword_groups = {
-    "区块链相关": [
-        "区块链", "智能合约", "去中心化",
-        "分布式账本", "加密存证", "溯源系统",
-        "数据安全", "可信计算", "加密算法"
-    ],
-
-    "数字化转型": [
-        "数字化", "数智化", "信息化", "智能化",
-        "大数据", "云计算", "人工智能", "物联网"
-    ],
-
-    "供应链治理": [
-        "供应链", "上游", "下游", "供应商",
-        "物流", "协同", "产业链", "链主企业"
-    ],
-
-    "信用与信任": [
-        "信用", "信任", "合规", "透明",
-        "可信", "风险控制", "安全", "防篡改"
-    ]
-}
-
-
-# ===== 统计函数 =====
-def count_keywords(text, keyword_groups):
-    text = re.sub(r"\s+", "", text)
-    counts = {}
-    for group, words in keyword_groups.items():
-        total = 0
-        for w in words:
-            total += text.count(w)
-        counts[group] = total
-    counts["总字数"] = len(text)
-    return counts
+
+
+def output_dir(year):
+    return os.path.join(BASE_DIR, f"分析结果_{year}")
+
+
+def token_cache_dir(year):
+    return os.path.join(BASE_DIR, f"分词缓存_{year}")
+
+
+# ===== 关键词体系（关键词词典.json，加载见 textmining/keywords.py） =====
+# 关键词组与信任词编译为同一个匹配器（dictionary.matcher），每篇年报只扫描一遍
+
 
 # ===== 批量遍历TXT文件 =====
-records = []
-trust_indices = []
-
-txt_files = [f for f in os.listdir(TXT_DIR) if f.endswith(".txt")]
-
-trust_words = ["可信", "透明", "追溯", "信任", "验证", "共享", "安全", "隐私", "防篡改", "共识"]
-
-for txt_file in tqdm(txt_files, desc=f"统计{YEAR}年年报关键词"):
-    try:
-        company_code, company_name = txt_file.replace(".txt", "").split("_", 1)
-        txt_path = os.path.join(TXT_DIR, txt_file)
-
-        with open(txt_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
-
-        # ---- 1. 关键词统计 ----
-        result = count_keywords(text, keyword_groups)
-        result["公司代码"] = company_code
-        result["公司简称"] = company_name
-        records.append(result)
-
-        # ---- 2. 信任指数计算 ----
-        words = jieba.lcut(text)
-        word_count = Counter(words)
-        total_words = len(words)
-        trust_sum = sum(word_count[w] for w in trust_words if w in word_count)
-        trust_index = trust_sum / total_words if total_words > 0 else 0
-        trust_indices.append({
-            "公司代码": company_code,
-            "公司简称": company_name,
-            "Trust_Index": trust_index
-        })
-
-    except Exception as e:
-        print(f"⚠️ 读取失败: {txt_file}，错误: {e}")
-
-# ===== 保存结果 =====
-df = pd.DataFrame(records)
-df = df[["公司代码", "公司简称"] + list(keyword_groups.keys()) + ["总字数"]]
-df.to_excel(OUTPUT_PATH, index=False)
-
-trust_df = pd.DataFrame(trust_indices)
-trust_df.to_excel(os.path.join(OUTPUT_DIR, f"数据可信度指数_{YEAR}.xlsx"), index=False)
-
-print(f"✅ 已完成 {YEAR} 年年报关键词词频统计！结果保存至：{OUTPUT_PATH}")
-print(f"✅ 数据可信度指数已生成！保存至：数据可信度指数_{YEAR}.xlsx")
+def iter_results(tasks, workers, init_args, profile_dir=None):
+    if not tasks:
+        return
+    if workers <= 1:
+        init_worker(*init_args)
+        for task in tasks:
+            yield analyze_document(task)
+        return
+    # map 按提交顺序返回结果，输出顺序与串行运行一致
+    chunksize = max(1, min(16, len(tasks) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args) as executor:
+        yield from executor.map(profiled(analyze_document, profile_dir, "count"), tasks, chunksize=chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"{YEAR} 年年报关键词词频统计")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数（默认 1，即串行）")
+    parser.add_argument("--force", action="store_true", help="忽略清单缓存，全部重新统计")
+    parser.add_argument("--keep-duplicates", action="store_true", help="不检测重复/修订年报，全部统计")
+    parser.add_argument("--resegment", action="store_true",
+                        help="关键词词典变化后，分词缓存不是按当前词典分词的年报重新分词（默认拼接计数，不重新分词）")
+    parser.add_argument("--compact-cache", action="store_true",
+                        help="统计后压缩分词缓存，回收重新分词后作废的旧片段（不要与打分服务同时运行）")
+    parser.add_argument("--no-index", action="store_true", help="不更新关键词位置索引（keyword_search.py 使用）")
+    parser.add_argument("--stream", action="store_true", help="流式处理超大年报，限制单篇内存占用")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="流式模式每块字符数")
+    parser.add_argument("--years", default=str(YEAR), help="年份或年份区间，如 2021 或 2018-2025（多年共用一个进程池）")
+    parser.add_argument("--panel", nargs="?", const="", default=None,
+                        help="输出公司×年份面板数据（Parquet），可指定路径；多年时默认输出")
+    parser.add_argument("--xlsx", action="store_true", help="面板数据另存一份 xlsx")
+    parser.add_argument("--metrics", help="运行指标输出路径（.prom 为 Prometheus 格式，其他为 JSON lines）")
+    parser.add_argument("--profile", help="cProfile 结果输出目录（每个工作进程一个 .prof 文件）")
+    args = parser.parse_args()
+    with profile_main(args.profile if args.workers <= 1 else None, "04"):
+        run(args)
+    finish(args.metrics)
+
+
+# ===== 每年：确定需要重新统计的年报 =====
+def plan_year(year, manifest, force, resegment=False, dedup=True):
+    # 已建语料库（03 --corpus）时读语料库，否则读 TXT 目录；按文件名（公司代码）排序，保证输出顺序确定
+    docs = open_year(BASE_DIR, year)
+    if not os.path.isdir(docs.path):
+        # --years 区间中尚未转换的年份：跳过，不影响其余年份
+        print(f"⚠️ {year} 年没有 年报TXT_{year} 或 语料库_{year} 目录，跳过该年。")
+        return None, {}, []
+    # 重复/修订年报只统计保留的一份（签名通常已在 03 抽取时算好）
+    duplicates = detect_year(docs, manifest, year) if dedup else {}
+    txt_files = [f for f in docs.names() if f not in duplicates]
+    token_cache = TokenCache(token_cache_dir(year))
+    entries = {}
+    todo = []
+    for txt_file in txt_files:
+        try:
+            company_code, company_name = split_doc_name(txt_file)
+        except ValueError as e:
+            print(f"⚠️ 读取失败: {txt_file}，错误: {e}")
+            continue
+        record = manifest.get_doc(txt_file, year)
+        txt_path = docs.ref(txt_file)
+        if not force and counts_are_fresh(record, txt_path, dictionary.version):
+            entries[txt_file] = (company_code, company_name, record["counts"], record["counts_txt"])
+            metrics.inc("documents", stage="count", status="cached")
+            continue
+        segmenter = dictionary.segmenter_version if resegment else None
+        task = make_task(txt_path, doc_key(txt_file), record, manifest, token_cache, dictionary.matcher, segmenter)
+        todo.append((txt_file, task))
+    n_cached = sum(1 for _, (_, cached) in todo if cached is not None)
+    print(f"📋 {year} 年共 {len(txt_files)} 份年报，需重新统计 {len(todo)} 份（其中 {n_cached} 份复用分词缓存），其余沿用清单缓存。")
+    # 按存储位置处理：语料库模式下各分片近似顺序读取
+    todo.sort(key=lambda item: docs.position(item[0]))
+    return token_cache, entries, todo
+
+
+def run(args):
+    years = parse_years(args.years)
+    manifest = Manifest(BASE_DIR)
+    plans = {year: plan_year(year, manifest, args.force, args.resegment, not args.keep_duplicates) for year in years}
+
+    panel_out = None
+    if args.panel is not None or len(years) > 1:
+        panel_out = args.panel or panel_path(BASE_DIR, years)
+    with ThreadPoolExecutor(max_workers=1) as io_pool:
+        # 行业信息只在面板模式下需要：与统计并行加载，全部年份共用一份
+        companies = io_pool.submit(load_company_index, links_dir(BASE_DIR)) if panel_out else None
+
+        # 所有年份的任务进入同一个进程池：jieba 词典与匹配器每个进程只加载一次
+        todo = [(year, txt_file, task) for year in years for txt_file, task in plans[year][2]]
+        init_args = (dictionary.matcher, dictionary.trust_words, args.chunk_size if args.stream else None)
+        results = iter_results([task for _, _, task in todo], args.workers, init_args, args.profile)
+        label = f"{years[0]}" if len(years) == 1 else f"{years[0]}–{years[-1]}"
+        for (year, txt_file, (_, cached)), r in tqdm(zip(todo, results), total=len(todo), desc=f"统计{label}年年报关键词"):
+            metrics.record("count", txt_file, status="failed" if r["error"] else "ok", seconds=r["seconds"],
+                           chars=r["counts"]["总字数"] if r["counts"] else 0, tokens=r["tokens"],
+                           token_cache=cached is not None, error=r["error"], year=year, **r["timings"])
+            if r["error"] is not None:
+                print(f"⚠️ 读取失败: {txt_file}，错误: {r['error']}")
+                continue
+            token_cache, entries, _ = plans[year]
+            company_code, company_name = split_doc_name(txt_file)
+            entries[txt_file] = (company_code, company_name, r["counts"], r["txt_sha256"])
+            if r["encoded"] is not None:
+                token_cache.put(doc_key(txt_file), r["txt_sha256"], *r["encoded"], segmenter=dictionary.segmenter_version)
+            manifest.update_doc(txt_file, year, commit=False,
+                                txt_stat=r["txt_stat"], txt_sha256=r["txt_sha256"], counts_txt=r["txt_sha256"],
+                                dict_hash=dictionary.version, counts=r["counts"])
+        for year, (token_cache, _, _) in plans.items():
+            if token_cache is None:
+                continue
+            if args.compact_cache:
+                with metrics.timer("phase", stage="count", phase="compact"):
+                    reclaimed = token_cache.compact()
+                print(f"🗜️ {year} 年分词缓存已压缩，回收 {reclaimed} 个词 ID（{reclaimed * 4 / 1024 / 1024:.1f} MB）")
+            elif token_cache.dead_fraction() > 0.5:
+                print(f"💡 {year} 年分词缓存中作废片段占 {token_cache.dead_fraction():.0%}，可加 --compact-cache 回收空间")
+            token_cache.close()
+        # ===== 关键词位置索引：分词缓存有变化时重建，keyword_search.py 查询上下文与章节计数 =====
+        if not args.no_index:
+            for year in years:
+                if plans[year][0] is None:
+                    continue
+                with metrics.timer("phase", stage="count", phase="index"):
+                    refresh_index(index_dir(BASE_DIR, year), open_year(BASE_DIR, year), manifest, year, plans[year][0])
+        manifest.close()
+
+        # ===== 构建文档-词项矩阵并保存结果 =====
+        year_tables = {}
+        for year in years:
+            entries = plans[year][1]
+            if not entries:
+                print(f"⚠️ {year} 年没有可统计的年报，跳过。")
+                continue
+            with metrics.timer("phase", stage="count", phase="tables"):
+                tables = build_year_tables([entries[f] for f in sorted(entries)], dictionary.matcher,
+                                           dictionary.keyword_groups, dictionary.trust_words)
+            with metrics.timer("phase", stage="count", phase="save"):
+                paths = save_year_outputs(output_dir(year), year, *tables)
+            year_tables[year] = tables[:2]
+            print(f"✅ 已完成 {year} 年年报关键词词频统计！结果保存至：{paths['counts']}")
+            print(f"✅ 数据可信度指数已生成！保存至：数据可信度指数_{year}.xlsx")
+
+        # ===== 公司×年份面板 =====
+        if panel_out and year_tables:
+            with metrics.timer("phase", stage="count", phase="panel"):
+                panel = build_panel(year_tables, companies.result())
+                saved = save_panel(panel, panel_out, xlsx=args.xlsx)
+            print(f"📊 面板数据：{panel['公司代码'].nunique()} 家公司 × {len(year_tables)} 年，共 {len(panel)} 行，"
+                  f"保存至：{'、'.join(saved)}")
+
+
+if __name__ == "__main__":
+    main()
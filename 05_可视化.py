@@ -1,153 +1,185 @@
 import os
-import pandas as pd
+import time
+import argparse
 from collections import Counter
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
 from tqdm import tqdm
 import jieba
+from textmining.corpus import document_fingerprint, document_sha256, document_stat, open_year, read_document
+from textmining.crawler import parse_years
+from textmining.dtm import DocTermMatrix
+from textmining.keywords import dictionary
+from textmining.manifest import Manifest, doc_key, split_doc_name
+from textmining.metrics import finish, metrics, profile_main
+from textmining.render import WORDCLOUD_FONT, init_renderer, load_trust, load_year_counts, render_many, render_year
+from textmining.text_stream import DEFAULT_CHUNK_SIZE, iter_segmentable, iter_text_chunks
+from textmining.token_cache import TermCounter, TokenCache, count_encoded, count_terms, encode_tokens
 
 # ========== 路径配置 ==========
 YEAR = 2021
 BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
-TXT_DIR = os.path.join(BASE_DIR, f"年报TXT_{YEAR}")
-OUTPUT_DIR = os.path.join(BASE_DIR, f"分析结果_{YEAR}")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# ========== 自定义关键词体系 ==========
-
-keyword_groups = {
-    "区块链相关": [
-        "区块链", "智能合约", "去中心化",
-        "分布式账本", "加密存证", "溯源系统",
-        "数据安全", "可信计算", "加密算法"
-    ],
-
-    "数字化转型": [
-        "数字化", "数智化", "信息化", "智能化",
-        "大数据", "云计算", "人工智能", "物联网"
-    ],
-
-    "供应链治理": [
-        "供应链", "上游", "下游", "供应商",
-        "物流", "协同", "产业链", "链主企业"
-    ],
-
-    "信用与信任": [
-        "信用", "信任", "合规", "透明",
-        "可信", "风险控制", "安全", "防篡改"
-    ]
-}
-
-# 扁平化关键词列表
-keywords = [w for group in keyword_groups.values() for w in group]
-
-# ========== 统计 ==========
-all_counts = Counter()
-txt_files = [f for f in os.listdir(TXT_DIR) if f.endswith(".txt")]
-
-for txt_file in tqdm(txt_files, desc=f"统计关键词 ({YEAR})"):
-    txt_path = os.path.join(TXT_DIR, txt_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年报关键词可视化")
+    parser.add_argument("--year", type=int, default=YEAR, help="年份（默认使用脚本中的 YEAR）")
+    parser.add_argument("--base-dir", default=BASE_DIR, help="数据根目录（默认使用脚本中的 BASE_DIR）")
+    parser.add_argument("--stream", action="store_true", help="需要重新分词时按块流式处理，限制单篇内存占用")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="流式模式每块字符数")
+    parser.add_argument("--batch", action="store_true",
+                        help="批量无界面绘图：直接读取 04 生成的分词矩阵与可信度指数表，不再分词（配合 --years）")
+    parser.add_argument("--years", default=None, help="批量模式的年份、年份区间或列表，如 2018-2025、2019,2021（默认 --year）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="批量模式并行绘图的进程数")
+    parser.add_argument("--dpi", type=int, default=300, help="图片分辨率")
+    parser.add_argument("--font", default=WORDCLOUD_FONT, help="词云使用的中文字体文件")
+    parser.add_argument("--force", action="store_true", help="忽略图表指纹，全部重新绘制")
+    parser.add_argument("--metrics", help="运行指标输出路径（.prom 为 Prometheus 格式，其他为 JSON lines）")
+    parser.add_argument("--profile", help="cProfile 结果输出目录")
+    args = parser.parse_args()
+    # 绘图进程池在 spawn 启动方式（macOS 默认）下会重新导入本脚本：所有逻辑都在 main() 中，导入时不执行
+    with profile_main(args.profile, "05"):
+        if args.batch:
+            run_batch(args)
+        else:
+            run(args)
+    finish(args.metrics)
+
+
+# ========== 批量模式：多年份并行绘图 ==========
+def run_batch(args):
+    jobs = []
+    for year in parse_years(args.years or str(args.year)):
+        output_dir = os.path.join(args.base_dir, f"分析结果_{year}")
+        counts = load_year_counts(output_dir, year)
+        if counts is None:
+            print(f"⚠️ {year} 年缺少分词矩阵与词频统计表，请先运行 04_词频统计.py，已跳过。")
+            continue
+        jobs.append({"year": year, "output_dir": output_dir, "counts": counts,
+                     "trust": load_trust(output_dir, year), "dpi": args.dpi, "force": args.force})
+    for result in tqdm(render_many(jobs, args.workers, args.font), total=len(jobs), desc="批量绘图"):
+        metrics.record("visualize", str(result["year"]), seconds=result["seconds"],
+                       rendered=len(result["rendered"]), skipped=len(result["skipped"]))
+        print(f"✅ {result['year']} 年：绘制 {len(result['rendered'])} 张，未变化跳过 {len(result['skipped'])} 张"
+              + ("" if result["trust"] else "（未找到可信度指数表）"))
+
+
+# 依次尝试：清单中 04_词频统计.py 缓存的分词计数 → 分词缓存中的词 ID → 重新分词
+def cached_token_counts(manifest, token_cache, term_plan, year, txt_file, txt_path):
     try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            text = f.read()
-        words = jieba.lcut(text)
-        word_count = Counter(words)
-        for kw in keywords:
-            all_counts[kw] += word_count[kw]
-    except Exception as e:
-        print(f"❌ 文件读取失败: {txt_file}, 错误: {e}")
-
-# ========== 标准化 ==========
-total = sum(all_counts.values())
-norm_freq = {k: v / total for k, v in all_counts.items()}
-
-df = pd.DataFrame({
-    "关键词": list(norm_freq.keys()),
-    "标准化频率": list(norm_freq.values()),
-    "原始计数": [all_counts[k] for k in norm_freq.keys()]
-}).sort_values(by="标准化频率", ascending=False)
-
-df.to_excel(os.path.join(OUTPUT_DIR, f"词频统计_{YEAR}.xlsx"), index=False)
-
-# ===== 字体支持 =====
-plt.rcParams['axes.unicode_minus'] = False
-plt.rcParams['font.sans-serif'] = ['Heiti TC', 'SimHei']
-
-# ========== 可视化1：关键词柱状图 ==========
-words = df["关键词"]
-freqs = df["原始计数"]
-
-plt.figure(figsize=(13, 7))
-colors = [
-    "#E24A33" if any(x in w for x in ["链", "加密", "可信", "共识"]) else "#4A90E2"
-    for w in words
-]
-bars = plt.bar(words, freqs, color=colors, edgecolor="black", alpha=0.85)
-
-plt.title(f"{YEAR} 年企业年报高频词统计\n（区块链 / 加密算法 / 可信计算相关词汇高亮）", fontsize=18, fontweight="bold", pad=20)
-plt.xlabel("关键词", fontsize=14)
-plt.ylabel("出现次数", fontsize=14)
-plt.xticks(rotation=45, ha='right', fontsize=12)
-plt.yticks(fontsize=12)
-plt.grid(axis='y', linestyle='--', alpha=0.5)
-
-for bar in bars:
-    plt.text(bar.get_x() + bar.get_width()/2,
-             bar.get_height() + 1,
-             f"{int(bar.get_height())}",
-             ha='center', va='bottom', fontsize=10)
-
-plt.tight_layout()
-plt.savefig(os.path.join(OUTPUT_DIR, f"词频统计_{YEAR}.png"), dpi=300, bbox_inches='tight')
-plt.show()
-
-# ========== 可视化2：词云 ==========
-wc = WordCloud(
-    font_path="/System/Library/Fonts/STHeiti Medium.ttc",
-    width=800, height=600,
-    background_color="white",
-    colormap="viridis"
-)
-wc.generate_from_frequencies(all_counts)
-wc.to_file(os.path.join(OUTPUT_DIR, f"词云_{YEAR}.png"))
-
-print(f"✅ {YEAR} 年关键词分析完成！")
-print(f"📊 结果保存路径: {OUTPUT_DIR}")
-
-# ========== 可视化3 & 4：可信度指数 ==========
-trust_path = os.path.join(OUTPUT_DIR, f"数据可信度指数_{YEAR}.xlsx")
-if os.path.exists(trust_path):
-    trust_df = pd.read_excel(trust_path)
-    trust_df = trust_df[trust_df["Trust_Index"] >= 0]
-
-    # 分布图
-    plt.figure(figsize=(10, 6))
-    plt.hist(trust_df["Trust_Index"], bins=30, color="#6EC6CA", edgecolor="black", alpha=0.8)
-    plt.title(f"{YEAR} 年企业年报“数据可信度指数”分布", fontsize=18, fontweight="bold", pad=20)
-    plt.xlabel("Trust_Index（可信度指数）", fontsize=14)
-    plt.ylabel("企业数量", fontsize=14)
-    plt.grid(axis='y', linestyle='--', alpha=0.5)
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, f"可信度指数分布_{YEAR}.png"), dpi=300, bbox_inches='tight')
-    plt.show()
-
-    # Top 20
-    top20 = trust_df.sort_values(by="Trust_Index", ascending=False).head(20)
-    plt.figure(figsize=(12, 8))
-    bars = plt.barh(top20["公司简称"], top20["Trust_Index"], color="#FFB74D", alpha=0.85)
-    plt.gca().invert_yaxis()
-    plt.title(f"{YEAR} 年“可信度指数”最高的20家企业", fontsize=18, fontweight="bold", pad=20)
-    plt.xlabel("Trust_Index", fontsize=14)
-    plt.ylabel("公司简称", fontsize=14)
-    for bar in bars:
-        plt.text(bar.get_width() + 0.0005,
-                 bar.get_y() + bar.get_height()/2,
-                 f"{bar.get_width():.4f}",
-                 va='center', fontsize=10)
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, f"可信度前20企业_{YEAR}.png"), dpi=300, bbox_inches='tight')
-    plt.show()
-
-    print(f"✅ 可信度指数分布与Top20图已生成！")
-else:
-    print(f"⚠️ 未找到 {trust_path}，跳过可信度可视化。")
+        key = doc_key(txt_file)
+    except ValueError:
+        return None
+    record = manifest.get_doc(txt_file, year)
+    cached = (record.get("counts") or {}).get("分词计数")
+    if (cached and record.get("txt_stat") == document_stat(txt_path)
+            and record.get("counts_txt") == record.get("txt_sha256")
+            and record.get("dict_hash") == dictionary.version
+            and all(kw in cached for kw in dictionary.group_keywords)):
+        return cached
+    _, txt_sha256 = document_fingerprint(txt_path, manifest, record)
+    if token_cache.has(key, txt_sha256):
+        # 词典新增的关键词在缓存中可能被切成几个词：按相邻词拼接计数，不必重新分词
+        return count_terms(token_cache.get(key), term_plan)
+    return None
+
+
+def load_token_dtm(manifest, docs, txt_files, output_dir, year):
+    # 04_词频统计.py 生成的分词矩阵：须覆盖当前全部 TXT、版本一致且包含全部关键词
+    path = os.path.join(output_dir, f"分词矩阵_{year}.npz")
+    if not os.path.exists(path):
+        return None
+    dtm = DocTermMatrix.load(path)
+    expected = {}
+    for txt_file in txt_files:
+        if "_" not in txt_file:
+            return None
+        company_code, _ = split_doc_name(txt_file)
+        _, expected[company_code] = document_fingerprint(docs.ref(txt_file), manifest, manifest.get_doc(txt_file, year))
+    if dict(zip(dtm.docs, dtm.versions)) != expected \
+            or any(kw not in dtm.term_index for kw in dictionary.group_keywords):
+        return None
+    return dtm
+
+
+# ========== 单年：统计并绘图 ==========
+def run(args):
+    year, base_dir = args.year, args.base_dir
+    output_dir = os.path.join(base_dir, f"分析结果_{year}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # ========== 自定义关键词体系（关键词词典.json，加载见 textmining/keywords.py） ==========
+    # 扁平化关键词列表为 dictionary.group_keywords；关键词注册为 jieba 自定义词，"分布式账本" 等多字词整体切出
+    dictionary.register_jieba()
+
+    # ========== 统计 ==========
+    all_counts = Counter()
+    docs = open_year(base_dir, year)  # 语料库或 TXT 目录
+    manifest = Manifest(base_dir)
+    # 03 / 04 判定为重复/修订的年报不计入
+    duplicates = manifest.duplicates(year)
+    txt_files = [f for f in docs.names() if f not in duplicates]
+
+    phase_start = time.perf_counter()
+    token_cache = TokenCache(os.path.join(base_dir, f"分词缓存_{year}"))
+    token_dtm = load_token_dtm(manifest, docs, txt_files, output_dir, year)
+    term_plan = token_cache.term_plan(dictionary.group_keywords)
+    pending = txt_files
+    if token_dtm is not None:
+        # 矩阵有效：各关键词总频次即矩阵列和，无需逐篇读取
+        column_totals = token_dtm.column_totals(dictionary.group_keywords)
+        for kw in dictionary.group_keywords:
+            all_counts[kw] += column_totals[kw]
+        metrics.inc("documents", len(txt_files), stage="visualize", source="dtm")
+        pending = []
+    for txt_file in tqdm(pending, desc=f"统计关键词 ({year})"):
+        doc_start = time.perf_counter()
+        txt_path = docs.ref(txt_file)
+        cached = cached_token_counts(manifest, token_cache, term_plan, year, txt_file, txt_path)
+        if cached is not None:
+            for kw in dictionary.group_keywords:
+                all_counts[kw] += cached[kw]
+            metrics.inc("documents", stage="visualize", source="cached")
+            continue
+        try:
+            if args.stream:
+                # 流式：逐块分词计数，不保留整篇文本与分词列表（也不写分词缓存）
+                term_counter = TermCounter(dictionary.group_keywords)
+                for piece in iter_segmentable(iter_text_chunks(txt_path, args.chunk_size)):
+                    term_counter.feed(jieba.cut(piece))
+                all_counts.update(term_counter.counts)
+                metrics.record("visualize", txt_file, source="stream", seconds=time.perf_counter() - doc_start)
+                continue
+            text = read_document(txt_path)
+            local_vocab, ids = encode_tokens(jieba.cut(text))
+            all_counts.update(count_encoded(local_vocab, ids, dictionary.group_keywords))
+            # 写入分词缓存，之后的统计无需再次分词
+            if "_" in txt_file:
+                token_cache.put(doc_key(txt_file), document_sha256(txt_path), local_vocab, ids,
+                                segmenter=dictionary.segmenter_version)
+            metrics.record("visualize", txt_file, source="jieba", seconds=time.perf_counter() - doc_start,
+                           chars=len(text), tokens=len(ids))
+        except Exception as e:
+            print(f"❌ 文件读取失败: {txt_file}, 错误: {e}")
+            metrics.record("visualize", txt_file, status="failed", error=str(e))
+    token_cache.close()
+    manifest.close()
+    metrics.observe("phase", time.perf_counter() - phase_start, stage="visualize", phase="count")
+
+    # ========== 标准化与可视化（绘图见 textmining/render.py） ==========
+    trust_df = load_trust(output_dir, year)
+    init_renderer(args.font)
+    result = render_year({"year": year, "output_dir": output_dir, "counts": dict(all_counts),
+                          "trust": trust_df, "dpi": args.dpi, "force": args.force})
+    metrics.observe("phase", result["seconds"], stage="visualize", phase="render")
+
+    print(f"✅ {year} 年关键词分析完成！")
+    print(f"📊 结果保存路径: {output_dir}")
+    if result["skipped"]:
+        print(f"⏭️ 输入未变化，跳过 {len(result['skipped'])} 张图表：{'、'.join(result['skipped'])}")
+    if trust_df is not None:
+        print(f"✅ 可信度指数分布与Top20图已生成！")
+    else:
+        print(f"⚠️ 未找到 {os.path.join(output_dir, f'数据可信度指数_{year}.xlsx')}，跳过可信度可视化。")
+
+
+if __name__ == "__main__":
+    main()
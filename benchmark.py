@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import Counter
+import jieba
+from textmining.analysis import analyze_document, build_year_tables, count_keywords, init_worker
+from textmining.downloader import download_all
+from textmining.keywords import dictionary
+from textmining.manifest import split_doc_name
+from textmining.pdf_extract import convert_many, pdf_to_txt
+from textmining.synthetic import generate_corpus
+from textmining.token_cache import TokenCache, count_encoded, count_terms, encode_tokens
+
+# ===== 基准测试：合成语料 + 各阶段分别计时，结果输出为 JSON =====
+# 同一组参数（篇数、篇幅、关键词密度、随机种子）生成的语料相同，不同版本的代码之间可直接对比。
+
+YEAR = 2000  # 合成语料使用的年份
+STAGES = ["pdf_to_txt", "count_keywords", "jieba_trust_index", "analyze_document", "aggregate", "download"]
+MB = 1024 * 1024
+
+
+def timed(fn, repeat):
+    # 重复 repeat 次取最短用时，减少偶发干扰
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, out
+
+
+def result(stage, docs, nbytes, seconds, **extra):
+    seconds = max(seconds, 1e-9)
+    entry = {
+        "stage": stage,
+        "docs": docs,
+        "mb": nbytes / MB,
+        "seconds": seconds,
+        "docs_per_sec": docs / seconds,
+        "mb_per_sec": nbytes / MB / seconds,
+    }
+    entry.update(extra)
+    return entry
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ========== 各阶段 ==========
+def bench_pdf_to_txt(docs, work_dir, args):
+    out_dir = os.path.join(work_dir, "bench_txt")
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(d["pdf"], os.path.join(out_dir, d["name"] + ".txt")) for d in docs]
+    nbytes = sum(d["pdf_bytes"] for d in docs)
+    pages = sum(d["pages"] for d in docs)
+
+    seconds, _ = timed(lambda: [pdf_to_txt(p, t) for p, t in jobs], args.repeat)
+    results = [result("pdf_to_txt", len(docs), nbytes, seconds, pages_per_sec=pages / seconds, workers=1)]
+    if args.workers > 1:
+        seconds, _ = timed(lambda: list(convert_many(jobs, args.workers)), args.repeat)
+        results.append(result("pdf_to_txt", len(docs), nbytes, seconds,
+                              pages_per_sec=pages / seconds, workers=args.workers))
+    shutil.rmtree(out_dir)
+    return results
+
+
+def bench_count_keywords(texts, nbytes, matcher, args):
+    seconds, _ = timed(lambda: [count_keywords(t, matcher) for t in texts], args.repeat)
+    return [result("count_keywords", len(texts), nbytes, seconds)]
+
+
+def bench_jieba_trust_index(texts, nbytes, matcher, args):
+    # 04 的信任指数路径：分词 → 编码 → 计数 → 指数
+    def run():
+        for text in texts:
+            local_vocab, ids = encode_tokens(jieba.cut(text))
+            token_counts = count_encoded(local_vocab, ids, matcher.keywords)
+            sum(token_counts[w] for w in dictionary.trust_words) / max(len(ids), 1)
+
+    seconds, _ = timed(run, args.repeat)
+    return [result("jieba_trust_index", len(texts), nbytes, seconds)]
+
+
+def bench_analyze_document(docs, nbytes, matcher, args):
+    # 04 单篇完整处理（读取、哈希、关键词、分词），单进程
+    init_worker(matcher, dictionary.trust_words)
+    seconds, results = timed(lambda: [analyze_document((d["txt"], None)) for d in docs], args.repeat)
+    return [result("analyze_document", len(docs), nbytes, seconds)], results
+
+
+def bench_aggregate(docs, texts, nbytes, matcher, analyzed, work_dir, args):
+    # 04 的年度汇总，以及 05_可视化.py 依次尝试的三种汇总路径
+    keywords = matcher.keywords
+    rows = sorted(((*split_doc_name(d["txt"]), r["counts"], r["txt_sha256"]), r["encoded"])
+                  for d, r in zip(docs, analyzed))
+    entries = [entry for entry, _ in rows]
+    seconds, tables = timed(lambda: build_year_tables(entries, matcher, dictionary.keyword_groups, dictionary.trust_words),
+                            args.repeat)
+    results = [result("aggregate_04_tables", len(docs), nbytes, seconds)]
+
+    token_dtm = tables[3]
+    seconds, _ = timed(lambda: token_dtm.column_totals(keywords), args.repeat)
+    results.append(result("aggregate_05_dtm", len(docs), nbytes, seconds))
+
+    cache_dir = os.path.join(work_dir, "bench_tokens")
+    with TokenCache(cache_dir) as cache:
+        for (code, _, _, sha256), encoded in rows:
+            cache.put(code, sha256, *encoded)
+    with TokenCache(cache_dir) as cache:
+        plan = cache.term_plan(keywords)
+        seconds, _ = timed(lambda: [count_terms(cache.get(e[0]), plan) for e in entries], args.repeat)
+    results.append(result("aggregate_05_token_cache", len(docs), nbytes, seconds))
+    shutil.rmtree(cache_dir)
+
+    def jieba_path():
+        totals = Counter()
+        for text in texts:
+            local_vocab, ids = encode_tokens(jieba.cut(text))
+            totals.update(count_encoded(local_vocab, ids, keywords))
+        return totals
+
+    seconds, _ = timed(jieba_path, args.repeat)
+    results.append(result("aggregate_05_jieba", len(docs), nbytes, seconds))
+    return results
+
+
+def bench_download(docs, work_dir, args):
+    from aiohttp import web
+
+    payloads = {}
+    for d in docs:
+        with open(d["pdf"], "rb") as f:
+            payloads[d["name"]] = f.read()
+    nbytes = sum(len(p) for p in payloads.values())
+
+    async def serve(request):
+        if args.latency:
+            await asyncio.sleep(args.latency / 1000)
+        return web.Response(body=payloads[request.match_info["name"]], content_type="application/pdf")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{name}.pdf", serve)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        out_dir = os.path.join(work_dir, "bench_download")
+        best = None
+        try:
+            for _ in range(args.repeat):
+                shutil.rmtree(out_dir, ignore_errors=True)
+                os.makedirs(out_dir)
+                jobs = [(f"http://127.0.0.1:{port}/{name}.pdf", os.path.join(out_dir, name + ".pdf"))
+                        for name in payloads]
+                start = time.perf_counter()
+                results = await download_all(jobs, concurrency=args.concurrency, per_host=args.concurrency)
+                elapsed = time.perf_counter() - start
+                if any(r["status"] != "ok" for r in results):
+                    raise RuntimeError("模拟服务器下载失败")
+                best = elapsed if best is None else min(best, elapsed)
+        finally:
+            await runner.cleanup()
+            shutil.rmtree(out_dir, ignore_errors=True)
+        return best
+
+    seconds = asyncio.run(run())
+    return [result("download", len(docs), nbytes, seconds, concurrency=args.concurrency, latency_ms=args.latency)]
+
+
+# ========== 主流程 ==========
+def prepare_corpus(args):
+    params = {"docs": args.docs, "chars": args.chars, "density": args.density, "seed": args.seed}
+    params_path = os.path.join(args.work_dir, "corpus_params.json")
+    if os.path.exists(params_path):
+        with open(params_path, encoding="utf-8") as f:
+            if json.load(f) == params:
+                with open(os.path.join(args.work_dir, "corpus_docs.json"), encoding="utf-8") as f:
+                    print("♻️ 复用已生成的合成语料")
+                    return json.load(f)
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    print(f"🧪 正在生成合成语料：{args.docs} 篇，约 {args.chars} 字/篇，关键词密度 {args.density}/千字 ...")
+    start = time.perf_counter()
+    docs = generate_corpus(args.work_dir, YEAR, args.docs, args.chars, args.density, args.seed)
+    print(f"✅ 语料生成完成，用时 {time.perf_counter() - start:.1f} 秒")
+    with open(os.path.join(args.work_dir, "corpus_docs.json"), "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
+    with open(params_path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年报文本分析各阶段基准测试")
+    parser.add_argument("--docs", type=int, default=50, help="合成年报篇数")
+    parser.add_argument("--chars", type=int, default=60000, help="平均每篇字数")
+    parser.add_argument("--density", type=float, default=2.0, help="关键词密度（每千字插入个数）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"要运行的阶段，逗号分隔（可选：{','.join(STAGES)}）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最短用时）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="pdf_to_txt 并行测试的进程数")
+    parser.add_argument("--concurrency", type=int, default=12, help="下载测试的并发数")
+    parser.add_argument("--latency", type=float, default=0, help="模拟服务器每个请求的附加延迟（毫秒）")
+    parser.add_argument("--work-dir", default=None, help="合成语料目录（指定后可跨次复用，默认临时目录）")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径（默认输出到标准输出）")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"未知阶段：{', '.join(sorted(unknown))}")
+    keep = args.work_dir is not None
+    args.work_dir = args.work_dir or tempfile.mkdtemp(prefix="textmining_bench_")
+
+    try:
+        docs = prepare_corpus(args)
+        texts = []
+        for d in docs:
+            with open(d["txt"], "r", encoding="utf-8") as f:
+                texts.append(f.read())
+        txt_bytes = sum(d["txt_bytes"] for d in docs)
+        matcher = dictionary.matcher
+        jieba.initialize()
+        dictionary.register_jieba()
+
+        results = []
+        analyzed = None
+        for stage in stages:
+            print(f"⏱️ {stage} ...", file=sys.stderr)
+            if stage == "pdf_to_txt":
+                results += bench_pdf_to_txt(docs, args.work_dir, args)
+            elif stage == "count_keywords":
+                results += bench_count_keywords(texts, txt_bytes, matcher, args)
+            elif stage == "jieba_trust_index":
+                results += bench_jieba_trust_index(texts, txt_bytes, matcher, args)
+            elif stage == "analyze_document":
+                stage_results, analyzed = bench_analyze_document(docs, txt_bytes, matcher, args)
+                results += stage_results
+            elif stage == "aggregate":
+                if analyzed is None:
+                    init_worker(matcher, dictionary.trust_words)
+                    analyzed = [analyze_document((d["txt"], None)) for d in docs]
+                results += bench_aggregate(docs, texts, txt_bytes, matcher, analyzed, args.work_dir, args)
+            elif stage == "download":
+                results += bench_download(docs, args.work_dir, args)
+    finally:
+        if not keep:
+            shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {"docs": args.docs, "chars": args.chars, "density": args.density, "seed": args.seed,
+                       "repeat": args.repeat},
+            "corpus": {"txt_mb": txt_bytes / MB, "pdf_mb": sum(d["pdf_bytes"] for d in docs) / MB,
+                       "pages": sum(d["pages"] for d in docs)},
+        },
+        "results": results,
+    }
+    for r in results:
+        extra = f"（{r['workers']} 进程）" if "workers" in r else ""
+        print(f"📊 {r['stage']}{extra}: {r['docs_per_sec']:.1f} 篇/秒 | {r['mb_per_sec']:.2f} MB/秒 "
+              f"| {r['seconds']:.3f} 秒", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📁 结果已保存：{args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
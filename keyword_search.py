@@ -0,0 +1,82 @@
+import os
+import time
+import argparse
+import pandas as pd
+from textmining.corpus import open_year
+from textmining.keywords import dictionary
+from textmining.manifest import Manifest
+from textmining.position_index import SECTION_ALIASES, index_dir, refresh_index
+from textmining.token_cache import TokenCache
+
+# ===== 关键词定位：上下文（KWIC）与按章节统计 =====
+# 查询基于 04 统计时建好的位置索引（检索索引_{YEAR}/），不重新读取年报文本。示例：
+#   python keyword_search.py 区块链                                # 每次出现的公司、页码、章节与上下文
+#   python keyword_search.py 区块链 --section 管理层讨论与分析       # 只看管理层讨论与分析（MD&A）
+#   python keyword_search.py --counts --section 管理层讨论与分析    # 该章节内各关键词组计数与 Trust_Index
+#   python keyword_search.py --counts                              # 全文及各章节的 Trust_Index
+YEAR = 2021
+BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年报关键词上下文检索与按章节统计")
+    parser.add_argument("words", nargs="*", help="要定位的关键词（可多个）")
+    parser.add_argument("--year", type=int, default=YEAR, help="年份")
+    parser.add_argument("--base-dir", default=BASE_DIR, help="数据根目录")
+    parser.add_argument("--section", help=f"限定章节，如 {'、'.join(SECTION_ALIASES)}（按标题包含匹配）")
+    parser.add_argument("--counts", action="store_true",
+                        help="按章节统计关键词组计数与 Trust_Index（不给 --section 时输出全文及各章节的 Trust_Index）")
+    parser.add_argument("--width", type=int, default=30, help="上下文左右各显示的字数")
+    parser.add_argument("--limit", type=int, default=20, help="每个关键词最多显示的条数（0 表示全部）")
+    parser.add_argument("--output", help="结果另存为 xlsx")
+    parser.add_argument("--rebuild", action="store_true", help="重建位置索引")
+    args = parser.parse_args()
+    if not args.words and not args.counts:
+        parser.error("请给出关键词，或使用 --counts")
+
+    token_cache = TokenCache(os.path.join(args.base_dir, f"分词缓存_{args.year}"))
+    with Manifest(args.base_dir) as manifest:
+        # 04 已建好且分词缓存未变化时直接加载
+        index = refresh_index(index_dir(args.base_dir, args.year), open_year(args.base_dir, args.year),
+                              manifest, args.year, token_cache, force=args.rebuild)
+    print(f"🗂️ 已加载 {args.year} 年检索索引：{len(index.keys)} 份年报")
+
+    results = []
+    for word in args.words:
+        start = time.perf_counter()
+        # 总数由计数得到，上下文只生成要显示（或保存）的部分
+        hits = index.counts([word], args.section)[word]
+        df = index.kwic(word, args.width, args.section, limit=None if args.output else args.limit)
+        results.append(df)
+        scope = f"「{args.section}」中" if args.section else ""
+        print(f"\n🔎 {word}：{scope}共出现 {int(hits.sum())} 次，涉及 {int((hits > 0).sum())} 家公司"
+              f"（用时 {time.perf_counter() - start:.3f} 秒）")
+        for row in (df.head(args.limit) if args.limit else df).itertuples(index=False):
+            page = f"第{int(row.页码)}页" if pd.notna(row.页码) else "页码未知"
+            print(f"  {row.公司代码} {row.公司简称} {page} {row.章节}：…{row.左文}【{row.关键词}】{row.右文}…")
+
+    if args.counts:
+        start = time.perf_counter()
+        if args.section:
+            df = index.section_table(dictionary.keyword_groups, dictionary.trust_words, args.section)
+            name = f"章节统计_{args.section}_{args.year}.xlsx"
+            coverage = f"{df['分词总数'].notna().sum()}/{len(df)} 家公司有该章节"
+        else:
+            df = index.trust_by_section(dictionary.trust_words)
+            name = f"章节可信度指数_{args.year}.xlsx"
+            coverage = "、".join(f"{c[len('Trust_Index_'):]} {df[c].notna().sum()} 家"
+                                for c in df.columns if c.startswith("Trust_Index_"))
+        print(f"\n📊 按章节统计（{coverage}，共 {len(df)} 家；用时 {time.perf_counter() - start:.3f} 秒，"
+              f"词典版本 {dictionary.version[:12]}）")
+        print(df.head(args.limit or len(df)).to_string(index=False))
+        path = args.output or os.path.join(args.base_dir, f"分析结果_{args.year}", name)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        df.to_excel(path, index=False)
+        print(f"✅ 已保存至：{path}")
+    elif args.output and results:
+        pd.concat(results, ignore_index=True).to_excel(args.output, index=False)
+        print(f"✅ 已保存至：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
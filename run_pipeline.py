@@ -0,0 +1,68 @@
+import os
+import json
+import argparse
+from textmining.crawler import parse_years
+from textmining.metrics import finish
+from textmining.pipeline import Pipeline
+from textmining.text_stream import DEFAULT_CHUNK_SIZE
+
+# ===== 一键运行：采集 → 下载 → 校验 → 转换 → 统计 → 可视化 =====
+BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年报文本分析流水线（01–05 各阶段并发衔接）")
+    parser.add_argument("--years", default="2021", help="年份，如 2021 或 2018-2025")
+    parser.add_argument("--base-dir", default=BASE_DIR, help="数据根目录")
+    parser.add_argument("--plates", default="szse,sse,bj", help="板块，逗号分隔")
+    parser.add_argument("--skip-crawl", action="store_true", help="不重新采集，直接使用已有的年报链接 Excel")
+    parser.add_argument("--crawl-workers", type=int, default=3, help="并发采集的（板块, 年份）任务数")
+    parser.add_argument("--rate", type=float, default=1.25, help="采集请求速率（次/秒）")
+    parser.add_argument("--download-workers", type=int, default=12, help="同时进行的下载数")
+    parser.add_argument("--download-rate", type=float, default=8.0, help="下载请求初始速率（次/秒）")
+    parser.add_argument("--validate-workers", type=int, default=4, help="PDF 校验线程数")
+    parser.add_argument("--convert-workers", type=int, default=None, help="PDF 转 TXT 进程数（默认 CPU 核数一半）")
+    parser.add_argument("--count-workers", type=int, default=None, help="词频统计进程数（默认其余核数）")
+    parser.add_argument("--render-workers", type=int, default=2, help="并行绘图的年份数")
+    parser.add_argument("--queue-size", type=int, default=64, help="阶段间队列容量（背压上限）")
+    parser.add_argument("--timeout", type=int, default=300, help="单份 PDF 转换超时秒数")
+    parser.add_argument("--stream", action="store_true", help="流式统计超大年报，限制单篇内存占用")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="流式模式每块字符数")
+    parser.add_argument("--no-render", action="store_true", help="跳过可视化")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="吞吐量报告间隔秒数")
+    parser.add_argument("--summary", default=None, help="将各阶段汇总指标写入该 JSON 文件")
+    parser.add_argument("--metrics", help="运行指标输出路径（.prom 为 Prometheus 格式，其他为 JSON lines）")
+    parser.add_argument("--profile", help="cProfile 结果输出目录（转换、统计进程池每个进程一个 .prof 文件）")
+    args = parser.parse_args()
+
+    years = parse_years(args.years)
+    print(f"🚀 流水线启动：{years[0]}–{years[-1]} 年，数据目录 {args.base_dir}")
+    pipeline = Pipeline(
+        args.base_dir, years,
+        plates=[p.strip() for p in args.plates.split(",") if p.strip()],
+        crawl=not args.skip_crawl,
+        crawl_workers=args.crawl_workers,
+        download_workers=args.download_workers,
+        validate_workers=args.validate_workers,
+        convert_workers=args.convert_workers,
+        count_workers=args.count_workers,
+        render_workers=args.render_workers,
+        queue_size=args.queue_size,
+        rate=args.rate,
+        download_rate=args.download_rate,
+        convert_timeout=args.timeout,
+        chunk_size=args.chunk_size if args.stream else None,
+        render=not args.no_render,
+        report_interval=args.report_interval,
+        profile_dir=args.profile,
+    )
+    summary = pipeline.run()
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"📊 汇总指标已保存：{os.path.abspath(args.summary)}")
+    finish(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
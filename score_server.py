@@ -0,0 +1,39 @@
+import os
+import argparse
+from aiohttp import web
+from textmining.keywords import dictionary
+from textmining.metrics import finish
+from textmining.service import (DEFAULT_BATCH_SIZE, DEFAULT_BATCH_WAIT, DEFAULT_CACHE_SIZE, DEFAULT_PORT,
+                                ScoringService, create_app)
+
+# ===== 在线评分服务：单篇年报按需计算关键词组计数与 Trust_Index =====
+# 示例：
+#   curl -F file=@000001_平安银行.pdf http://127.0.0.1:8765/score
+#   curl -H "Content-Type: application/json" -d '{"text": "……", "keyword_groups": {"测试": ["区块链"]}}' http://127.0.0.1:8765/score
+#   curl http://127.0.0.1:8765/score/2021/000001
+BASE_DIR = "/Users/qqqqq/Desktop/ppppp/年报"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年报关键词与可信度指数在线评分服务")
+    parser.add_argument("--base-dir", default=BASE_DIR, help="数据根目录（按公司代码评分时读取语料库与分词缓存）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="评分进程数")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="结果缓存容量（篇）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批最多合并的请求数")
+    parser.add_argument("--batch-wait", type=float, default=DEFAULT_BATCH_WAIT * 1000,
+                        help="凑批等待时间（毫秒）")
+    parser.add_argument("--metrics", help="退出时写出运行指标（.prom 为 Prometheus 格式，其他为 JSON lines）")
+    args = parser.parse_args()
+
+    service = ScoringService(args.base_dir, workers=args.workers, cache_size=args.cache_size,
+                             batch_size=args.batch_size, batch_wait=args.batch_wait / 1000)
+    print(f"🚀 评分服务启动：http://{args.host}:{args.port}（{args.workers} 个进程，"
+          f"词典 {len(dictionary.keywords)} 个关键词，版本 {dictionary.version[:12]}）")
+    web.run_app(create_app(service), host=args.host, port=args.port, print=None)
+    finish(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# 年报文本挖掘流水线的公共模块（各编号脚本共用）
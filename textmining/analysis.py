@@ -0,0 +1,172 @@
+import os
+import time
+import jieba
+import numpy as np
+import pandas as pd
+from .corpus import document_fingerprint, document_sha256, document_stat, read_document
+from .dtm import DocTermMatrix
+from .text_stream import analyze_stream
+from .keywords import register_jieba
+from .token_cache import TOKEN_DTYPE, count_encoded, count_terms, encode_tokens
+
+# ===== 单篇年报统计（04_词频统计.py 与流水线共用） =====
+
+
+def count_keywords(text, matcher):
+    result = matcher.count(text)
+    counts = dict(result["groups"])
+    counts["总字数"] = result["chars"]
+    return counts
+
+
+def trust_index(token_counts, trust_words, total_words):
+    # 信任词的分词计数之和 / 分词总数
+    trust_sum = sum(token_counts[w] for w in trust_words)
+    return trust_sum / total_words if total_words > 0 else 0
+
+
+# 工作进程内的全局状态：匹配器、信任词、流式块大小与分词缓存的内存映射
+_matcher = None
+_trust_words = []
+_chunk_size = None  # 非 None 时按块流式处理
+_token_maps = {}
+
+
+def init_worker(matcher, trust_words, chunk_size=None):
+    # 每个进程只加载一次 jieba 词典与匹配器，而不是每个任务加载一次；关键词注册为自定义词
+    global _matcher, _trust_words, _chunk_size
+    jieba.initialize()
+    register_jieba(matcher.keywords)
+    _matcher = matcher
+    _trust_words = list(trust_words)
+    _chunk_size = chunk_size
+
+
+def _cached_ids(tokens_path, offset, length):
+    mm = _token_maps.get(tokens_path)
+    if mm is None or len(mm) < offset + length:
+        # 缓存文件在本进程打开后又追加过内容：重新映射
+        mm = _token_maps[tokens_path] = np.memmap(tokens_path, dtype=TOKEN_DTYPE, mode="r")
+    return mm[offset:offset + length]
+
+
+def analyze_document(task):
+    # task = (ref, cached)；ref 为 TXT 路径或语料库文档引用，
+    # cached 为 (tokens_path, offset, length, term_plan) 或 None
+    txt_path, cached = task
+    start = time.perf_counter()
+    timings = {}
+    try:
+        txt_stat = document_stat(txt_path)
+        txt_sha256 = document_sha256(txt_path)
+
+        # ---- 1. 关键词统计 ----
+        if _chunk_size:
+            # 流式：逐块匹配与分词，不把整篇年报读入内存
+            result = analyze_stream(txt_path, _matcher, _matcher.keywords, _chunk_size, segment=cached is None)
+        else:
+            text = read_document(txt_path, errors="ignore")
+            timings["read"] = time.perf_counter() - start
+            result = _matcher.count(text)
+        timings["keywords"] = time.perf_counter() - start - timings.get("read", 0)
+        counts = dict(result["groups"])
+        counts["总字数"] = result["chars"]
+        counts["关键词计数"] = result["keywords"]
+
+        # ---- 2. 信任指数计算 ----
+        encoded = None
+        if cached is not None:
+            # TXT 未变：直接读取分词缓存，不再调用 jieba
+            tokens_path, offset, length, plan = cached
+            ids = _cached_ids(tokens_path, offset, length)
+            token_counts = count_terms(ids, plan)
+            total_words = len(ids)
+        elif _chunk_size:
+            # 流式模式只保留计数，不写分词缓存，内存占用与文件大小无关
+            token_counts = result["token_counts"]
+            total_words = result["tokens"]
+        else:
+            local_vocab, ids = encode_tokens(jieba.cut(text))
+            token_counts = count_encoded(local_vocab, ids, _matcher.keywords)
+            encoded = (local_vocab, ids)
+            total_words = len(ids)
+        timings["segment"] = time.perf_counter() - start - sum(timings.values())
+        counts["Trust_Index"] = trust_index(token_counts, _trust_words, total_words)
+        # 分词后的关键词计数一并缓存，05_可视化.py 可直接复用
+        counts["分词总数"] = total_words
+        counts["分词计数"] = token_counts
+        # 耗时分解：read/keywords 为读取与子串匹配（流式模式下含分词），segment 为分词或读取分词缓存
+        return {"path": txt_path, "counts": counts, "txt_stat": txt_stat,
+                "txt_sha256": txt_sha256, "encoded": encoded, "error": None,
+                "tokens": total_words, "timings": timings, "seconds": time.perf_counter() - start}
+
+    except Exception as e:
+        return {"path": txt_path, "counts": None, "txt_stat": None,
+                "txt_sha256": None, "encoded": None, "error": str(e),
+                "tokens": 0, "timings": timings, "seconds": time.perf_counter() - start}
+
+
+# ===== 增量判断 =====
+def counts_are_fresh(record, txt_path, dict_version):
+    # TXT 与关键词词典（dictionary.version）都未变化时，沿用清单中的统计结果
+    return bool(
+        record.get("counts")
+        and "关键词计数" in record["counts"]
+        and record.get("dict_hash") == dict_version
+        and record.get("txt_stat") == document_stat(txt_path)
+        and record.get("counts_txt") == record.get("txt_sha256")
+    )
+
+
+def make_task(txt_path, key, record, manifest, token_cache, matcher, segmenter=None):
+    # 分词缓存与当前 TXT 一致时只需重新匹配关键词，不必重新分词（词典新增的关键词按相邻词拼接计数）；
+    # key 为分词缓存的文档键（manifest.doc_key）；给出 segmenter 时，分词缓存还须由该版本的 jieba 自定义词生成，否则重新分词
+    _, txt_sha256 = document_fingerprint(txt_path, manifest, record)
+    if token_cache.has(key, txt_sha256) and segmenter in (None, token_cache.segmenter(key)):
+        offset, length = token_cache.span(key)
+        return txt_path, (token_cache.tokens_path, offset, length, token_cache.term_plan(matcher.keywords))
+    return txt_path, None
+
+
+# ===== 年度汇总：文档-词项矩阵，指标均为矩阵运算 =====
+def build_year_tables(entries, matcher, keyword_groups, trust_words):
+    # entries: 按公司代码排序的 (公司代码, 公司简称, counts, TXT 哈希) 列表
+    codes = [e[0] for e in entries]
+    rows = [e[2] for e in entries]
+    versions = [e[3] for e in entries]
+    # 子串计数（与 str.count 一致）与 jieba 分词计数各一个矩阵
+    substr_dtm = DocTermMatrix.from_counts(
+        codes, matcher.keywords, [r["关键词计数"] for r in rows], [r["总字数"] for r in rows], versions)
+    token_dtm = DocTermMatrix.from_counts(
+        codes, matcher.keywords, [r["分词计数"] for r in rows], [r["分词总数"] for r in rows], versions)
+
+    group_totals = substr_dtm.group_totals(keyword_groups)
+    trust_index = token_dtm.rates(trust_words)
+
+    df = pd.DataFrame({"公司代码": codes, "公司简称": [e[1] for e in entries]})
+    for group in keyword_groups:
+        df[group] = group_totals[group]
+    df["总字数"] = substr_dtm.lengths
+
+    trust_df = df[["公司代码", "公司简称"]].copy()
+    trust_df["Trust_Index"] = trust_index
+    return df, trust_df, substr_dtm, token_dtm
+
+
+def year_output_paths(output_dir, year):
+    return {
+        "counts": os.path.join(output_dir, f"{year}_年报词频统计.xlsx"),
+        "trust": os.path.join(output_dir, f"数据可信度指数_{year}.xlsx"),
+        "substr_dtm": os.path.join(output_dir, f"关键词矩阵_{year}.npz"),
+        "token_dtm": os.path.join(output_dir, f"分词矩阵_{year}.npz"),
+    }
+
+
+def save_year_outputs(output_dir, year, df, trust_df, substr_dtm, token_dtm):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = year_output_paths(output_dir, year)
+    substr_dtm.save(paths["substr_dtm"])
+    token_dtm.save(paths["token_dtm"])
+    df.to_excel(paths["counts"], index=False)
+    trust_df.to_excel(paths["trust"], index=False)
+    return paths
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import requests
+import pandas as pd
+from .metrics import inc
+
+# ===== 上市公司信息索引 =====
+# companyList.json 缓存为本地 JSON，以公司代码为键：
+#   {"version": 3, "etag": ..., "last_modified": ..., "fetched_at": ...,
+#    "companies": {"000001": {"name": "平安银行", "industry": "金融业", "names": ["深发展A", "平安银行"]}}}
+# 超过 TTL 才重新请求，并带上 If-None-Match / If-Modified-Since，未变化时服务器返回 304 不传正文。
+# 按公司代码查行业，简称变更不会再导致匹配不上；names 保留历次出现过的简称。
+
+COMPANY_INFO_URL = "http://www.cninfo.com.cn/new/data/companyList.json"
+INDEX_NAME = "公司信息.json"
+DEFAULT_TTL = 24 * 3600
+EXCLUDED_INDUSTRIES = ["房地产业", "金融业"]
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0',
+    'Referer': 'http://www.cninfo.com.cn/',
+}
+
+
+def company_index_path(folder):
+    return os.path.join(folder, INDEX_NAME)
+
+
+class CompanyIndex:
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.version = 0
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0
+        self.companies = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.version = state["version"]
+            self.etag = state.get("etag")
+            self.last_modified = state.get("last_modified")
+            self.fetched_at = state.get("fetched_at", 0)
+            self.companies = state["companies"]
+
+    # ---- 刷新 ----
+    def is_stale(self):
+        return not self.companies or time.time() - self.fetched_at >= self.ttl
+
+    def refresh(self, force=False):
+        # 返回是否有内容更新；网络异常时沿用本地缓存
+        if not force and not self.is_stale():
+            inc("company_index", status="cached")
+            return False
+        headers = dict(HEADERS)
+        if self.companies and self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.companies and self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        try:
+            res = requests.get(COMPANY_INFO_URL, headers=headers, timeout=30)
+            inc("company_index", status=res.status_code)
+            if res.status_code == 304:
+                self.fetched_at = time.time()
+                self.save()
+                return False
+            res.raise_for_status()
+            data = res.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ 公司信息更新失败，沿用本地缓存（{len(self.companies)} 家）：{e}")
+            return False
+
+        changed = self.merge(_parse_company_list(data))
+        self.etag = res.headers.get("ETag")
+        self.last_modified = res.headers.get("Last-Modified")
+        self.fetched_at = time.time()
+        self.save()
+        return changed
+
+    def merge(self, rows):
+        # rows: [(公司代码, 公司简称, 行业), ...]；简称变化时追加到 names，行业以最新为准
+        changed = False
+        for code, name, industry in rows:
+            entry = self.companies.get(code)
+            if entry is None:
+                self.companies[code] = {"name": name, "industry": industry, "names": [name]}
+                changed = True
+                continue
+            if name and name != entry["name"]:
+                entry["name"] = name
+                if name not in entry["names"]:
+                    entry["names"].append(name)
+                changed = True
+            if industry and industry != entry["industry"]:
+                entry["industry"] = industry
+                changed = True
+        if changed:
+            self.version += 1
+        return changed
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "etag": self.etag, "last_modified": self.last_modified,
+                       "fetched_at": self.fetched_at, "companies": self.companies}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    # ---- 查询 ----
+    def __len__(self):
+        return len(self.companies)
+
+    def __contains__(self, code):
+        return str(code) in self.companies
+
+    def industry(self, code):
+        entry = self.companies.get(str(code))
+        return entry["industry"] if entry else None
+
+    def name(self, code):
+        entry = self.companies.get(str(code))
+        return entry["name"] if entry else None
+
+    def names(self, code):
+        entry = self.companies.get(str(code))
+        return list(entry["names"]) if entry else []
+
+    def annotate(self, records, excluded=EXCLUDED_INDUSTRIES):
+        # 采集时调用：按公司代码补上行业，剔除排除行业的公司
+        kept = []
+        for record in records:
+            industry = self.industry(record["公司代码"])
+            if industry in excluded:
+                continue
+            kept.append(dict(record, 行业=industry))
+        return kept
+
+    def to_frame(self):
+        return pd.DataFrame(
+            [(code, e["name"], e["industry"]) for code, e in self.companies.items()],
+            columns=["公司代码", "公司简称", "行业"],
+        )
+
+
+def _parse_company_list(data):
+    # 接口结构：{"companyList": [{"stockList": [{...}, ...]}, ...]}，字段名按关键字识别
+    rows = []
+    for block in data.get("companyList", []):
+        stocks = block.get("stockList") if isinstance(block, dict) else None
+        if not isinstance(stocks, list) or not stocks:
+            continue
+        keys = {}
+        for col in stocks[0]:
+            if "code" in col.lower(): keys["code"] = col
+            if "zwjc" in col.lower() or "简称" in col: keys["name"] = col
+            if "industry" in col.lower(): keys["industry"] = col
+        if "code" not in keys:
+            continue
+        for stock in stocks:
+            rows.append((str(stock.get(keys["code"])), stock.get(keys.get("name")), stock.get(keys.get("industry"))))
+    return rows
+
+
+def load_company_index(folder, ttl=DEFAULT_TTL, force=False):
+    index = CompanyIndex(company_index_path(folder), ttl)
+    index.refresh(force)
+    print(f"✅ 公司信息：{len(index)} 家上市公司（索引版本 {index.version}）")
+    return index
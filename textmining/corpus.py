@@ -0,0 +1,329 @@
+import io
+import os
+import json
+import hashlib
+from collections import namedtuple
+from .manifest import doc_filename, doc_key, file_sha256, file_stat
+
+try:
+    import zstandard as zstd
+except ImportError:  # 只使用 TXT 目录时不需要 zstandard
+    zstd = None
+
+# ===== 压缩分片语料库 =====
+# 每年一个目录 语料库_{YEAR}/，代替成千上万个零散 TXT：
+#   shard-00000.zst …  每篇年报压缩为一个独立的 zstd 帧，依次追加；分片超过 SHARD_SIZE 后换新分片
+#   index.json         文档键（公司代码_公告ID，旧文件名为公司代码，见 manifest.doc_key）
+#                      -> {name, year, shard, offset, length, size, sha256, pages}
+# 解压后的内容与 03 生成的 TXT 逐字节相同（逐页文本，每页以换行结束），sha256 即 TXT 文件哈希，
+# 清单与分词缓存可直接沿用。pages 为 [[原页码, 起始字符位置], ...]，由 TXT 导入且清单中没有页边界的文档为 null。
+# 同一文档重新写入时追加新帧并改写索引，旧帧作废（compact() 可回收空间）。
+# 建好语料库后又写入的 TXT（02 --extract、不带 --corpus 的 03、流水线）不会丢：open_year 把语料库中没有、
+# 或修改时间晚于语料库索引的 TXT 与语料库合并读取（MergedDocuments）。
+
+SHARD_SIZE = 256 * 1024 * 1024
+ZSTD_LEVEL = 9
+INDEX_NAME = "index.json"
+
+# 传给工作进程的文档引用：TXT 模式下就是文件路径，语料库模式下为 DocRef
+DocRef = namedtuple("DocRef", ["shard", "offset", "length", "sha256"])
+
+
+def corpus_dir(base_dir, year):
+    return os.path.join(base_dir, f"语料库_{year}")
+
+
+def _require_zstd():
+    if zstd is None:
+        raise ImportError("语料库格式需要 zstandard：pip install zstandard")
+
+
+def encode_pages(pages, level=ZSTD_LEVEL):
+    # pages: [(原页码, 页面文本), ...] -> (压缩帧, 原始字节数, sha256, 页边界)
+    _require_zstd()
+    text_parts = []
+    boundaries = []
+    pos = 0
+    for page_no, page_text in pages:
+        boundaries.append([page_no, pos])
+        text_parts.append(page_text + "\n")
+        pos += len(page_text) + 1
+    return encode_bytes("".join(text_parts).encode("utf-8"), level) + (boundaries,)
+
+
+def encode_bytes(data, level=ZSTD_LEVEL):
+    _require_zstd()
+    frame = zstd.ZstdCompressor(level=level, write_content_size=True).compress(data)
+    return frame, len(data), hashlib.sha256(data).hexdigest()
+
+
+# ========== 写入 ==========
+class CorpusWriter:
+    def __init__(self, path, year, shard_size=SHARD_SIZE, level=ZSTD_LEVEL):
+        _require_zstd()
+        self.path = path
+        self.year = year
+        self.shard_size = shard_size
+        self.level = level
+        os.makedirs(path, exist_ok=True)
+        self.index = _load_index(path)
+        shards = sorted(f for f in os.listdir(path) if f.startswith("shard-") and f.endswith(".zst"))
+        self._shard_no = int(shards[-1][6:11]) if shards else 0
+        self._dirty = False
+
+    def _shard_name(self):
+        name = f"shard-{self._shard_no:05d}.zst"
+        shard_path = os.path.join(self.path, name)
+        if os.path.exists(shard_path) and os.path.getsize(shard_path) >= self.shard_size:
+            self._shard_no += 1
+            name = f"shard-{self._shard_no:05d}.zst"
+        return name
+
+    def add_frame(self, key, name, frame, size, sha256, pages=None):
+        shard = self._shard_name()
+        with open(os.path.join(self.path, shard), "ab") as f:
+            offset = f.tell()
+            f.write(frame)
+        self.index[key] = {"name": name, "year": self.year, "shard": shard, "offset": offset,
+                            "length": len(frame), "size": size, "sha256": sha256, "pages": pages}
+        self._dirty = True
+
+    def ref(self, key):
+        entry = self.index[key]
+        return DocRef(os.path.join(self.path, entry["shard"]), entry["offset"], entry["length"], entry["sha256"])
+
+    def add_pages(self, key, name, pages):
+        self.add_frame(key, name, *encode_pages(pages, self.level))
+
+    def add_txt(self, key, name, txt_path, pages=None):
+        # 导入已有 TXT：原样压缩字节，哈希与 TXT 文件一致；pages 为抽取时记录的页边界（如有）
+        with open(txt_path, "rb") as f:
+            self.add_frame(key, name, *encode_bytes(f.read(), self.level), pages)
+
+    def flush(self):
+        if self._dirty:
+            tmp = os.path.join(self.path, INDEX_NAME + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(self.path, INDEX_NAME))
+            self._dirty = False
+
+    def compact(self):
+        # 按索引顺序把仍然有效的帧复制到新分片，删除旧分片
+        self.flush()
+        old_shards = sorted(f for f in os.listdir(self.path) if f.startswith("shard-"))
+        entries = sorted(self.index.items(), key=lambda kv: (kv[1]["shard"], kv[1]["offset"]))
+        self._shard_no = int(old_shards[-1][6:11]) + 1 if old_shards else 0
+        new_index = {}
+        for key, entry in entries:
+            with open(os.path.join(self.path, entry["shard"]), "rb") as f:
+                f.seek(entry["offset"])
+                frame = f.read(entry["length"])
+            self.add_frame(key, entry["name"], frame, entry["size"], entry["sha256"], entry["pages"])
+            new_index[key] = self.index[key]
+        self.index = new_index
+        self._dirty = True
+        self.flush()
+        for f in old_shards:
+            os.remove(os.path.join(self.path, f))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _load_index(path):
+    index_path = os.path.join(path, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ========== 读取：语料库与 TXT 目录提供同一接口 ==========
+class CorpusReader:
+    kind = "corpus"
+
+    def __init__(self, path):
+        _require_zstd()
+        self.path = path
+        self.index = _load_index(path)
+
+    def names(self):
+        # 与 TXT 目录一致的文档名 "公司代码_公司简称_公告ID.txt"（旧文件名无公告 ID），按名称排序
+        names = []
+        for key, entry in self.index.items():
+            code, _, ann_id = key.partition("_")
+            names.append(doc_filename(code, entry["name"], ann_id, ".txt"))
+        return sorted(names)
+
+    def ref(self, doc_name):
+        entry = self.index[doc_key(doc_name)]
+        return DocRef(os.path.join(self.path, entry["shard"]), entry["offset"], entry["length"], entry["sha256"])
+
+    def position(self, doc_name):
+        # 按分片与偏移排序处理，读取近似顺序读
+        entry = self.index[doc_key(doc_name)]
+        return entry["shard"], entry["offset"]
+
+    def page_breaks(self, doc_name):
+        # [[原页码, 起始字符位置], ...]，不解压文本；没有页边界时返回 None
+        return self.index[doc_key(doc_name)]["pages"]
+
+    def pages(self, doc_name):
+        # [(原页码, 页面文本), ...]；由 TXT 导入、没有页边界的文档返回 None
+        boundaries = self.page_breaks(doc_name)
+        if boundaries is None:
+            return None
+        # 页边界按原始字符位置记录，此处不做换行转换
+        with _decode(_read_frame(self.ref(doc_name)), newline="") as f:
+            text = f.read()
+        ends = [start for _, start in boundaries[1:]] + [len(text)]
+        return [(page_no, text[start:end - 1]) for (page_no, start), end in zip(boundaries, ends)]
+
+    def iter_documents(self):
+        # 每个分片只打开一次，按偏移顺序读取，产出 (文档名, 文本)
+        shard = f = None
+        try:
+            for doc_name in sorted(self.names(), key=self.position):
+                ref = self.ref(doc_name)
+                if ref.shard != shard:
+                    if f is not None:
+                        f.close()
+                    shard, f = ref.shard, open(ref.shard, "rb")
+                f.seek(ref.offset)
+                with _decode(f.read(ref.length)) as text:
+                    yield doc_name, text.read()
+        finally:
+            if f is not None:
+                f.close()
+
+
+class TxtDirectory:
+    kind = "txt"
+
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        return sorted(f for f in os.listdir(self.path) if f.endswith(".txt"))
+
+    def ref(self, doc_name):
+        return os.path.join(self.path, doc_name)
+
+    def position(self, doc_name):
+        return "", doc_name
+
+    def page_breaks(self, doc_name):
+        # TXT 文件本身不含页边界，抽取时记录在清单 pages 表中（见 position_index.document_page_breaks）
+        return None
+
+    def pages(self, doc_name):
+        return None
+
+    def iter_documents(self):
+        for doc_name in self.names():
+            yield doc_name, read_document(self.ref(doc_name))
+
+
+class MergedDocuments:
+    # 语料库 + 之后写入的 TXT：语料库中没有、或修改时间晚于语料库索引的文档读 TXT 文件，其余读语料库
+    kind = "merged"
+
+    def __init__(self, corpus, txt, txt_names):
+        self.corpus = corpus
+        self.txt = txt
+        self.path = corpus.path
+        self._txt_names = set(txt_names)
+        self._names = sorted(set(corpus.names()) | self._txt_names)
+
+    def _source(self, doc_name):
+        return self.txt if doc_name in self._txt_names else self.corpus
+
+    def names(self):
+        return list(self._names)
+
+    def ref(self, doc_name):
+        return self._source(doc_name).ref(doc_name)
+
+    def position(self, doc_name):
+        return self._source(doc_name).position(doc_name)
+
+    def page_breaks(self, doc_name):
+        return self._source(doc_name).page_breaks(doc_name)
+
+    def pages(self, doc_name):
+        return self._source(doc_name).pages(doc_name)
+
+    def iter_documents(self):
+        for doc_name, text in self.corpus.iter_documents():
+            if doc_name not in self._txt_names:
+                yield doc_name, text
+        for doc_name in sorted(self._txt_names):
+            yield doc_name, read_document(self.txt.ref(doc_name))
+
+
+def open_year(base_dir, year):
+    # 该年已建语料库时读语料库，否则读 TXT 目录；两者都有时合并（见 MergedDocuments）
+    path = corpus_dir(base_dir, year)
+    txt = TxtDirectory(os.path.join(base_dir, f"年报TXT_{year}"))
+    index_path = os.path.join(path, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return txt
+    corpus = CorpusReader(path)
+    if not os.path.isdir(txt.path):
+        return corpus
+    index_mtime = os.stat(index_path).st_mtime_ns
+    in_corpus = set(corpus.names())
+    newer = [n for n in txt.names() if n not in in_corpus or os.stat(txt.ref(n)).st_mtime_ns > index_mtime]
+    return MergedDocuments(corpus, txt, newer) if newer else corpus
+
+
+# ========== 按引用读取单篇（可在工作进程中调用） ==========
+def _read_frame(ref):
+    with open(ref.shard, "rb") as f:
+        f.seek(ref.offset)
+        return f.read(ref.length)
+
+
+def _decode(frame, errors="strict", newline=None):
+    # 流式解压为文本文件对象；默认换行处理与 open(..., "r") 读取 TXT 相同
+    _require_zstd()
+    raw = zstd.ZstdDecompressor().stream_reader(io.BytesIO(frame))
+    return io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8", errors=errors, newline=newline)
+
+
+def open_document(ref, errors="strict"):
+    if isinstance(ref, DocRef):
+        return _decode(_read_frame(ref), errors)
+    return open(ref, "r", encoding="utf-8", errors=errors)
+
+
+def read_document(ref, errors="strict"):
+    with open_document(ref, errors) as f:
+        return f.read()
+
+
+def document_stat(ref):
+    # 廉价的变化检测：TXT 为 (大小, mtime)，语料库为帧所在位置（追加写入，位置变化即内容重写）
+    if isinstance(ref, DocRef):
+        return f"{os.path.basename(ref.shard)}:{ref.offset}:{ref.length}"
+    return file_stat(ref)
+
+
+def document_sha256(ref):
+    if isinstance(ref, DocRef):
+        return ref.sha256
+    return file_sha256(ref)
+
+
+def document_fingerprint(ref, manifest, record):
+    # 返回 (stat, sha256)；语料库的哈希直接取自索引
+    if isinstance(ref, DocRef):
+        return document_stat(ref), ref.sha256
+    return manifest.fingerprint(ref, record, "txt")
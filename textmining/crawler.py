@@ -0,0 +1,245 @@
+import os
+import csv
+import json
+import math
+import requests
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import inc, timer
+
+# ===== 巨潮资讯网年报公告采集 =====
+# 按（板块, 年份）拆分任务并发采集，所有请求共用一个全局限速器；
+# 每完成一页即记录断点（精确到页），按公告 ID 去重。
+# 当年的任务采完后仍会陆续有公司披露年报：再次运行时从第 1 页重新检查，遇到已采集的公告即停止。
+
+ANNOUNCE_URL = "http://www.cninfo.com.cn/new/hisAnnouncement/query"
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0',
+    'Referer': 'http://www.cninfo.com.cn/',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'
+}
+
+EXCLUDE_TITLE_WORDS = ['摘要', '英文版', '公告', '提示', '补充', '更正']
+PAGE_SIZE = 30
+MAX_PAGES = 100
+PAGE_RETRIES = 3
+
+
+def links_dir(base_dir):
+    # 链接表、采集断点与公司信息缓存所在目录；01 / 02 / 04 / 流水线共用
+    return os.path.join(base_dir, "年报链接获取")
+
+
+def links_path(base_dir, year):
+    return os.path.join(links_dir(base_dir), f"{year}_年报链接.xlsx")
+
+
+def parse_years(text):
+    # "2023"、"2018-2025" 或逗号分隔的列表 "2019,2021,2023-2024"
+    years = []
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            years.extend(range(int(first), int(last) + 1))
+        else:
+            years.append(int(part))
+    return sorted(set(years))
+
+
+def parse_announcement(ann):
+    # 过滤非年报正文与 ST 公司，返回一条记录或 None
+    title = ann.get('announcementTitle', '')
+    if any(x in title for x in EXCLUDE_TITLE_WORDS):
+        return None
+    if 'ST' in ann.get('secName', ''):
+        return None
+    return {
+        '公司代码': ann.get('secCode'),
+        '公司简称': ann.get('secName'),
+        '公告标题': title,
+        '公告日期': ann.get('announcementTime'),
+        'PDF链接': 'http://static.cninfo.com.cn/' + ann.get('adjunctUrl', ''),
+        '公告ID': str(ann.get('announcementId', '')),
+    }
+
+
+def announcement_id(record):
+    # 链接表中的公告ID：读 Excel 后可能是整数、浮点数或空值；没有时返回 ""（旧版链接表）
+    value = record.get('公告ID')
+    if isinstance(value, float):
+        return "" if math.isnan(value) else str(int(value))
+    return "" if value is None else str(value)
+
+
+# ========== 断点文件 ==========
+class Checkpoint:
+    # records 文件逐页追加；state 文件原子写入“已完成的最后一页”及对应记录条数，
+    # 续采时按 state 截断 records，崩溃在两次写入之间也不会重复或丢失
+    def __init__(self, folder, plate, year):
+        self.records_path = os.path.join(folder, f"temp_{plate}_{year}.jsonl")
+        self.state_path = os.path.join(folder, f"temp_{plate}_{year}.state.json")
+        self.legacy_path = os.path.join(folder, f"temp_{plate}_{year}.csv")  # 旧版 01 的断点（每 10 页保存一次）
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            if os.path.exists(self.records_path):
+                os.remove(self.records_path)
+            if os.path.exists(self.legacy_path):
+                return self._import_legacy()
+            return [], 0, False
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        records = []
+        with open(self.records_path, encoding="utf-8") as f:
+            for line in f:
+                if len(records) == state["rows"]:
+                    break
+                records.append(json.loads(line))
+        # 去掉 state 之后多写的半页
+        with open(self.records_path, "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        return records, state["last_page"], state["done"]
+
+    def _import_legacy(self):
+        # 旧 CSV 只有记录、没有页码：导入为已采记录并从第 1 页重采，已有的记录按 PDF 链接跳过；
+        # 导入后改名，只导入一次
+        with open(self.legacy_path, encoding="utf-8-sig", newline="") as f:
+            records = [dict(row) for row in csv.DictReader(f)]
+        for r in records:
+            if str(r.get('公告日期', '')).isdigit():
+                r['公告日期'] = int(r['公告日期'])
+        self.commit(records, 0, len(records), False)
+        os.replace(self.legacy_path, self.legacy_path + ".imported")
+        print(f"🔁 已导入旧断点 {os.path.basename(self.legacy_path)}（{len(records)} 条）")
+        return records, 0, False
+
+    def commit(self, new_records, page, rows, done):
+        with open(self.records_path, "a", encoding="utf-8") as f:
+            for r in new_records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"last_page": page, "rows": rows, "done": done}, f)
+        os.replace(tmp, self.state_path)
+
+
+# ========== 单个（板块, 年份）任务 ==========
+def fetch_page(session, plate, year, page, limiter):
+    params = {
+        'stock': '',
+        'tabName': 'fulltext',
+        'plate': plate,
+        'category': 'category_ndbg_szsh',
+        'seDate': f'{year}-01-01~{year}-12-31',
+        'pageNum': page,
+        'pageSize': PAGE_SIZE,
+        'column': 'szse',
+    }
+    for attempt in range(PAGE_RETRIES):
+        if attempt:
+            inc("retries", stage="crawl")
+        with timer("rate_limit_wait", stage="crawl"):
+            limiter.acquire()
+        try:
+            with timer("http_request", stage="crawl"):
+                res = session.post(ANNOUNCE_URL, data=params, headers=HEADERS, timeout=15)
+            inc("http_responses", stage="crawl", status=res.status_code)
+            limiter.report(status=res.status_code)
+            if res.status_code != 200:
+                print(f"⚠️ {plate} {year} 第{page}页请求异常，状态码 {res.status_code}")
+                continue
+            json_data = res.json()
+            if not isinstance(json_data, dict) or "announcements" not in json_data:
+                print(f"⚠️ {plate} {year} 第{page}页返回空或结构异常。")
+                continue
+            return json_data
+        except requests.exceptions.Timeout as e:
+            inc("http_responses", stage="crawl", status=type(e).__name__)
+            limiter.report(error=e)
+            print(f"⏳ {plate} {year} 第{page}页请求超时，重试。")
+        except Exception as e:
+            inc("http_responses", stage="crawl", status=type(e).__name__)
+            limiter.report(error=e)
+            print(f"❌ {plate} {year} 第{page}页出错: {e}")
+    inc("failures", stage="crawl", status="page")
+    return None
+
+
+def crawl_plate_year(plate, year, limiter, folder, max_pages=MAX_PAGES, on_page=None, companies=None):
+    # on_page(plate, year, records)：每得到一批记录（含断点中已有的记录）即回调，供流水线边采边下
+    # companies（CompanyIndex）：采集时即按公司代码补上行业并剔除排除行业，断点中只保存保留的记录
+    checkpoint = Checkpoint(folder, plate, year)
+    records, last_page, done = checkpoint.load()
+    rows = len(records)  # 断点文件中的行数；旧断点可能含有需剔除的记录，过滤后条数会变少
+    seen = {r['PDF链接'] for r in records}  # 旧断点中的记录没有公告 ID，按 PDF 链接判断是否已采
+    if companies is not None:
+        records = companies.annotate(records)
+    if on_page is not None and records:
+        on_page(plate, year, list(records))
+    # 当年（及以后）的任务采完后仍可能有新披露：从第 1 页检查，遇到已采集的公告即停止
+    refresh = done and year >= date.today().year
+    if done and not refresh:
+        print(f"✅ {plate} 板块 {year} 年已采完（{len(records)} 条），跳过。")
+        return records
+    if refresh:
+        print(f"🔄 {plate} {year} 为当年，检查新披露的年报（已采 {len(records)} 条）")
+    elif last_page:
+        print(f"🔁 {plate} {year} 检测到断点，续采第 {last_page + 1} 页（已采 {len(records)} 条）")
+
+    with requests.Session() as session:
+        for page in range(1 if refresh else last_page + 1, max_pages + 1):
+            json_data = fetch_page(session, plate, year, page, limiter)
+            if json_data is None:
+                # 未标记完成，下次运行从该页继续（检查新披露时断点不变，下次重新检查）
+                print(f"⚠️ {plate} {year} 第{page}页多次失败，本次停止，下次从此页续采。")
+                return records
+
+            announcements = json_data.get("announcements") or []
+            parsed = [r for r in map(parse_announcement, announcements) if r]
+            # 翻页期间有新公告插入时，页面会整体后移，已采过的公告可能再次出现
+            new_records = [r for r in parsed if r['PDF链接'] not in seen]
+            reached_seen = len(new_records) < len(parsed)
+            seen.update(r['PDF链接'] for r in new_records)
+            if companies is not None:
+                new_records = companies.annotate(new_records)
+            records.extend(new_records)
+            rows += len(new_records)
+            finished = not announcements or json_data.get("hasMore") is False or page == max_pages
+            if refresh:
+                finished = finished or reached_seen
+                checkpoint.commit(new_records, last_page, rows, True)
+            else:
+                checkpoint.commit(new_records, page, rows, finished)
+            inc("pages", stage="crawl")
+            inc("records", len(new_records), stage="crawl")
+            if on_page is not None and new_records:
+                on_page(plate, year, new_records)
+            print(f"→ {plate} {year} 已获取第 {page} 页，共 {len(records)} 条")
+            if finished:
+                break
+    return records
+
+
+# ========== 多板块、多年份并发采集 ==========
+def crawl(plates, years, limiter, folder, workers=4, companies=None):
+    # 返回 {年份: [记录, ...]}，同一公告 ID 只保留首次出现（按年份、板块顺序）
+    tasks = [(year, plate) for year in years for plate in plates]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            task: executor.submit(crawl_plate_year, task[1], task[0], limiter, folder, companies=companies)
+            for task in tasks
+        }
+        results = {task: future.result() for task, future in futures.items()}
+
+    seen = set()
+    by_year = {year: [] for year in years}
+    for (year, plate) in tasks:
+        for record in results[(year, plate)]:
+            key = record.get('公告ID') or record['PDF链接']
+            if key in seen:
+                continue
+            seen.add(key)
+            by_year[year].append(record)
+    return by_year
@@ -0,0 +1,173 @@
+import re
+import time
+from collections import defaultdict
+import numpy as np
+from .corpus import document_stat, read_document
+from .manifest import parse_doc_name, split_doc_name
+
+# ===== 重复 / 修订年报检测（MinHash + LSH） =====
+# 标题过滤挡不住的重复上传、更正后重新披露，在文本层面几乎相同：
+#   - MinHash：去空白后的 5 字 shingle 集合压缩为 128 个最小哈希，两份签名相同位置相等的比例
+#     即 Jaccard 相似度的估计；抽取 PDF 时逐页累积计算，写入清单，之后不必重读文本
+#   - LSH：签名切成 32 段 × 4 行，同一公司代码下任一段完全相同的文档才成为候选对，按签名相似度复核，
+#     整年语料近似线性时间完成，不做两两比较。不同公司之间不比较：另一代码下的同文年报（如 A/B 股）
+#     是另一家公司的数据，不能当作重复丢掉
+# 每组近似重复只保留一份（公告 ID 最大即最新披露的一份，其次文本最长），其余记入清单 duplicates 表，
+# 04 / 05 / 流水线跳过。
+
+NUM_PERM = 128
+BANDS = 32
+SHINGLE_SIZE = 5
+THRESHOLD = 0.9  # 签名相似度达到此值判为重复
+MINHASH_VERSION = f"minhash-{NUM_PERM}x{SHINGLE_SIZE}-v1"  # 签名参数变化时修改，旧签名全部重算
+
+WHITESPACE = re.compile(r"\s+")
+_MAX = np.uint64(0xFFFFFFFF)
+_rng = np.random.default_rng(20240601)  # 固定种子：不同进程、不同次运行的签名可以比较
+_A = _rng.integers(1, 1 << 62, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 1 << 62, NUM_PERM, dtype=np.uint64)
+_BLOCK = 16  # 每次计算的置换个数，控制临时数组大小
+
+
+def _shingle_hashes(text):
+    # 全部 SHINGLE_SIZE 字子串的 64 位哈希（去重），以 numpy 向量运算完成
+    chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n = len(chars) - SHINGLE_SIZE + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(SHINGLE_SIZE):
+        h = h * np.uint64(1000003) + chars[j:j + n]
+    # splitmix64 末段混合，打散相近子串的哈希
+    h ^= h >> np.uint64(31)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(29)
+    return np.unique(h)
+
+
+class MinHasher:
+    # 逐段输入文本（如逐页），结果与对整篇去空白文本一次计算相同
+    def __init__(self):
+        self.mins = np.full(NUM_PERM, _MAX, dtype=np.uint64)
+        self.chars = 0
+        self._carry = ""
+        self._empty = True
+
+    def update(self, text):
+        text = WHITESPACE.sub("", text)
+        self.chars += len(text)
+        buf = self._carry + text
+        if len(buf) >= SHINGLE_SIZE:
+            hashes = _shingle_hashes(buf)
+            for i in range(0, NUM_PERM, _BLOCK):
+                a, b = _A[i:i + _BLOCK], _B[i:i + _BLOCK]
+                values = (hashes[:, None] * a + b) >> np.uint64(32)
+                self.mins[i:i + _BLOCK] = np.minimum(self.mins[i:i + _BLOCK], values.min(axis=0))
+            self._empty = False
+        self._carry = buf[-(SHINGLE_SIZE - 1):]
+
+    def hexdigest(self):
+        # 文本不足一个 shingle 时返回 None（不参与比较）
+        if self._empty:
+            return None
+        return self.mins.astype("<u4").tobytes().hex()
+
+
+def text_signature(text, chunk_size=1 << 16):
+    # 分段计算，临时数组大小与文档长度无关
+    hasher = MinHasher()
+    for i in range(0, len(text), chunk_size):
+        hasher.update(text[i:i + chunk_size])
+    return hasher.hexdigest(), hasher.chars
+
+
+def decode_signature(hexdigest):
+    return np.frombuffer(bytes.fromhex(hexdigest), dtype="<u4")
+
+
+def similarity(a, b):
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def lsh_candidates(signatures, bands=BANDS, group=None):
+    # signatures: {文档名: 签名数组}；同一段完全相同的文档两两成为候选对
+    # group(文档名) 给出分组键时只在组内配对（如同一公司代码）
+    rows = NUM_PERM // bands
+    buckets = defaultdict(list)
+    for doc, sig in signatures.items():
+        g = group(doc) if group is not None else None
+        for band in range(bands):
+            buckets[(g, band, sig[band * rows:(band + 1) * rows].tobytes())].append(doc)
+    pairs = set()
+    for docs in buckets.values():
+        for i in range(len(docs)):
+            for j in range(i + 1, len(docs)):
+                pairs.add((min(docs[i], docs[j]), max(docs[i], docs[j])))
+    return pairs
+
+
+def find_duplicates(signatures, rank, threshold=THRESHOLD, group=None):
+    # 返回 {重复文档: (保留的文档, 相似度)}；rank(文档名) 越小越优先保留
+    parent = {}
+
+    def root(doc):
+        while parent.get(doc, doc) != doc:
+            doc = parent[doc]
+        return doc
+
+    for a, b in sorted(lsh_candidates(signatures, group=group)):
+        if similarity(signatures[a], signatures[b]) >= threshold:
+            ra, rb = root(a), root(b)
+            if ra != rb:
+                parent[max(ra, rb, key=rank)] = min(ra, rb, key=rank)
+
+    duplicates = {}
+    for doc in parent:
+        canonical = root(doc)
+        if canonical != doc:
+            duplicates[doc] = (canonical, similarity(signatures[doc], signatures[canonical]))
+    return duplicates
+
+
+# ========== 按年份检测 ==========
+def store_signature(manifest, year, doc_name, stat, stats, commit=False):
+    # 抽取阶段（03 / 02 --extract / 流水线）登记 stats 中顺带算出的签名
+    manifest.set_signature(year, doc_name, stat, stats["chars"], stats["minhash"], MINHASH_VERSION, commit)
+
+
+def year_signatures(docs, manifest, year):
+    # 清单中已有（且文档未变化）的签名直接使用，缺失的读取文本补算；返回 {文档名: (签名, 字数)}
+    stored = manifest.signatures(year)
+    result = {}
+    for doc_name in docs.names():
+        ref = docs.ref(doc_name)
+        stat = document_stat(ref)
+        row = stored.get(doc_name)
+        if row is None or row["stat"] != stat or row["version"] != MINHASH_VERSION:
+            hexdigest, chars = text_signature(read_document(ref, errors="ignore"))
+            manifest.set_signature(year, doc_name, stat, chars, hexdigest, MINHASH_VERSION, commit=False)
+            row = {"minhash": hexdigest, "chars": chars}
+        if row["minhash"]:
+            result[doc_name] = (decode_signature(row["minhash"]), row["chars"])
+    manifest.commit()
+    return result
+
+
+def detect_year(docs, manifest, year, threshold=THRESHOLD):
+    # 检测一年的全部文档并写入清单，返回 {重复文档: (保留的文档, 相似度)}
+    start = time.perf_counter()
+    sigs = year_signatures(docs, manifest, year)
+    chars = {doc: n for doc, (_, n) in sigs.items()}
+
+    def rank(doc):
+        # 同一公司内保留最新披露的一份（更正后的版本）；旧文件名没有公告 ID，排在最后
+        ann_id = parse_doc_name(doc)[2]
+        return -int(ann_id or 0), -chars[doc], doc
+
+    duplicates = find_duplicates({doc: sig for doc, (sig, _) in sigs.items()}, rank=rank, threshold=threshold,
+                                 group=lambda doc: split_doc_name(doc)[0])
+    manifest.set_duplicates(year, duplicates)
+    if duplicates:
+        print(f"🔁 {year} 年检测到 {len(duplicates)} 份重复/修订年报（{len(sigs)} 份中，用时 "
+              f"{time.perf_counter() - start:.1f} 秒），已跳过：")
+        for doc, (canonical, sim) in sorted(duplicates.items()):
+            print(f"   {doc} ≈ {canonical}（相似度 {sim:.2f}）")
+    return duplicates
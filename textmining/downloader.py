@@ -0,0 +1,192 @@
+import os
+import time
+import random
+import asyncio
+import aiohttp
+from .metrics import inc, observe, timer
+
+# ===== 异步 PDF 下载器 =====
+# 单个连接池复用 TCP/TLS 连接；分块流式写入 .part 文件，完成后原子改名；
+# .part 残留时用 HTTP Range 续传；网络错误、429、5xx 按指数退避重试。
+# 传入 limiter（AdaptiveRateLimiter）时，请求发出速率与并发数由其自适应控制。
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+                  "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15",
+    "Accept": "application/pdf",
+    "Referer": "https://www.cninfo.com.cn/",
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    pass
+
+
+class IncompleteError(RetryableError):
+    # 数据被截断：多为服务器或链路过载，按限流信号反馈给限速器
+    pass
+
+
+class InvalidResponse(Exception):
+    # 返回的不是 PDF（多为反爬页面或错误页），不重试
+    pass
+
+
+# ========== 链接修正（02 / 流水线共用） ==========
+def build_url(link):
+    link = str(link).strip()
+    # 修正链接拼接
+    link = link.replace("cninfo.com.cnhttp", "cninfo.com.cn")
+    link = link.replace("http://", "https://")
+    return link if link.startswith("http") else "https://static.cninfo.com.cn" + link
+
+
+class AsyncDownloader:
+    def __init__(self, concurrency=12, per_host=6, retries=4, backoff=1.0, max_backoff=30.0,
+                 timeout=60, chunk_size=64 * 1024, headers=None, limiter=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=timeout)
+        self.chunk_size = chunk_size
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.limiter = limiter
+        self.session = None
+        self._dest_locks = {}  # 目标路径 -> [锁, 使用中的任务数]；无任务使用时删除
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def backoff_delay(self, attempt):
+        # 指数退避 + 随机抖动，避免所有任务同时重试
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def fetch(self, url, dest):
+        result = {"url": url, "path": dest, "status": None, "http_status": None,
+                  "bytes": 0, "attempts": 0, "resumed": False, "error": None, "seconds": 0.0}
+        # 目标文件相同的任务串行执行，避免并发写同一个 .part
+        entry = self._dest_locks.setdefault(dest, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if os.path.exists(dest):
+                    result["status"] = "exists"
+                    return result
+                start = time.perf_counter()
+                try:
+                    return await self._fetch(url, dest, result)
+                finally:
+                    result["seconds"] = time.perf_counter() - start
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._dest_locks[dest]
+
+    async def _fetch(self, url, dest, result):
+        for attempt in range(self.retries + 1):
+            result["attempts"] = attempt + 1
+            result["http_status"] = None
+            try:
+                # 并发名额按次占用：退避等待期间释放，限流时名额留给其他任务
+                async with self._slots:
+                    await self._limited_attempt(url, dest, result)
+                self._report(result["http_status"])
+                return result
+            except InvalidResponse as e:
+                result["status"] = "invalid"
+                result["error"] = str(e)
+                self._report(result["http_status"], e)
+                return result
+            except (RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result["error"] = str(e) or type(e).__name__
+                throttled = not isinstance(e, RetryableError) or isinstance(e, IncompleteError)
+                self._report(result["http_status"], e if throttled else None)
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff_delay(attempt))
+            except OSError as e:
+                # 本地文件错误（磁盘已满、权限、.part 被外部改动等）只让本任务失败
+                result["error"] = str(e) or type(e).__name__
+                break
+        result["status"] = "failed"
+        return result
+
+    def _report(self, status, error=None):
+        inc("http_responses", stage="download", status=status if error is None else type(error).__name__)
+        if self.limiter is not None:
+            self.limiter.report(status=status, error=error)
+
+    async def _limited_attempt(self, url, dest, result):
+        if self.limiter is None:
+            with timer("http_request", stage="download"):
+                return await self._attempt(url, dest, result)
+        start = time.perf_counter()
+        async with self.limiter.async_slot():
+            await self.limiter.acquire_async()
+            observe("rate_limit_wait", time.perf_counter() - start, stage="download")
+            with timer("http_request", stage="download"):
+                return await self._attempt(url, dest, result)
+
+    async def _attempt(self, url, dest, result):
+        part = dest + ".part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+
+        async with self.session.get(url, headers=headers) as r:
+            result["http_status"] = r.status
+            if r.status == 416:
+                # 续传区间无效（服务器文件已变化等）：丢弃 .part 从头下载
+                os.remove(part)
+                raise RetryableError("HTTP 416，重新下载")
+            if r.status in RETRY_STATUS:
+                raise RetryableError(f"HTTP {r.status}")
+            content_type = r.headers.get("Content-Type", "")
+            if r.status not in (200, 206) or "application/pdf" not in content_type:
+                raise InvalidResponse(f"HTTP {r.status} {content_type}".strip())
+
+            mode = "wb"
+            if r.status == 206:
+                start = r.headers.get("Content-Range", "").replace("bytes ", "").split("-")[0]
+                if start == str(offset):
+                    mode = "ab"
+                    result["resumed"] = True
+                else:
+                    # 服务器返回的区间与本地进度不符，从头再来
+                    os.remove(part)
+                    raise RetryableError("Content-Range 与本地进度不符")
+
+            with open(part, mode) as f:
+                async for chunk in r.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+
+            expected = r.content_length
+            written = os.path.getsize(part)
+            if expected is not None and written - (offset if mode == "ab" else 0) < expected:
+                raise IncompleteError("连接中断，数据不完整")
+
+        os.replace(part, dest)
+        result["bytes"] = written
+        result["status"] = "ok"
+
+
+async def download_all(jobs, on_result=None, **options):
+    # jobs 为 (url, dest) 列表；每完成一个就回调 on_result(result)
+    results = []
+    async with AsyncDownloader(**options) as downloader:
+        tasks = [asyncio.ensure_future(downloader.fetch(url, dest)) for url, dest in jobs]
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
@@ -0,0 +1,89 @@
+import numpy as np
+from scipy import sparse
+
+# ===== 文档-词项稀疏矩阵 =====
+# 每年构建一次：行 = 年报（公司代码），列 = 关键词词表，CSR 存储。
+# 关键词组合计、Trust_Index、标准化词频以及新指标都化为矩阵-向量运算：
+#   组合计 = M @ g（g 为该组关键词的指示向量）
+#   指数   = (M @ w) / 文档长度
+
+
+class DocTermMatrix:
+    def __init__(self, docs, terms, matrix, lengths, versions=None):
+        self.docs = list(docs)
+        self.terms = list(terms)
+        self.term_index = {t: i for i, t in enumerate(self.terms)}
+        self.doc_index = {d: i for i, d in enumerate(self.docs)}
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        # 每行对应的 TXT 哈希，用于判断矩阵是否仍然有效
+        self.versions = list(versions) if versions is not None else [""] * len(self.docs)
+
+    @classmethod
+    def from_counts(cls, docs, terms, rows, lengths, versions=None):
+        # rows: 与 docs 对齐的 {词: 次数} 列表
+        term_index = {t: i for i, t in enumerate(terms)}
+        indptr = [0]
+        indices = []
+        data = []
+        for row in rows:
+            for t, n in row.items():
+                j = term_index.get(t)
+                if j is not None and n:
+                    indices.append(j)
+                    data.append(n)
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.int64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(docs), len(terms)),
+        )
+        matrix.sum_duplicates()
+        return cls(docs, terms, matrix, lengths, versions)
+
+    # ---- 向量运算 ----
+    def term_vector(self, words, weights=None):
+        # 词列表 -> 列空间上的权重向量；重复出现的词按出现次数累加（与逐词求和一致）
+        v = np.zeros(len(self.terms), dtype=np.float64 if weights is not None else np.int64)
+        for k, w in enumerate(words):
+            j = self.term_index.get(w)
+            if j is not None:
+                v[j] += weights[k] if weights is not None else 1
+        return v
+
+    def weighted_sum(self, words, weights=None):
+        return self.matrix @ self.term_vector(words, weights)
+
+    def group_totals(self, groups):
+        # groups: {组名: [词, ...]} -> {组名: 每篇文档的合计数组}，一次稀疏矩阵乘法完成
+        names = list(groups)
+        g = np.stack([self.term_vector(groups[n]) for n in names], axis=1) if names else np.zeros((len(self.terms), 0))
+        totals = self.matrix @ g
+        return {n: totals[:, k] for k, n in enumerate(names)}
+
+    def rates(self, words, weights=None):
+        # 每篇文档中 words 的出现次数 / 文档长度；长度为 0 时记 0
+        hits = self.weighted_sum(words, weights)
+        out = np.zeros(len(self.docs), dtype=np.float64)
+        nz = self.lengths > 0
+        out[nz] = hits[nz] / self.lengths[nz]
+        return out
+
+    def column_totals(self, words=None):
+        totals = np.asarray(self.matrix.sum(axis=0)).ravel()
+        words = self.terms if words is None else words
+        return {w: int(totals[self.term_index[w]]) if w in self.term_index else 0 for w in words}
+
+    # ---- 读写 ----
+    def save(self, path):
+        m = self.matrix
+        np.savez_compressed(
+            path, data=m.data, indices=m.indices, indptr=m.indptr, shape=np.asarray(m.shape),
+            docs=np.asarray(self.docs, dtype=str), terms=np.asarray(self.terms, dtype=str),
+            lengths=self.lengths, versions=np.asarray(self.versions, dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            matrix = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            return cls(f["docs"].tolist(), f["terms"].tolist(), matrix, f["lengths"], f["versions"].tolist())
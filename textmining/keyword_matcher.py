@@ -0,0 +1,87 @@
+import re
+import json
+import hashlib
+
+# ===== 多模式关键词匹配器 =====
+# 一次扫描统计全部关键词（关键词组 + 信任词），计数语义与
+# re.sub(r"\s+", "", text) 之后逐个 text.count(w) 完全一致：
+#   - 不同关键词之间可以重叠（"数据安全" 同时计入 "安全"）
+#   - 同一关键词自身不重叠、从左到右计数（str.count 的规则）
+#
+# 自动机编译为一个 re 前瞻模式，由 C 实现的正则引擎完成扫描：
+# 按长度降序排列的分支保证每个位置命中“以此处开头的最长关键词”，
+# 其余以此处开头的关键词必然是它的前缀，建表时预先展开即可。
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def _has_border(word):
+    # 是否存在既是真前缀又是真后缀的子串（如 "abab"），此类关键词可能自身重叠
+    return any(word[:i] == word[-i:] for i in range(1, len(word)))
+
+
+class KeywordMatcher:
+    def __init__(self, keyword_groups, trust_words=()):
+        self.keyword_groups = {g: list(ws) for g, ws in keyword_groups.items()}
+        self.trust_words = list(trust_words)
+        all_words = [w for ws in self.keyword_groups.values() for w in ws] + self.trust_words
+        self.keywords = [w for w in dict.fromkeys(all_words) if w]
+        self.max_len = max((len(w) for w in self.keywords), default=0)
+        # 词典指纹：关键词组或信任词有任何变化，统计结果都需要重算
+        self.fingerprint = hashlib.sha256(json.dumps(
+            {"groups": self.keyword_groups, "trust": self.trust_words},
+            ensure_ascii=False, sort_keys=True,
+        ).encode("utf-8")).hexdigest()
+
+        ordered = sorted(self.keywords, key=len, reverse=True)
+        alternation = "|".join(re.escape(w) for w in ordered) or "(?!)"
+        self._pattern = re.compile(f"(?=({alternation}))")
+        # 最长命中词 -> 同一位置上一并命中的全部关键词（其自身及其关键词前缀）
+        self._implied = {
+            w: [p for p in self.keywords if w.startswith(p)] for w in self.keywords
+        }
+        self._overlapping = {w for w in self.keywords if _has_border(w)}
+
+    def strip(self, text):
+        return WHITESPACE.sub("", text)
+
+    def scan(self, text, start=0, end=None, next_allowed=None):
+        # 在已去除空白的文本上扫描，返回 {关键词: 次数}
+        # start/end 限定“匹配起点”所在区间；next_allowed 记录自身重叠词的下一个可计数位置，
+        # 供分块扫描时跨块延续 str.count 的不重叠规则
+        if end is None:
+            end = len(text)
+        if next_allowed is None:
+            next_allowed = {}
+        counts = dict.fromkeys(self.keywords, 0)
+        for m in self._pattern.finditer(text, start):
+            pos = m.start()
+            if pos >= end:
+                break
+            for w in self._implied[m.group(1)]:
+                if w in self._overlapping:
+                    if pos < next_allowed.get(w, 0):
+                        continue
+                    next_allowed[w] = pos + len(w)
+                counts[w] += 1
+        return counts
+
+    def summarize(self, keyword_counts):
+        # 由逐词计数汇总出各关键词组与信任词的合计
+        groups = {
+            g: sum(keyword_counts[w] for w in ws if w)
+            for g, ws in self.keyword_groups.items()
+        }
+        trust = sum(keyword_counts[w] for w in self.trust_words if w)
+        return groups, trust
+
+    def count(self, text):
+        text = self.strip(text)
+        keyword_counts = self.scan(text)
+        groups, trust = self.summarize(keyword_counts)
+        return {
+            "keywords": keyword_counts,
+            "groups": groups,
+            "trust": trust,
+            "chars": len(text),
+        }
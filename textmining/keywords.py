@@ -0,0 +1,63 @@
+import os
+import json
+import hashlib
+import jieba
+from .keyword_matcher import KeywordMatcher
+
+# ===== 关键词词典（04 / 05 / 流水线共用） =====
+# 关键词组与信任词写在仓库根目录的 关键词词典.json 中：
+#   {"keyword_groups": {"区块链相关": ["区块链", ...], ...}, "trust_words": ["可信", ...]}
+# 加载时只编译一次匹配器，并按内容计算版本哈希：
+#   - version：统计结果的版本（关键词组、信任词或计数规则变化），写入清单 dict_hash，变化时重新统计
+#   - segmenter_version：jieba 自定义词的版本，记录在分词缓存中
+# 新增关键词时不必重新分词：已有分词缓存中被切开的关键词按相邻词拼接计数（见 token_cache.term_plan）。
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "关键词词典.json")
+COUNT_VERSION = 2  # 分词计数规则变化时加一（2：关键词注册为 jieba 自定义词，按相邻词拼接计数）
+
+
+def register_jieba(words):
+    # 把关键词注册为 jieba 自定义词，使其整体切出；每个进程分词前调用一次
+    for w in words:
+        jieba.add_word(w)
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class KeywordDictionary:
+    def __init__(self, path=DICTIONARY_PATH):
+        self.path = path
+        self.version = None
+        self._stat = None
+        self.reload()
+
+    def reload(self):
+        # 配置文件变化时重新加载并重新编译匹配器；返回词典内容是否有变化
+        st = os.stat(self.path)
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._stat:
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            config = json.load(f)
+        self._stat = stat
+        matcher = KeywordMatcher(config["keyword_groups"], config.get("trust_words", []))
+        version = _digest({"matcher": matcher.fingerprint, "count": COUNT_VERSION})
+        if version == self.version:
+            return False
+        self.matcher = matcher
+        self.keyword_groups = matcher.keyword_groups
+        self.trust_words = matcher.trust_words
+        self.keywords = matcher.keywords
+        # 扁平化的关键词组词表（不含信任词），05 词频统计与图表使用
+        self.group_keywords = [w for group in self.keyword_groups.values() for w in group]
+        self.version = version
+        self.segmenter_version = _digest({"jieba": jieba.__version__, "words": sorted(self.keywords)})
+        return True
+
+    def register_jieba(self):
+        register_jieba(self.keywords)
+
+
+dictionary = KeywordDictionary()  # 词典内容可能被 reload() 替换：使用时读取 dictionary.*，不要另存别名
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# ===== 流水线清单（manifest） =====
+# 每个 BASE_DIR 一个 SQLite 文件，按（公司代码, 年份, 公告ID）记录各阶段的输入指纹与结果：
+#   链接 → PDF 哈希 → TXT 哈希（及其来源 PDF、抽取器版本）→ 关键词词典哈希与统计结果
+# 各阶段只重做输入发生变化的部分。文件哈希以 (大小, mtime) 缓存，未变化的文件不重复读取。
+
+MANIFEST_NAME = "manifest.sqlite"
+
+COLUMNS = {
+    "name": "TEXT",
+    "link": "TEXT",
+    "pdf_stat": "TEXT",
+    "pdf_sha256": "TEXT",
+    "txt_stat": "TEXT",
+    "txt_sha256": "TEXT",
+    "txt_source_pdf": "TEXT",     # 生成该 TXT 的 PDF 哈希
+    "extractor_version": "TEXT",
+    "dict_hash": "TEXT",          # 统计所用关键词词典的哈希
+    "counts_txt": "TEXT",         # 统计所用 TXT 的哈希
+    "counts": "TEXT",             # JSON：关键词组计数、总字数、Trust_Index 等
+    "updated_at": "REAL",
+}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stat(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def parse_doc_name(filename):
+    # "000001_平安银行_1216341234.pdf" -> ("000001", "平安银行", "1216341234")
+    # 同一公司同一年可能有多份年报（更正后重新披露），文件名带公告 ID 区分；旧文件名没有公告 ID，返回 ""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    code, rest = stem.split("_", 1)
+    name, sep, ann_id = rest.rpartition("_")
+    if sep and ann_id.isdigit():
+        return code, name, ann_id
+    return code, rest, ""
+
+
+def split_doc_name(filename):
+    # "000001_平安银行.pdf" / "000001_平安银行_1216341234.pdf" -> ("000001", "平安银行")
+    code, name, _ = parse_doc_name(filename)
+    return code, name
+
+
+def doc_filename(code, name, ann_id="", ext=".pdf"):
+    return f"{code}_{name}_{ann_id}{ext}" if ann_id else f"{code}_{name}{ext}"
+
+
+def doc_key(filename):
+    # 语料库、分词缓存等按文档建的索引键："000001_1216341234"；旧文件名为公司代码 "000001"
+    code, _, ann_id = parse_doc_name(filename)
+    return f"{code}_{ann_id}" if ann_id else code
+
+
+class Manifest:
+    def __init__(self, base_dir, filename=MANIFEST_NAME):
+        self.path = os.path.join(base_dir, filename)
+        # 流水线中多个阶段线程共用一个连接，由锁串行化访问
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.row_factory = sqlite3.Row
+        cols = ", ".join(f"{c} {t}" for c, t in COLUMNS.items())
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS documents "
+            f"(code TEXT NOT NULL, year INTEGER NOT NULL, ann_id TEXT NOT NULL DEFAULT '', {cols}, "
+            f"PRIMARY KEY (code, year, ann_id))"
+        )
+        # 近似重复检测（textmining/dedup.py）：按文档名记录 MinHash 签名与判定结果，
+        # 同一公司同一年可能有多份文档，因此不放在 documents 表中
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures "
+            "(year INTEGER NOT NULL, doc TEXT NOT NULL, stat TEXT, chars INTEGER, minhash TEXT, version TEXT, "
+            "PRIMARY KEY (year, doc))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS duplicates "
+            "(year INTEGER NOT NULL, doc TEXT NOT NULL, canonical TEXT NOT NULL, similarity REAL, detected_at REAL, "
+            "PRIMARY KEY (year, doc))"
+        )
+        # TXT 模式的页边界（textmining/position_index.py）：JSON [[原页码, 起始字符位置], ...]，
+        # stat 为抽取时 TXT 的 (大小, mtime)，TXT 改动后作废；语料库模式的页边界记录在语料库索引中
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages "
+            "(year INTEGER NOT NULL, doc TEXT NOT NULL, stat TEXT, breaks TEXT, PRIMARY KEY (year, doc))"
+        )
+        # 兼容旧清单：补齐后来新增的列
+        existing = {r["name"] for r in self.conn.execute("PRAGMA table_info(documents)")}
+        for c, t in COLUMNS.items():
+            if c not in existing:
+                self.conn.execute(f"ALTER TABLE documents ADD COLUMN {c} {t}")
+        if "ann_id" not in existing:
+            # 旧清单主键为（公司代码, 年份）：重建表，原有记录的公告 ID 为空（对应不带公告 ID 的旧文件名）
+            names = ", ".join(COLUMNS)
+            self.conn.execute("ALTER TABLE documents RENAME TO documents_old")
+            self.conn.execute(
+                f"CREATE TABLE documents (code TEXT NOT NULL, year INTEGER NOT NULL, ann_id TEXT NOT NULL DEFAULT '', "
+                f"{cols}, PRIMARY KEY (code, year, ann_id))"
+            )
+            self.conn.execute(f"INSERT INTO documents (code, year, {names}) SELECT code, year, {names} FROM documents_old")
+            self.conn.execute("DROP TABLE documents_old")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def get(self, code, year, ann_id=""):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM documents WHERE code = ? AND year = ? AND ann_id = ?", (str(code), int(year), str(ann_id))
+            ).fetchone()
+        if row is None:
+            return {}
+        row = dict(row)
+        if row.get("counts"):
+            row["counts"] = json.loads(row["counts"])
+        return row
+
+    def rows(self, year):
+        with self._lock:
+            cur = self.conn.execute("SELECT * FROM documents WHERE year = ? ORDER BY code, ann_id", (int(year),))
+            rows = cur.fetchall()
+        for row in rows:
+            row = dict(row)
+            if row.get("counts"):
+                row["counts"] = json.loads(row["counts"])
+            yield row
+
+    def get_doc(self, doc_name, year):
+        # 按文件名查记录（公司代码 + 公告 ID）
+        code, _, ann_id = parse_doc_name(doc_name)
+        return self.get(code, year, ann_id)
+
+    def update(self, code, year, commit=True, ann_id="", **fields):
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise KeyError(f"未知的清单字段: {sorted(unknown)}")
+        if "counts" in fields and not isinstance(fields["counts"], (str, type(None))):
+            fields["counts"] = json.dumps(fields["counts"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        names = list(fields)
+        with self._lock:
+            self.conn.execute(
+                f"INSERT INTO documents (code, year, ann_id, {', '.join(names)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in names)}) "
+                f"ON CONFLICT (code, year, ann_id) DO UPDATE SET "
+                f"{', '.join(f'{n} = excluded.{n}' for n in names)}",
+                [str(code), int(year), str(ann_id)] + [fields[n] for n in names],
+            )
+            if commit:
+                self.conn.commit()
+
+    def update_doc(self, doc_name, year, commit=True, **fields):
+        # 按文件名登记：公司代码、公司简称、公告 ID 均取自文件名
+        code, name, ann_id = parse_doc_name(doc_name)
+        fields.setdefault("name", name)
+        self.update(code, year, commit=commit, ann_id=ann_id, **fields)
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    # ---- 近似重复 ----
+    def signatures(self, year):
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM signatures WHERE year = ?", (int(year),)).fetchall()
+        return {r["doc"]: dict(r) for r in rows}
+
+    def set_signature(self, year, doc, stat, chars, minhash, version, commit=True):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO signatures (year, doc, stat, chars, minhash, version) VALUES (?, ?, ?, ?, ?, ?)",
+                (int(year), doc, stat, chars, minhash, version),
+            )
+            if commit:
+                self.conn.commit()
+
+    def duplicates(self, year):
+        # {重复文档名: 保留的文档名}
+        with self._lock:
+            rows = self.conn.execute("SELECT doc, canonical FROM duplicates WHERE year = ?", (int(year),)).fetchall()
+        return {r["doc"]: r["canonical"] for r in rows}
+
+    def set_duplicates(self, year, duplicates):
+        # 以本次检测结果整体替换该年的记录；duplicates: {文档名: (保留的文档名, 相似度)}
+        now = time.time()
+        with self._lock:
+            self.conn.execute("DELETE FROM duplicates WHERE year = ?", (int(year),))
+            self.conn.executemany(
+                "INSERT INTO duplicates (year, doc, canonical, similarity, detected_at) VALUES (?, ?, ?, ?, ?)",
+                [(int(year), doc, canonical, sim, now) for doc, (canonical, sim) in duplicates.items()],
+            )
+            self.conn.commit()
+
+    # ---- 页边界 ----
+    def page_breaks(self, year):
+        # {文档名: (stat, 页边界)}
+        with self._lock:
+            rows = self.conn.execute("SELECT doc, stat, breaks FROM pages WHERE year = ?", (int(year),)).fetchall()
+        return {r["doc"]: (r["stat"], json.loads(r["breaks"])) for r in rows}
+
+    def set_page_breaks(self, year, doc, stat, breaks, commit=True):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (year, doc, stat, breaks) VALUES (?, ?, ?, ?)",
+                (int(year), doc, stat, json.dumps(breaks)),
+            )
+            if commit:
+                self.conn.commit()
+
+    def fingerprint(self, path, row, kind):
+        # 返回 (stat, sha256)；文件大小与 mtime 未变时直接沿用清单中的哈希
+        stat = file_stat(path)
+        if row.get(f"{kind}_stat") == stat and row.get(f"{kind}_sha256"):
+            return stat, row[f"{kind}_sha256"]
+        return stat, file_sha256(path)
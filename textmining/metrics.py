@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
+
+# ===== 运行指标与性能剖析 =====
+# 进程内的指标登记表（线程安全）：
+#   - 计数器：inc("http_responses", stage="download", status="200")
+#   - 计时器：with timer("phase", stage="04", phase="excel"): ...（记录次数、总时长、最长一次）
+#   - 单篇记录：record("convert", "000001_平安银行.pdf", seconds=..., pages=..., bytes=...)
+# 工作进程中的耗时与字节数随结果一起返回，由主进程调用 record() 登记。
+# 运行结束时 dump() 输出为 Prometheus 文本格式（.prom）或 JSON lines（其他扩展名）。
+
+PREFIX = "textmining_"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> 数值
+        self.timers = {}    # (name, labels) -> [次数, 总秒数, 最长秒数]
+        self.docs = []      # 单篇记录
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self.timers.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def record(self, stage, doc, **fields):
+        # 单篇记录，同时计入该阶段的计时器与字节、页数等计数器
+        entry = {"stage": stage, "doc": doc}
+        entry.update(fields)
+        with self._lock:
+            self.docs.append(entry)
+        if fields.get("seconds") is not None:
+            self.observe("document", fields["seconds"], stage=stage)
+        for field in ("bytes", "pages", "tokens", "retries"):
+            if fields.get(field):
+                self.inc(field, fields[field], stage=stage)
+        if fields.get("status") not in (None, "ok", "exists", "skipped", "valid"):
+            self.inc("failures", stage=stage, status=fields["status"])
+
+    def slowest(self, stage, n=10):
+        docs = [d for d in self.docs if d["stage"] == stage and d.get("seconds") is not None]
+        return sorted(docs, key=lambda d: d["seconds"], reverse=True)[:n]
+
+    # ---- 输出 ----
+    def to_prometheus(self):
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{PREFIX}{name}_total{_format_labels(labels)} {value}")
+        for (name, labels), (count, total, longest) in sorted(self.timers.items()):
+            metric = f"{PREFIX}{name}_seconds"
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_max{_format_labels(labels)} {longest:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def iter_json(self):
+        for (name, labels), value in sorted(self.counters.items()):
+            yield {"type": "counter", "name": name, "labels": dict(labels), "value": value}
+        for (name, labels), (count, total, longest) in sorted(self.timers.items()):
+            yield {"type": "timer", "name": name, "labels": dict(labels),
+                   "count": count, "sum": total, "max": longest}
+        for doc in self.docs:
+            yield dict(doc, type="document")
+
+    def dump(self, path):
+        # .prom：Prometheus 文本格式（单篇记录另存为同名 .docs.jsonl）；其他：全部写为 JSON lines
+        if path.endswith(".prom"):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            if self.docs:
+                with open(path[:-5] + ".docs.jsonl", "w", encoding="utf-8") as f:
+                    for doc in self.docs:
+                        f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            for item in self.iter_json():
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def report(self, n=5):
+        # 终端摘要：各计时器总耗时，以及每个阶段最慢的 n 篇
+        if self.timers:
+            print("⏱️ 耗时统计：")
+            for (name, labels), (count, total, longest) in sorted(
+                    self.timers.items(), key=lambda kv: kv[1][1], reverse=True):
+                label_text = ",".join(f"{k}={v}" for k, v in labels)
+                print(f"  {name}[{label_text}]: {total:.2f} 秒 / {count} 次（最长 {longest:.2f} 秒）")
+        for stage in sorted({d["stage"] for d in self.docs}):
+            slowest = self.slowest(stage, n)
+            if slowest:
+                print(f"🐢 {stage} 最慢的 {len(slowest)} 篇：" +
+                      "，".join(f"{d['doc']} {d['seconds']:.2f} 秒" for d in slowest))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+# 进程级默认登记表，库代码与脚本共用
+metrics = Metrics()
+inc = metrics.inc
+observe = metrics.observe
+timer = metrics.timer
+record = metrics.record
+
+
+def finish(path=None, n=5):
+    # 脚本结束时调用：打印摘要，并按需写出指标文件
+    metrics.report(n)
+    if path:
+        metrics.dump(path)
+        print(f"📊 运行指标已保存：{path}")
+
+
+# ========== cProfile 钩子 ==========
+class Profiled:
+    # 可序列化的包装：在进程池的工作进程内对每次调用做 cProfile，
+    # 同一进程的结果累积，进程退出时写入一次 {out_dir}/{tag}-{pid}.prof（可用 snakeviz / pstats 查看）。
+    # 只用于子进程；主进程用 profile_main，两者同时启用会互相覆盖
+    def __init__(self, fn, out_dir, tag):
+        self.fn = fn
+        self.out_dir = out_dir
+        self.tag = tag
+
+    def __call__(self, *args, **kwargs):
+        profile = _worker_profile(self.out_dir, self.tag)
+        profile.enable()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            profile.disable()
+
+
+_profiles = {}  # 输出路径（含进程号）-> cProfile.Profile；fork 继承来的条目属于父进程，不会重复写出
+
+
+def _worker_profile(out_dir, tag):
+    # 每个进程、每个 tag 一个 Profile，首次调用时登记退出时写出：
+    # 进程池工作进程正常退出时 multiprocessing 执行 Finalize（atexit 在工作进程中不执行），主进程中随 atexit 执行
+    path = os.path.join(out_dir, f"{tag}-{os.getpid()}.prof")
+    profile = _profiles.get(path)
+    if profile is None:
+        profile = _profiles[path] = cProfile.Profile()
+        Finalize(None, _dump_profile, args=(profile, path), exitpriority=10)
+    return profile
+
+
+def _dump_profile(profile, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profile.dump_stats(path)
+
+
+def profiled(fn, out_dir, tag):
+    # out_dir 为 None 时原样返回，不增加任何开销
+    return Profiled(fn, out_dir, tag) if out_dir else fn
+
+
+@contextmanager
+def profile_main(out_dir, tag):
+    # 对主进程整体做 cProfile
+    if not out_dir:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{tag}-main.prof")
+        profile.dump_stats(path)
+        print(f"🔬 主进程剖析结果：{path}")
@@ -0,0 +1,43 @@
+import os
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  pandas 写 Parquet 的引擎
+except ImportError:  # 只输出 xlsx 时不需要 pyarrow
+    pyarrow = None
+
+# ===== 公司×年份面板数据 =====
+# 把各年度的词频统计表与可信度指数表合并为一张长表（每行一个公司-年份），
+# 附上行业信息，写为 Parquet（可选另存 xlsx），供回归分析直接读取。
+
+
+def panel_path(base_dir, years):
+    return os.path.join(base_dir, f"面板数据_{min(years)}-{max(years)}.parquet")
+
+
+def build_panel(year_tables, companies=None):
+    # year_tables: {年份: (词频统计表, 可信度指数表)}，两表行顺序一致（均按公司代码排序）
+    # companies: CompanyIndex，按公司代码查行业
+    frames = []
+    for year in sorted(year_tables):
+        df, trust_df = year_tables[year]
+        frame = df.copy()
+        frame.insert(1, "年份", year)
+        frame["Trust_Index"] = trust_df["Trust_Index"].to_numpy()
+        frames.append(frame)
+    panel = pd.concat(frames, ignore_index=True)
+    panel["行业"] = panel["公司代码"].map(companies.industry) if companies is not None else None
+    return panel.sort_values(["公司代码", "年份"], ignore_index=True)
+
+
+def save_panel(panel, path, xlsx=False):
+    if pyarrow is None:
+        raise ImportError("写入 Parquet 需要 pyarrow：pip install pyarrow")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    panel.to_parquet(path, index=False)
+    paths = [path]
+    if xlsx:
+        xlsx_path = os.path.splitext(path)[0] + ".xlsx"
+        panel.to_excel(xlsx_path, index=False)
+        paths.append(xlsx_path)
+    return paths
@@ -0,0 +1,397 @@
+import os
+import time
+import queue
+import signal
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, as_completed
+from multiprocessing.connection import wait
+import fitz  # PyMuPDF
+from .corpus import encode_pages
+from .dedup import MinHasher
+from .manifest import file_sha256, file_stat
+from .metrics import profiled
+
+# ===== PDF 文本抽取 =====
+MIN_PAGE_CHARS = 30  # 跳过空页或图片页
+EXTRACTOR_VERSION = "pymupdf-text-v1"  # 抽取规则变化时需同步修改
+KILL_GRACE = 10  # 工作进程内的超时未能生效时，父进程额外等待的秒数，之后强制结束该进程
+
+
+class ConversionTimeout(Exception):
+    pass
+
+
+def iter_pages(doc):
+    # 逐页产出保留下来的 (原页码, 页面文本)，不在内存中拼接整篇文档
+    for page_no, page in enumerate(doc, 1):
+        page_text = page.get_text("text").strip()
+        if len(page_text) > MIN_PAGE_CHARS:
+            yield page_no, page_text
+
+
+def iter_page_texts(doc):
+    for _, page_text in iter_pages(doc):
+        yield page_text
+
+
+def pdf_bytes_to_text(data):
+    # 内存中的 PDF（如评分服务收到的上传）抽取为文本，内容与 pdf_to_txt 写出的 TXT 相同
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return "".join(page_text + "\n" for page_text in iter_page_texts(doc))
+
+
+def _raise_timeout(signum, frame):
+    raise ConversionTimeout("转换超时")
+
+
+class _Deadline:
+    # 单文件超时：可用时借助 SIGALRM 打断卡住的解析，否则（如 Windows 或非主线程）退化为逐页检查。
+    # 两者都打断不了卡在 MuPDF C 调用里的解析，最终由 ExtractionPool 在父进程计时并结束工作进程
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires = time.monotonic() + timeout if timeout else None
+        self.use_alarm = False
+
+    def __enter__(self):
+        if self.timeout and hasattr(signal, "SIGALRM"):
+            try:
+                self.previous = signal.signal(signal.SIGALRM, _raise_timeout)
+                signal.setitimer(signal.ITIMER_REAL, self.timeout)
+                self.use_alarm = True
+            except ValueError:
+                pass
+        return self
+
+    def check(self):
+        if self.expires is not None and time.monotonic() > self.expires:
+            raise ConversionTimeout("转换超时")
+
+    def __exit__(self, *exc):
+        if self.use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous)
+        return False
+
+
+def _write_pages(doc, txt_path, stats, deadline):
+    # 逐页写入 txt_path.part，完成后原子改名；没有有效页面时不生成文件。
+    # 同时逐页累积 MinHash 签名，并记录页边界 [[原页码, 起始字符位置], ...]（与语料库索引中的 pages 相同）
+    part_path = txt_path + ".part"
+    hasher = MinHasher()
+    pos = 0
+    try:
+        with open(part_path, "w", encoding="utf-8") as f:
+            for page_no, page_text in iter_pages(doc):
+                f.write(page_text + "\n")
+                hasher.update(page_text)
+                stats["page_breaks"].append([page_no, pos])
+                pos += len(page_text) + 1
+                stats["pages_kept"] += 1
+                deadline.check()
+        stats["minhash"], stats["chars"] = hasher.hexdigest(), hasher.chars
+        if stats["pages_kept"]:
+            os.replace(part_path, txt_path)
+            stats["bytes_out"] = os.path.getsize(txt_path)
+        else:
+            stats["status"] = "empty"
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def pdf_to_txt(pdf_path, txt_path, timeout=None):
+    stats = {
+        "pdf": pdf_path, "status": "ok", "error": None,
+        "pages": 0, "pages_kept": 0,
+        "bytes_in": 0, "bytes_out": 0,
+        "minhash": None, "chars": 0, "page_breaks": [],
+    }
+    start = time.perf_counter()
+    try:
+        stats["bytes_in"] = os.path.getsize(pdf_path)
+        with _Deadline(timeout) as deadline, fitz.open(pdf_path) as doc:
+            stats["pages"] = len(doc)
+            _write_pages(doc, txt_path, stats, deadline)
+    except ConversionTimeout as e:
+        stats["status"], stats["error"] = "timeout", str(e)
+    except Exception as e:
+        stats["status"], stats["error"] = "failed", str(e)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def pdf_to_frame(pdf_path, timeout=None):
+    # 语料库模式：抽取后直接在工作进程内压缩，stats["frame"] 为 (压缩帧, 原始字节数, sha256, 页边界)
+    stats = {
+        "pdf": pdf_path, "status": "ok", "error": None,
+        "pages": 0, "pages_kept": 0,
+        "bytes_in": 0, "bytes_out": 0, "frame": None,
+        "minhash": None, "chars": 0,
+    }
+    start = time.perf_counter()
+    try:
+        stats["bytes_in"] = os.path.getsize(pdf_path)
+        pages = []
+        hasher = MinHasher()
+        with _Deadline(timeout) as deadline, fitz.open(pdf_path) as doc:
+            stats["pages"] = len(doc)
+            for page in iter_pages(doc):
+                pages.append(page)
+                hasher.update(page[1])
+                deadline.check()
+        stats["pages_kept"] = len(pages)
+        stats["minhash"], stats["chars"] = hasher.hexdigest(), hasher.chars
+        if pages:
+            stats["frame"] = encode_pages(pages)
+            stats["bytes_out"] = stats["frame"][1]
+        else:
+            stats["status"] = "empty"
+    except ConversionTimeout as e:
+        stats["status"], stats["error"] = "timeout", str(e)
+    except Exception as e:
+        stats["status"], stats["error"] = "failed", str(e)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def check_and_extract(pdf_path, valid_path, txt_path=None, timeout=None):
+    # 下载完成后立即调用：文件只读入内存一次，同一份字节用于计算哈希、检测有效性，
+    # 并可顺带抽取文本（txt_path 非 None 时），检测通过后移入有效目录
+    stats = {
+        "pdf": pdf_path, "path": pdf_path, "valid": False, "error": None,
+        "pdf_stat": None, "pdf_sha256": None,
+        "pages": 0, "pages_kept": 0, "bytes_in": 0, "bytes_out": 0,
+        "status": None,  # 文本抽取状态：None（未抽取）/ ok / empty / timeout / failed
+        "txt_stat": None, "txt_sha256": None,
+        "minhash": None, "chars": 0, "page_breaks": [],
+    }
+    start = time.perf_counter()
+    try:
+        stats["pdf_stat"] = file_stat(pdf_path)
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+        stats["bytes_in"] = len(data)
+        stats["pdf_sha256"] = hashlib.sha256(data).hexdigest()
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            if len(doc) == 0:
+                raise ValueError("空文件")
+            stats["pages"] = len(doc)
+            stats["valid"] = True
+            if txt_path is not None:
+                stats["status"] = "ok"
+                try:
+                    with _Deadline(timeout) as deadline:
+                        _write_pages(doc, txt_path, stats, deadline)
+                except ConversionTimeout as e:
+                    stats["status"], stats["error"] = "timeout", str(e)
+                except Exception as e:
+                    stats["status"], stats["error"] = "failed", str(e)
+                if stats["status"] == "ok":
+                    stats["txt_stat"], stats["txt_sha256"] = file_stat(txt_path), file_sha256(txt_path)
+    except Exception as e:
+        stats["error"] = str(e)
+    if stats["valid"]:
+        # rename 保留 mtime，清单中记录的 pdf_stat 在有效目录中依然成立；
+        # 移动失败（权限、磁盘等）时按未通过处理，文件留在原目录，下次运行重新检测
+        try:
+            os.replace(pdf_path, valid_path)
+            stats["path"] = valid_path
+        except OSError as e:
+            stats["valid"] = False
+            stats["error"] = f"移入有效目录失败: {e}"
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _convert_job(job):
+    pdf_path, txt_path, timeout = job
+    if txt_path is None:
+        return pdf_to_frame(pdf_path, timeout)
+    return pdf_to_txt(pdf_path, txt_path, timeout)
+
+
+def lost_stats(pdf_path, txt_path, status, error, seconds):
+    # 工作进程被强制结束（超时）或异常退出时，代替该任务的统计信息；残留的 .part 一并清理
+    if txt_path is not None and os.path.exists(txt_path + ".part"):
+        os.remove(txt_path + ".part")
+    return {
+        "pdf": pdf_path, "status": status, "error": error,
+        "pages": 0, "pages_kept": 0,
+        "bytes_in": os.path.getsize(pdf_path) if os.path.exists(pdf_path) else 0, "bytes_out": 0,
+        "frame": None, "minhash": None, "chars": 0, "page_breaks": [], "seconds": seconds,
+    }
+
+
+def convert_many(jobs, workers=None, timeout=None, profile_dir=None):
+    # jobs 为 (pdf_path, txt_path) 列表，txt_path 为 None 时输出语料库帧；按完成顺序产出每个文件的统计信息
+    # profile_dir：对每个工作进程做 cProfile（单进程时由调用方的 profile_main 负责）
+    jobs = [(pdf_path, txt_path, timeout) for pdf_path, txt_path in jobs]
+    if workers == 1 and not timeout:
+        for job in jobs:
+            yield _convert_job(job)
+        return
+    # 设了超时时即使单进程也放到工作进程里执行，父进程才能在解析卡死时结束它
+    job_fn = profiled(_convert_job, profile_dir, "convert")
+    with ExtractionPool(workers) as pool:
+        futures = [pool.submit(job_fn, job, timeout=timeout,
+                               on_lost=lambda *lost, job=job: lost_stats(job[0], job[1], *lost)) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# ========== 可强制结束工作进程的进程池 ==========
+def _worker_main(conn):
+    # 逐个执行 (fn, args)；收到 None 或父进程关闭管道时退出
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            result = (True, fn(*args))
+        except Exception as e:
+            result = (False, e)
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.started = self.deadline = None
+
+    def start(self, task):
+        fn, args, timeout, on_lost, future = task
+        self.task = task
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout + KILL_GRACE if timeout else None
+        self.conn.send((fn, args))
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ExtractionPool:
+    # 与 ProcessPoolExecutor 用法相近（submit 返回 Future），但每个任务由父进程计时：
+    # 超过 timeout + KILL_GRACE 仍未返回时结束该工作进程、换一个新的，任务以 on_lost("timeout", ...) 的结果完成；
+    # 工作进程异常退出时同样换新进程，任务以 on_lost("failed", ...) 完成。未给 on_lost 时 Future 抛出异常
+    def __init__(self, workers=None):
+        self.size = workers or os.cpu_count() or 1
+        self._ctx = multiprocessing.get_context()
+        self._tasks = queue.Queue()
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        self._wake_lock = threading.Lock()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="ExtractionPool", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, timeout=None, on_lost=None):
+        future = Future()
+        self._tasks.put((fn, args, timeout, on_lost, future))
+        self._wake()
+        return future
+
+    def shutdown(self, wait=True):
+        self._closing = True
+        self._wake()
+        if wait:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _wake(self):
+        with self._wake_lock:
+            self._wake_w.send_bytes(b"")
+
+    def _run(self):
+        workers, backlog = [], deque()
+        try:
+            while True:
+                while self._wake_r.poll():
+                    self._wake_r.recv_bytes()
+                while True:
+                    try:
+                        backlog.append(self._tasks.get_nowait())
+                    except queue.Empty:
+                        break
+                for worker in workers:
+                    if worker.task is None and backlog:
+                        worker.start(backlog.popleft())
+                while backlog and len(workers) < self.size:
+                    workers.append(_Worker(self._ctx))
+                    workers[-1].start(backlog.popleft())
+                busy = [w for w in workers if w.task is not None]
+                if self._closing and not busy and not backlog and self._tasks.empty():
+                    return
+                deadlines = [w.deadline for w in busy if w.deadline is not None]
+                wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                wait([self._wake_r] + [w.conn for w in busy] + [w.process.sentinel for w in busy], wait_for)
+                for i, worker in enumerate(workers):
+                    if worker.task is not None and self._check(worker):
+                        workers[i] = _Worker(self._ctx)
+        finally:
+            for worker in workers:
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+            for worker in workers:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.kill()
+
+    def _check(self, worker):
+        # 处理一个忙碌的工作进程；返回 True 表示该进程已结束，需要换新的
+        fn, args, timeout, on_lost, future = worker.task
+        if worker.conn.poll():
+            try:
+                ok, value = worker.conn.recv()
+            except (EOFError, OSError):
+                ok, value = None, None
+            if ok is not None:
+                worker.task = None
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                return False
+        if worker.process.is_alive() and (worker.deadline is None or time.monotonic() < worker.deadline):
+            return False
+        status, error = ("failed", f"工作进程异常退出（退出码 {worker.process.exitcode}）") \
+            if not worker.process.is_alive() else ("timeout", f"转换超时（超过 {timeout:g} 秒，已强制结束工作进程）")
+        worker.kill()
+        seconds = time.monotonic() - worker.started
+        if on_lost is not None:
+            future.set_result(on_lost(status, error, seconds))
+        else:
+            future.set_exception(ConversionTimeout(error) if status == "timeout" else RuntimeError(error))
+        return True
+
+
+def summarize_throughput(stats_list, elapsed):
+    pages = sum(s["pages"] for s in stats_list)
+    mb = sum(s["bytes_in"] for s in stats_list) / (1024 * 1024)
+    elapsed = max(elapsed, 1e-9)
+    return {
+        "files": len(stats_list),
+        "pages": pages,
+        "mb": mb,
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed,
+        "mb_per_sec": mb / elapsed,
+    }
@@ -0,0 +1,435 @@
+import os
+import sys
+import time
+import queue
+import asyncio
+import threading
+import subprocess
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .analysis import (analyze_document, build_year_tables, counts_are_fresh,
+                       init_worker, make_task, save_year_outputs)
+from .companies import load_company_index
+from .corpus import open_year
+from .crawler import announcement_id, crawl_plate_year, links_dir, links_path
+from .dedup import detect_year, store_signature
+from .downloader import AsyncDownloader, build_url
+from .keywords import dictionary
+from .manifest import Manifest, doc_filename, doc_key
+from .metrics import metrics, profiled
+from .pdf_extract import EXTRACTOR_VERSION, ExtractionPool, check_and_extract, lost_stats, pdf_to_txt
+from .position_index import refresh_index, store_pages
+from .rate_limiter import AdaptiveRateLimiter
+from .token_cache import TokenCache
+
+# ===== 流水线：采集 → 下载 → 校验 → 转换 → 统计 → 可视化 =====
+# 各阶段之间用有界队列连接，每个阶段有独立的工作线程数（转换、统计阶段背后是进程池）。
+# 一份 PDF 落盘后立即进入校验与抽取，文本就绪后立即统计；队列满时上游自动等待（背压）。
+# 增量规则与 02–04 相同：清单中记录的输入未变化的文档直接跳过相应步骤。
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DONE = object()
+
+
+def year_paths(base_dir, year):
+    return {
+        "links": links_path(base_dir, year),
+        "pdf": os.path.join(base_dir, f"年报PDF_{year}"),
+        "valid": os.path.join(base_dir, f"年报PDF_{year}_有效"),
+        "txt": os.path.join(base_dir, f"年报TXT_{year}"),
+        "output": os.path.join(base_dir, f"分析结果_{year}"),
+        "tokens": os.path.join(base_dir, f"分词缓存_{year}"),
+        "index": os.path.join(base_dir, f"检索索引_{year}"),
+        "bad_log": os.path.join(base_dir, f"坏文件日志_{year}.txt"),
+    }
+
+
+# ========== 阶段 ==========
+class Stage:
+    def __init__(self, name, fn, workers, queue_size, downstream=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.downstream = downstream  # 下一个 Stage，或最终结果队列
+        self.processed = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.started = None
+        self.finished = None
+        self._alive = workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started = time.perf_counter()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def put(self, item):
+        self.inbox.put(item)
+        self.max_depth = max(self.max_depth, self.inbox.qsize())
+
+    def close(self):
+        # 上游全部结束：给每个工作线程发送结束标记
+        for _ in range(self.workers):
+            self.inbox.put(_DONE)
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                break
+            start = time.perf_counter()
+            try:
+                out = self.fn(item)
+            except Exception as e:
+                print(f"❌ [{self.name}] {item.get('file', item)} 出错: {e}")
+                out = None
+            elapsed = time.perf_counter() - start
+            metrics.observe("stage_item", elapsed, stage=self.name)
+            with self._lock:
+                self.busy += elapsed
+                self.processed += 1
+                if out is None:
+                    self.dropped += 1
+            if out is not None and self.downstream is not None:
+                self.downstream.put(out)
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last:
+            self.finished = time.perf_counter()
+            if isinstance(self.downstream, Stage):
+                self.downstream.close()
+            elif self.downstream is not None:
+                self.downstream.put(_DONE)
+
+    def sample_depth(self):
+        depth = self.inbox.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        return depth
+
+    def summary(self):
+        end = self.finished or time.perf_counter()
+        elapsed = max(end - (self.started or end), 1e-9)
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "items_per_sec": self.processed / elapsed,
+            "busy_seconds": self.busy,
+            "max_queue_depth": self.max_depth,
+        }
+
+
+# ========== 流水线 ==========
+class Pipeline:
+    def __init__(self, base_dir, years, plates=("szse", "sse", "bj"), crawl=True,
+                 crawl_workers=3, download_workers=12, validate_workers=4,
+                 convert_workers=None, count_workers=None, render_workers=2,
+                 queue_size=64, rate=1.25, download_rate=8.0, convert_timeout=300,
+                 chunk_size=None, render=True, report_interval=10.0, profile_dir=None):
+        self.base_dir = base_dir
+        self.years = list(years)
+        self.plates = list(plates)
+        self.crawl = crawl
+        self.crawl_workers = crawl_workers
+        self.render = render
+        self.render_workers = render_workers
+        self.convert_timeout = convert_timeout
+        self.chunk_size = chunk_size
+        self.report_interval = report_interval
+        self.rate = rate
+        self.download_rate = download_rate
+        # profile_dir：对转换、统计进程池中的每个工作进程做 cProfile
+        self._pdf_to_txt = profiled(pdf_to_txt, profile_dir, "convert")
+        self._analyze = profiled(analyze_document, profile_dir, "count")
+
+        cpu = os.cpu_count() or 1
+        convert_workers = convert_workers or max(1, cpu // 2)
+        count_workers = count_workers or max(1, cpu - convert_workers)
+
+        self.paths = {y: year_paths(base_dir, y) for y in self.years}
+        for p in self.paths.values():
+            for key in ("pdf", "valid", "txt", "output"):
+                os.makedirs(p[key], exist_ok=True)
+        os.makedirs(links_dir(base_dir), exist_ok=True)
+
+        self.manifest = Manifest(base_dir)
+        self.token_caches = {y: TokenCache(self.paths[y]["tokens"]) for y in self.years}
+        self._cache_lock = threading.Lock()
+
+        self.results = queue.Queue(maxsize=queue_size)
+        self.count_stage = Stage("统计", self._count, count_workers, queue_size, self.results)
+        self.convert_stage = Stage("转换", self._convert, convert_workers, queue_size, self.count_stage)
+        self.validate_stage = Stage("校验", self._validate, validate_workers, queue_size, self.convert_stage)
+        self.download_stage = Stage("下载", self._download, download_workers, queue_size, self.validate_stage)
+        self.stages = [self.download_stage, self.validate_stage, self.convert_stage, self.count_stage]
+
+        # 转换进程由父进程计时，卡死在 MuPDF 内部的工作进程会被结束并替换
+        self._convert_pool = ExtractionPool(convert_workers)
+        self._count_pool = ProcessPoolExecutor(
+            max_workers=count_workers, initializer=init_worker,
+            initargs=(dictionary.matcher, dictionary.trust_words, chunk_size),
+        )
+        self._seen = set()
+        self._seen_lock = threading.Lock()
+        self._links = {y: [] for y in self.years}
+        self._bad = {y: [] for y in self.years}
+        self._stop_monitor = threading.Event()
+
+    # ---- 采集（源头） ----
+    def _emit_records(self, plate, year, records):
+        for record in records:
+            key = record.get("公告ID") or record["PDF链接"]
+            with self._seen_lock:
+                if key in self._seen:
+                    continue
+                self._seen.add(key)
+            self._links[year].append(record)
+            self.download_stage.put({"year": year, "record": record})
+
+    def _source(self):
+        try:
+            self._produce()
+        except Exception as e:
+            print(f"❌ 采集阶段出错: {e}")
+        finally:
+            # 无论采集是否完整，都要通知下游结束，已入队的任务照常处理
+            self.download_stage.close()
+
+    def _produce(self):
+        if self.crawl:
+            folder = links_dir(self.base_dir)
+            companies = load_company_index(folder)
+            limiter = AdaptiveRateLimiter(rate=self.rate, min_rate=0.2, max_rate=self.rate * 4)
+            tasks = [(y, p) for y in self.years for p in self.plates]
+            with ThreadPoolExecutor(max_workers=self.crawl_workers) as executor:
+                futures = [executor.submit(crawl_plate_year, p, y, limiter, folder,
+                                           on_page=self._emit_records, companies=companies)
+                           for y, p in tasks]
+                for f in futures:
+                    f.result()
+            for y in self.years:
+                if self._links[y]:
+                    pd.DataFrame(self._links[y]).to_excel(self.paths[y]["links"], index=False)
+        else:
+            # 直接使用已有的年报链接 Excel
+            for y in self.years:
+                df = pd.read_excel(self.paths[y]["links"], dtype={"公司代码": str})
+                for _, row in df.iterrows():
+                    self.download_stage.put({"year": y, "record": row.to_dict()})
+
+    # ---- 下载 ----
+    def _download(self, item):
+        y, record = item["year"], item["record"]
+        paths = self.paths[y]
+        # 文件名带公告 ID：同一公司更正后重新披露的年报各存一份，年末重复检测决定保留哪份
+        code, company_name = str(record["公司代码"]), record["公司简称"]
+        name = doc_filename(code, company_name, announcement_id(record), ext="")
+        url = build_url(record["PDF链接"])
+        item.update(code=code, name=company_name, file=name, key=doc_key(name))
+        pdf_path = os.path.join(paths["pdf"], name + ".pdf")
+        valid_path = os.path.join(paths["valid"], name + ".pdf")
+
+        m = self.manifest.get_doc(name, y)
+        if m.get("link") == url and os.path.exists(valid_path):
+            item.update(pdf=valid_path, validated=True)
+            return item
+        if m.get("link") and m["link"] != url:
+            for old in (pdf_path, valid_path):
+                if os.path.exists(old):
+                    os.remove(old)
+
+        result = asyncio.run_coroutine_threadsafe(self._downloader.fetch(url, pdf_path), self._loop).result()
+        metrics.record("download", name + ".pdf", status=result["status"], seconds=result["seconds"],
+                       bytes=result["bytes"], retries=max(result["attempts"] - 1, 0), http_status=result["http_status"])
+        if result["status"] not in ("ok", "exists"):
+            print(f"⚠️ 下载失败 {name}: {result['status']} {result['error'] or result['http_status']}")
+            return None
+        self.manifest.update_doc(name, y, link=url)
+        item.update(pdf=pdf_path, validated=False)
+        return item
+
+    # ---- 校验 ----
+    def _validate(self, item):
+        if item["validated"]:
+            return item
+        y = item["year"]
+        valid_path = os.path.join(self.paths[y]["valid"], os.path.basename(item["pdf"]))
+        # 一次读入：同时得到 PDF 哈希并检测有效性，转换阶段无需再算哈希
+        check = check_and_extract(item["pdf"], valid_path)
+        metrics.record("validate", os.path.basename(item["pdf"]), status="valid" if check["valid"] else "invalid",
+                       seconds=check["seconds"], pages=check["pages"], bytes=check["bytes_in"], error=check["error"])
+        if not check["valid"]:
+            self._bad[y].append((os.path.basename(item["pdf"]), check["error"]))
+            return None
+        self.manifest.update_doc(item["file"], y, pdf_stat=check["pdf_stat"], pdf_sha256=check["pdf_sha256"])
+        item.update(pdf=valid_path, validated=True)
+        return item
+
+    # ---- 转换 ----
+    def _convert(self, item):
+        y, name = item["year"], item["file"]
+        txt_path = os.path.join(self.paths[y]["txt"], name + ".txt")
+        m = self.manifest.get_doc(name, y)
+        pdf_stat, pdf_sha256 = self.manifest.fingerprint(item["pdf"], m, "pdf")
+        self.manifest.update_doc(name, y, pdf_stat=pdf_stat, pdf_sha256=pdf_sha256)
+        item["txt"] = txt_path
+        if os.path.exists(txt_path) and m.get("txt_source_pdf") in (None, pdf_sha256) \
+                and m.get("extractor_version") in (None, EXTRACTOR_VERSION):
+            if not m.get("txt_source_pdf"):
+                txt_stat, txt_sha256 = self.manifest.fingerprint(txt_path, m, "txt")
+                self.manifest.update_doc(name, y, txt_stat=txt_stat, txt_sha256=txt_sha256,
+                                         txt_source_pdf=pdf_sha256, extractor_version=EXTRACTOR_VERSION)
+            return item
+        stats = self._convert_pool.submit(
+            self._pdf_to_txt, item["pdf"], txt_path, self.convert_timeout, timeout=self.convert_timeout,
+            on_lost=lambda *lost: lost_stats(item["pdf"], txt_path, *lost)).result()
+        metrics.record("convert", item["file"] + ".pdf", status=stats["status"], seconds=stats["seconds"],
+                       pages=stats["pages"], bytes=stats["bytes_in"], bytes_out=stats["bytes_out"], error=stats["error"])
+        item["pages"] = stats["pages"]
+        if stats["status"] != "ok":
+            print(f"⚠️ 转换未完成 {item['file']}: {stats['status']} {stats['error'] or ''}")
+            return None
+        txt_stat, txt_sha256 = self.manifest.fingerprint(txt_path, {}, "txt")
+        store_signature(self.manifest, y, item["file"] + ".txt", txt_stat, stats)
+        store_pages(self.manifest, y, item["file"] + ".txt", txt_stat, stats)
+        self.manifest.update_doc(name, y, txt_stat=txt_stat, txt_sha256=txt_sha256,
+                                 txt_source_pdf=pdf_sha256, extractor_version=EXTRACTOR_VERSION)
+        return item
+
+    # ---- 统计 ----
+    def _count(self, item):
+        y = item["year"]
+        m = self.manifest.get_doc(item["file"], y)
+        if counts_are_fresh(m, item["txt"], dictionary.version):
+            item.update(counts=m["counts"], txt_sha256=m["counts_txt"], fresh=True)
+            return item
+        with self._cache_lock:
+            task = make_task(item["txt"], item["key"], m, self.manifest, self.token_caches[y], dictionary.matcher)
+        r = self._count_pool.submit(self._analyze, task).result()
+        metrics.record("count", item["file"] + ".txt", status="failed" if r["error"] else "ok", seconds=r["seconds"],
+                       chars=r["counts"]["总字数"] if r["counts"] else 0, tokens=r["tokens"],
+                       token_cache=task[1] is not None, error=r["error"], **r["timings"])
+        if r["error"] is not None:
+            print(f"⚠️ 统计失败: {item['file']}，错误: {r['error']}")
+            return None
+        item.update(counts=r["counts"], txt_sha256=r["txt_sha256"], txt_stat=r["txt_stat"],
+                    encoded=r["encoded"], fresh=False)
+        return item
+
+    # ---- 监控 ----
+    def _monitor(self):
+        last = {s.name: 0 for s in self.stages}
+        while not self._stop_monitor.wait(self.report_interval):
+            parts = []
+            for s in self.stages:
+                depth = s.sample_depth()
+                rate = (s.processed - last[s.name]) / self.report_interval
+                last[s.name] = s.processed
+                parts.append(f"{s.name} {s.processed}（{rate:.1f}/秒，队列 {depth}）")
+            print("📈 " + " | ".join(parts))
+
+    # ---- 运行 ----
+    def run(self):
+        start = time.perf_counter()
+        self._loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        loop_thread.start()
+        limiter = AdaptiveRateLimiter(rate=self.download_rate, max_rate=self.download_rate * 4,
+                                      concurrency=self.download_stage.workers,
+                                      max_concurrency=self.download_stage.workers)
+        self._downloader = AsyncDownloader(concurrency=self.download_stage.workers, limiter=limiter)
+        asyncio.run_coroutine_threadsafe(self._downloader.__aenter__(), self._loop).result()
+
+        for s in self.stages:
+            s.start()
+        monitor = threading.Thread(target=self._monitor, daemon=True)
+        monitor.start()
+        source = threading.Thread(target=self._source, daemon=True)
+        source.start()
+
+        # 汇总统计结果（清单、分词缓存只在这里写入）
+        entries = {y: {} for y in self.years}
+        while True:
+            item = self.results.get()
+            if item is _DONE:
+                break
+            y = item["year"]
+            entries[y][item["file"]] = (item["code"], item["name"], item["counts"], item["txt_sha256"])
+            if item["fresh"]:
+                continue
+            if item["encoded"] is not None:
+                with self._cache_lock:
+                    self.token_caches[y].put(item["key"], item["txt_sha256"], *item["encoded"],
+                                             segmenter=dictionary.segmenter_version)
+            self.manifest.update_doc(item["file"], y, commit=False,
+                                     txt_stat=item["txt_stat"], txt_sha256=item["txt_sha256"],
+                                     counts_txt=item["txt_sha256"], dict_hash=dictionary.version,
+                                     counts=item["counts"])
+        source.join()
+        self._stop_monitor.set()
+
+        asyncio.run_coroutine_threadsafe(self._downloader.__aexit__(None, None, None), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._convert_pool.shutdown()
+        self._count_pool.shutdown()
+        for cache in self.token_caches.values():
+            cache.close()
+        self.manifest.commit()
+
+        # 年度汇总与可视化
+        for y in self.years:
+            with open(self.paths[y]["bad_log"], "w", encoding="utf-8") as f:
+                for name, err in self._bad[y]:
+                    f.write(f"{name}\t{err}\n")
+            # 统计阶段读的是本次写入的 TXT；open_year 在已建语料库时把这些 TXT 合并进来，
+            # 重复检测与位置索引使用同一份文档集合。全部文档都已统计，是否重复只由本次检测决定
+            docs = open_year(self.base_dir, y)
+            with metrics.timer("phase", stage="pipeline", phase="dedup"):
+                duplicates = detect_year(docs, self.manifest, y)
+            for doc in duplicates:
+                entries[y].pop(doc[:-4], None)
+            if entries[y]:
+                with metrics.timer("phase", stage="pipeline", phase="tables"):
+                    tables = build_year_tables([entries[y][k] for k in sorted(entries[y])],
+                                               dictionary.matcher, dictionary.keyword_groups, dictionary.trust_words)
+                    save_year_outputs(self.paths[y]["output"], y, *tables)
+                print(f"✅ {y} 年：统计 {len(entries[y])} 份年报，结果保存至 {self.paths[y]['output']}")
+                with metrics.timer("phase", stage="pipeline", phase="index"):
+                    refresh_index(self.paths[y]["index"], docs, self.manifest, y,
+                                  self.token_caches[y])
+        render_summary = self._render([y for y in self.years if entries[y]]) if self.render else None
+        self.manifest.close()
+
+        summary = [s.summary() for s in self.stages]
+        if render_summary:
+            summary.append(render_summary)
+        elapsed = time.perf_counter() - start
+        print(f"\n🏁 流水线完成，用时 {elapsed:.1f} 秒")
+        for s in summary:
+            print(f"  {s['stage']}: 处理 {s['processed']}（丢弃 {s['dropped']}），{s['items_per_sec']:.2f} 件/秒，"
+                  f"忙碌 {s['busy_seconds']:.1f} 秒，最大队列 {s['max_queue_depth']}，并发 {s['workers']}")
+        return summary
+
+    def _render(self, years):
+        # 可视化：05_可视化.py 批量模式，直接读取刚生成的矩阵与可信度指数表，多个年份在进程池中并行绘制
+        start = time.perf_counter()
+        script = os.path.join(REPO_DIR, "05_可视化.py")
+        # 只传实际有结果的年份：区间中没有可统计年报的年份不绘图
+        cmd = [sys.executable, script, "--batch", "--years", ",".join(map(str, years)),
+               "--workers", str(self.render_workers), "--base-dir", self.base_dir]
+        proc = subprocess.run(cmd, cwd=REPO_DIR, capture_output=True, text=True)
+        failed = 0
+        if proc.returncode != 0:
+            failed = len(years)
+            print(f"⚠️ 可视化失败：{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        return {"stage": "可视化", "workers": self.render_workers, "processed": len(years), "dropped": failed,
+                "items_per_sec": len(years) / elapsed, "busy_seconds": elapsed, "max_queue_depth": 0}
@@ -0,0 +1,368 @@
+import os
+import re
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from .corpus import document_fingerprint, document_stat
+from .manifest import doc_key, split_doc_name
+from .token_cache import term_plan
+
+# ===== 页 / 章节级关键词位置索引 =====
+# 分词缓存是正排表（每篇文档的词 ID 序列），在它之上每年建一份倒排位置索引 检索索引_{YEAR}/：
+#   postings.bin  有效文档中全部词的位置（即 tokens.u32 中的下标），按（词 ID, 位置）排序
+#   starts.npy    词 ID -> postings 中的起始下标，长度为词表大小 + 1
+#   layout.json   {key, dtype, docs: 公司代码 -> {doc, sha256, offset, length, paged,
+#                  pages: [[原页码, 起始词位置]], sections: [[章节标题, 起始词位置]]}}（词位置为文档内下标）
+# 关键词出现一次 = 连续若干个词拼起来恰为该关键词，与分词计数、Trust_Index 同一语义。
+# 分词结果拼接即原文：上下文（KWIC）由词 ID 还原，页码、章节由位置二分查找，查询不读取年报文本。
+# 分词缓存中的文档或页边界变化后整体重建（两遍计数排序，耗时与词数成正比）；章节切分按文档沿用。
+
+LAYOUT_NAME = "layout.json"
+POSTINGS_NAME = "postings.bin"
+STARTS_NAME = "starts.npy"
+LAYOUT_VERSION = 1  # 章节识别规则变化时加一
+CHUNK_TOKENS = 1 << 24  # 建索引时每批处理的词数，控制内存占用
+PREFACE = "（章节前）"  # 第一个章节标题之前：封面、目录、释义等
+MIN_SECTION_CHARS = 200  # 与下一个标题相距更近的视为目录行
+
+# 正文章节标题形如 “第四节 经营情况讨论与分析”，抽取后 “第X节” 与标题可能分在两行；
+# 目录中的同名行带点线或页码，正文中引用章节的句子带标点，都不是标题
+SECTION_HEADING = re.compile(
+    r"^[ \t　]*第([一二三四五六七八九十]{1,3})节[ \t　]*\n?[ \t　]*([^\n]{2,40}?)[ \t　]*$", re.M)
+NOT_TITLE = re.compile(r"[.…·．]{2,}|\d+$|[。，；“”]")
+# 章节查询名 -> 各年份年报中的对应标题（2021 年起为“管理层讨论与分析”，此前为“经营情况讨论与分析”或“董事会报告”）
+SECTION_ALIASES = {
+    "管理层讨论与分析": ["管理层讨论与分析", "经营情况讨论与分析", "董事会报告"],
+    "公司业务概要": ["公司业务概要"],
+    "重要事项": ["重要事项"],
+    "公司治理": ["公司治理"],
+    "环境和社会责任": ["环境和社会责任"],
+    "财务报告": ["财务报告"],
+}
+_DIGITS = {c: i for i, c in enumerate("一二三四五六七八九", 1)}
+
+
+def index_dir(base_dir, year):
+    return os.path.join(base_dir, f"检索索引_{year}")
+
+
+def _numeral(s):
+    # "四" -> 4，"十二" -> 12；不合法时返回 None
+    tens, sep, ones = s.partition("十")
+    if not sep:
+        return _DIGITS.get(s) if len(s) == 1 else None
+    if len(tens) > 1 or len(ones) > 1:
+        return None
+    value = (_DIGITS.get(tens) if tens else 1), (_DIGITS.get(ones) if ones else 0)
+    return None if None in value else value[0] * 10 + value[1]
+
+
+def find_sections(text):
+    # [(章节标题, 起始字符位置)]：按节号递增，每节取上一节之后的第一个标题；目录行（带页码或彼此紧挨）不算
+    headings = []
+    for m in SECTION_HEADING.finditer(text):
+        no = _numeral(m.group(1))
+        if no is not None and not NOT_TITLE.search(m.group(2)):
+            headings.append((no, f"第{m.group(1)}节 {m.group(2)}", m.start(1) - 1))
+    starts = [start for _, _, start in headings] + [len(text)]
+    candidates = {}
+    for k, (no, title, start) in enumerate(headings):
+        if starts[k + 1] - start >= MIN_SECTION_CHARS:
+            candidates.setdefault(no, []).append((start, title))
+    sections, last = [], -1
+    for no in sorted(candidates):
+        for start, title in candidates[no]:
+            if start > last:
+                sections.append((title, start))
+                last = start
+                break
+    return sections
+
+
+def section_matches(title, section):
+    return any(alias in title for alias in SECTION_ALIASES.get(section, [section]))
+
+
+def store_pages(manifest, year, doc_name, stat, stats, commit=False):
+    # 抽取阶段（03 / 02 --extract / 流水线）登记 TXT 的页边界
+    manifest.set_page_breaks(year, doc_name, stat, stats["page_breaks"], commit)
+
+
+def document_page_breaks(docs, doc_name, ref, stored):
+    # 语料库索引中的页边界优先，其次为清单中记录的（仅当 TXT 自抽取后未改动）
+    breaks = docs.page_breaks(doc_name)
+    if breaks is None and doc_name in stored:
+        stat, breaks = stored[doc_name]
+        if stat != document_stat(ref):
+            breaks = None
+    return breaks
+
+
+# ========== 建索引 ==========
+def _layout(ids, words, lengths, breaks):
+    # 由词 ID 还原文本，切分章节；页边界与章节起点由字符位置换算为文档内词位置
+    text = "".join(words[ids].tolist())
+    ends = np.cumsum(lengths[ids])
+
+    def to_token(char_pos):
+        return int(np.searchsorted(ends, char_pos, side="right"))
+
+    if breaks and breaks[-1][1] >= len(text):
+        breaks = None  # 与文本对不上（如 TXT 被改写）：不记页码
+    pages = [[page_no, to_token(start)] for page_no, start in breaks or []]
+    sections = [[title, to_token(start)] for title, start in find_sections(text)]
+    return pages, sections
+
+
+def _batches(tokens, spans, pos_dtype, limit=CHUNK_TOKENS):
+    # 按位置顺序逐批产出 (词 ID, 全局位置)，每批约 limit 个词
+    batch, size = [], 0
+    for k, (offset, length) in enumerate(spans):
+        batch.append((offset, length))
+        size += length
+        if size >= limit or k == len(spans) - 1:
+            ids = np.concatenate([tokens[o:o + n] for o, n in batch])
+            pos = np.concatenate([np.arange(o, o + n, dtype=pos_dtype) for o, n in batch])
+            yield ids, pos
+            batch, size = [], 0
+
+
+def _write_postings(path, tokens, spans, vocab_size, pos_dtype):
+    # 两遍计数排序：第一遍统计每个词的出现次数，第二遍把各批按词 ID 稳定排序后写入各词的区段
+    counts = np.zeros(vocab_size, dtype=np.int64)
+    for ids, _ in _batches(tokens, spans, pos_dtype):
+        counts += np.bincount(ids, minlength=vocab_size)
+    starts = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+
+    tmp = os.path.join(path, POSTINGS_NAME + ".tmp")
+    if starts[-1] == 0:
+        open(tmp, "wb").close()
+    else:
+        out = np.memmap(tmp, dtype=pos_dtype, mode="w+", shape=(int(starts[-1]),))
+        cursor = starts[:-1].copy()
+        for ids, pos in _batches(tokens, spans, pos_dtype):
+            order = np.argsort(ids, kind="stable")
+            sorted_ids = ids[order]
+            batch_counts = np.bincount(ids, minlength=vocab_size)
+            first = np.cumsum(batch_counts) - batch_counts
+            out[cursor[sorted_ids] + (np.arange(len(ids)) - first[sorted_ids])] = pos[order]
+            cursor += batch_counts
+        out.flush()
+        del out
+    os.replace(tmp, os.path.join(path, POSTINGS_NAME))
+    with open(os.path.join(path, STARTS_NAME + ".tmp"), "wb") as f:
+        np.save(f, starts)
+    os.replace(os.path.join(path, STARTS_NAME + ".tmp"), os.path.join(path, STARTS_NAME))
+
+
+def _load_layout(path):
+    layout_path = os.path.join(path, LAYOUT_NAME)
+    if not os.path.exists(layout_path):
+        return {}
+    with open(layout_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def refresh_index(path, docs, manifest, year, token_cache, force=False):
+    # 为分词缓存中与当前文本一致的文档（不含重复年报）建索引；与上次建索引时相同则直接加载
+    duplicates = manifest.duplicates(year)
+    stored_pages = manifest.page_breaks(year)
+    entries, breaks, missing = {}, {}, 0
+    for doc_name in docs.names():
+        if doc_name in duplicates:
+            continue
+        dk = doc_key(doc_name)
+        ref = docs.ref(doc_name)
+        _, sha256 = document_fingerprint(ref, manifest, manifest.get_doc(doc_name, year))
+        if not token_cache.has(dk, sha256):
+            missing += 1
+            continue
+        offset, length = token_cache.span(dk)
+        breaks[dk] = document_page_breaks(docs, doc_name, ref, stored_pages)
+        entries[dk] = {"doc": doc_name, "sha256": sha256, "offset": offset, "length": length,
+                       "paged": breaks[dk] is not None}
+    key = hashlib.sha256(json.dumps([LAYOUT_VERSION, sorted(entries.items())], ensure_ascii=False)
+                         .encode("utf-8")).hexdigest()
+    old = _load_layout(path)
+    if not force and old.get("key") == key and os.path.exists(os.path.join(path, POSTINGS_NAME)):
+        return PositionIndex(path, token_cache)
+
+    start = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, LAYOUT_NAME)):
+        os.remove(os.path.join(path, LAYOUT_NAME))  # 先作废旧索引，中途中断时下次整体重建
+    vocab = token_cache.vocab
+    words = np.array(vocab, dtype=object)  # 按 ID 数组整体取词，比逐个下标取快一个数量级
+    lengths = np.fromiter((len(w) for w in vocab), dtype=np.int64, count=len(vocab))
+    tokens = token_cache.tokens()
+    same = {"sha256", "offset", "length", "paged"}
+    for dk, entry in entries.items():
+        prev = old.get("docs", {}).get(dk)
+        if old.get("version") == LAYOUT_VERSION and prev and all(prev[k] == entry[k] for k in same):
+            entry["pages"], entry["sections"] = prev["pages"], prev["sections"]
+        else:
+            ids = tokens[entry["offset"]:entry["offset"] + entry["length"]]
+            entry["pages"], entry["sections"] = _layout(ids, words, lengths, breaks[dk])
+
+    pos_dtype = np.uint32 if len(tokens) < 1 << 32 else np.uint64
+    spans = sorted((e["offset"], e["length"]) for e in entries.values())
+    _write_postings(path, tokens, spans, len(vocab), pos_dtype)
+    tmp = os.path.join(path, LAYOUT_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "version": LAYOUT_VERSION, "dtype": np.dtype(pos_dtype).name, "docs": entries},
+                  f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(path, LAYOUT_NAME))
+    n_tokens = sum(length for _, length in spans)
+    print(f"🗂️ {year} 年检索索引：{len(entries)} 份年报，{n_tokens} 个词，用时 {time.perf_counter() - start:.1f} 秒"
+          + (f"（{missing} 份没有可用的分词缓存，未收录）" if missing else ""))
+    return PositionIndex(path, token_cache)
+
+
+# ========== 查询 ==========
+class PositionIndex:
+    def __init__(self, path, token_cache):
+        layout = _load_layout(path)
+        self.path = path
+        self.token_cache = token_cache
+        self.vocab = token_cache.vocab
+        self.tokens = token_cache.tokens()
+        self.docs = layout["docs"]  # 文档键（manifest.doc_key）-> 布局
+        self.keys = sorted(self.docs, key=lambda k: self.docs[k]["offset"])
+        self.offsets = np.array([self.docs[k]["offset"] for k in self.keys], dtype=np.int64)
+        self.ends = self.offsets + np.array([self.docs[k]["length"] for k in self.keys], dtype=np.int64)
+        self.starts = np.load(os.path.join(path, STARTS_NAME))
+        postings_path = os.path.join(path, POSTINGS_NAME)
+        if os.path.getsize(postings_path):
+            self.postings = np.memmap(postings_path, dtype=layout["dtype"], mode="r")
+        else:
+            self.postings = np.zeros(0, dtype=layout["dtype"])
+        self._page_starts = {k: [s for _, s in e["pages"]] for k, e in self.docs.items()}
+        self._section_starts = {k: [s for _, s in e["sections"]] for k, e in self.docs.items()}
+        self._words = None
+
+    def occurrences(self, word):
+        # 该词每次出现的（文档下标, 文档内词位置），按全局位置排序
+        found_docs, found_pos = [], []
+        for seq in term_plan([word], self.token_cache.word_ids)[word]:
+            if seq[0] + 1 >= len(self.starts):
+                continue  # 建索引之后才加入词表的词
+            pos = np.asarray(self.postings[self.starts[seq[0]]:self.starts[seq[0] + 1]], dtype=np.int64)
+            doc = np.searchsorted(self.offsets, pos, side="right") - 1
+            # 多个词拼成：逐个核对后续的词，不越过文档末尾
+            for j, i in enumerate(seq[1:], 1):
+                keep = pos + j < self.ends[doc]
+                pos, doc = pos[keep], doc[keep]
+                keep = self.tokens[pos + j] == i
+                pos, doc = pos[keep], doc[keep]
+            found_docs.append(doc)
+            found_pos.append(pos)
+        if not found_docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        doc, pos = np.concatenate(found_docs), np.concatenate(found_pos)
+        order = np.argsort(pos, kind="stable")
+        doc, pos = doc[order], pos[order]
+        return doc, pos - self.offsets[doc]
+
+    def section_spans(self, key, section=None):
+        # 文档中属于该章节的 [(起始词位置, 结束词位置)]；section 为 None 时为全文
+        entry = self.docs[key]
+        if section is None:
+            return [(0, entry["length"])]
+        sections = entry["sections"]
+        ends = [start for _, start in sections[1:]] + [entry["length"]]
+        return [(start, end) for (title, start), end in zip(sections, ends) if section_matches(title, section)]
+
+    def _display_words(self):
+        # 词表的 object 数组，按 ID 数组整体取词；上下文中去掉 PDF 折行（换行词记为空串），其余空白词记为一个空格
+        if self._words is None:
+            self._words = np.array([("" if "\n" in w else " ") if w.isspace() else w for w in self.vocab], dtype=object)
+        return self._words
+
+    def kwic(self, word, width=30, section=None, limit=None):
+        # 关键词上下文：每次出现一行（页码、章节、左右各 width 个字）；section 限定章节
+        doc, pos = self.occurrences(word)
+        words = self._display_words()
+        rows = []
+        # 命中已按位置排序，同一文档的命中相邻：逐文档查页码、章节
+        for hits in np.split(np.arange(len(doc)), np.flatnonzero(np.diff(doc)) + 1):
+            if not len(hits) or (limit and len(rows) >= limit):
+                break
+            d = int(doc[hits[0]])
+            key, local = self.keys[d], pos[hits]
+            entry = self.docs[key]
+            code, name = split_doc_name(entry["doc"])
+            k = np.searchsorted(self._section_starts[key], local, side="right") - 1
+            titles = [entry["sections"][i][0] if i >= 0 else PREFACE for i in k.tolist()]
+            k = np.searchsorted(self._page_starts[key], local, side="right") - 1
+            pages = [entry["pages"][i][0] if i >= 0 else None for i in k.tolist()]
+            ids = np.asarray(self.tokens[int(self.offsets[d]):int(self.ends[d])])
+            for p, title, page in zip(local.tolist(), titles, pages):
+                if section is not None and not section_matches(title, section):
+                    continue
+                # 每个词至少一个字，取 width 个词足够；关键词由若干词拼成，拼接后前 len(word) 个字即关键词
+                right = "".join(words[ids[p:p + len(word) + width]].tolist())
+                rows.append({
+                    "公司代码": code, "公司简称": name, "页码": page, "章节": title,
+                    "左文": "".join(words[ids[max(0, p - width):p]].tolist())[-width:],
+                    "关键词": word,
+                    "右文": right[len(word):len(word) + width],
+                })
+                if limit and len(rows) >= limit:
+                    break
+        return pd.DataFrame(rows, columns=["公司代码", "公司简称", "页码", "章节", "左文", "关键词", "右文"])
+
+    def counts(self, words, section=None):
+        # 每篇文档在该章节（None 为全文）内各词的分词计数与分词总数；没有该章节的文档为空值
+        spans = [(int(self.offsets[d]) + s, int(self.offsets[d]) + e)
+                 for d, key in enumerate(self.keys) for s, e in self.section_spans(key, section)]
+        span_starts = np.array([s for s, _ in spans], dtype=np.int64)
+        span_ends = np.array([e for _, e in spans], dtype=np.int64)
+        totals = np.zeros(len(self.keys), dtype=np.float64)
+        if spans:
+            np.add.at(totals, np.searchsorted(self.offsets, span_starts, side="right") - 1, span_ends - span_starts)
+        has_section = np.zeros(len(self.keys), dtype=bool)
+        has_section[np.searchsorted(self.offsets, span_starts, side="right") - 1] = True
+
+        names = [split_doc_name(self.docs[k]["doc"]) for k in self.keys]
+        df = pd.DataFrame({"公司代码": [code for code, _ in names], "公司简称": [name for _, name in names]})
+        for w in dict.fromkeys(words):
+            doc, pos = self.occurrences(w)
+            g = pos + self.offsets[doc]
+            k = np.searchsorted(span_starts, g, side="right") - 1
+            inside = (k >= 0) & (g < span_ends[np.maximum(k, 0)]) if len(spans) else np.zeros(len(g), dtype=bool)
+            df[w] = np.where(has_section, np.bincount(doc[inside], minlength=len(self.keys)), np.nan)
+        df["分词总数"] = np.where(has_section, totals, np.nan)
+        return df.sort_values("公司代码").reset_index(drop=True)
+
+    def section_table(self, keyword_groups, trust_words, section=None):
+        # 章节内各关键词组合计与 Trust_Index（均为分词计数）；section 为 None 时为全文
+        words = [w for ws in keyword_groups.values() for w in ws if w] + [w for w in trust_words if w]
+        df = self.counts(words, section)
+        out = df[["公司代码", "公司简称"]].copy()
+        for group, ws in keyword_groups.items():
+            out[group] = sum(df[w] for w in ws if w)
+        out["分词总数"] = df["分词总数"]
+        out["Trust_Index"] = _rates(sum(df[w] for w in trust_words if w), df["分词总数"])
+        return out
+
+    def trust_by_section(self, trust_words, sections=tuple(SECTION_ALIASES)):
+        # 全文及各章节的 Trust_Index，没有该章节的公司为空值
+        words = [w for w in trust_words if w]
+        out = None
+        for section in (None,) + tuple(sections):
+            df = self.counts(words, section)
+            if out is None:
+                out = df[["公司代码", "公司简称"]].copy()
+            out["Trust_Index" if section is None else f"Trust_Index_{section}"] = \
+                _rates(sum(df[w] for w in words), df["分词总数"])
+        return out
+
+
+def _rates(hits, totals):
+    # 与 analysis.trust_index 相同：分词总数为 0 时记 0
+    rates = hits / totals
+    rates[totals == 0] = 0
+    return rates
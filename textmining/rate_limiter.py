@@ -0,0 +1,120 @@
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+# ===== 自适应限速器 =====
+# 令牌桶控制请求发出速率（每秒请求数），并按 AIMD 规则自适应调整：
+#   - 连续成功 success_window 次：速率加 increase，并发上限加 1（加性增）
+#   - 遇到 429 / 5xx / 超时等：速率与并发上限乘以 decrease（乘性减）
+# 同一实例可被多个线程或多个协程共享，作为全局的限速器。
+
+THROTTLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate=1.0, min_rate=0.1, max_rate=None, burst=1,
+                 increase=0.1, decrease=0.5, success_window=20,
+                 concurrency=None, max_concurrency=None, cooldown=1.0):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate) if max_rate else float(rate) * 4
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.success_window = success_window
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency or concurrency
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+        self._successes = 0
+        self._last_decrease = float("-inf")
+        self._in_flight = 0
+        self._cond = threading.Condition(self._lock)
+        self._async_cond = None
+
+    # ---- 令牌桶 ----
+    def _reserve(self):
+        # 预约下一个发送时刻，返回需要等待的秒数
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self.rate
+            # 空闲期间最多积攒 burst 个令牌
+            self._next_time = max(self._next_time, now - (self.burst - 1) * interval)
+            wait = max(0.0, self._next_time - now)
+            self._next_time += interval
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    # ---- 并发上限 ----
+    @contextmanager
+    def slot(self):
+        if self.concurrency is None:
+            yield
+            return
+        with self._cond:
+            while self._in_flight >= self.concurrency:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        if self.concurrency is None:
+            yield
+            return
+        if self._async_cond is None:
+            self._async_cond = asyncio.Condition()
+        async with self._async_cond:
+            await self._async_cond.wait_for(lambda: self._in_flight < self.concurrency)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._async_cond:
+                self._in_flight -= 1
+                self._async_cond.notify_all()
+
+    # ---- AIMD 反馈 ----
+    def is_throttled(self, status=None, error=None):
+        return error is not None or status in THROTTLE_STATUS
+
+    def report(self, status=None, error=None):
+        # 每个请求结束后调用：status 为 HTTP 状态码，error 为超时/连接异常
+        with self._lock:
+            now = time.monotonic()
+            if self.is_throttled(status, error):
+                self._successes = 0
+                # 同一波失败只降一次，避免并发请求同时失败时速率被连续砍半
+                if now - self._last_decrease < self.cooldown:
+                    return
+                self._last_decrease = now
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                if self.concurrency is not None:
+                    self.concurrency = max(1, int(self.concurrency * self.decrease))
+                # 退避：下一个请求至少等待一个新的间隔
+                self._next_time = max(self._next_time, now + 1.0 / self.rate)
+                return
+            self._successes += 1
+            if self._successes >= self.success_window:
+                self._successes = 0
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                if self.concurrency is not None and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+            self._cond.notify_all()
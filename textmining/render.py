@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from .dtm import DocTermMatrix
+from .keywords import dictionary
+
+# ===== 图表绘制（05_可视化.py 单年模式与批量模式共用） =====
+# 每个进程只做一次字体与样式设置、只创建一个 WordCloud 实例，之后逐年复用；
+# 以无界面后端（Agg）保存 PNG，不调用 plt.show()，不会阻塞批量运行。
+# 每张图的输入数据与参数算出指纹，记录在 分析结果_{年份}/图表指纹.json，未变化的图直接跳过。
+
+RENDER_VERSION = 1  # 绘图代码变化时加一，使已有图表全部重绘
+WORDCLOUD_FONT = "/System/Library/Fonts/STHeiti Medium.ttc"
+FINGERPRINT_NAME = "图表指纹.json"
+HIGHLIGHT_WORDS = ["链", "加密", "可信", "共识"]
+
+# 进程内的绘图状态
+_plt = None
+_wordcloud = None
+
+
+def init_renderer(font_path=WORDCLOUD_FONT):
+    global _plt, _wordcloud
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
+    # ===== 字体支持 =====
+    plt.rcParams['axes.unicode_minus'] = False
+    plt.rcParams['font.sans-serif'] = ['Heiti TC', 'SimHei']
+    _plt = plt
+    _wordcloud = WordCloud(
+        font_path=font_path,
+        width=800, height=600,
+        background_color="white",
+        colormap="viridis"
+    )
+
+
+# ========== 输入数据 ==========
+def counts_table(all_counts):
+    # 标准化：各关键词原始计数与占全部关键词的比例
+    total = sum(all_counts.values())
+    norm_freq = {k: v / total if total else 0.0 for k, v in all_counts.items()}
+    return pd.DataFrame({
+        "关键词": list(norm_freq.keys()),
+        "标准化频率": list(norm_freq.values()),
+        "原始计数": [all_counts[k] for k in norm_freq.keys()]
+    }).sort_values(by="标准化频率", ascending=False)
+
+
+def load_trust(output_dir, year):
+    trust_path = os.path.join(output_dir, f"数据可信度指数_{year}.xlsx")
+    if not os.path.exists(trust_path):
+        return None
+    trust_df = pd.read_excel(trust_path)
+    return trust_df[trust_df["Trust_Index"] >= 0]
+
+
+def load_year_counts(output_dir, year):
+    # 批量模式的输入：优先取 04 生成的分词矩阵列和，其次取上次 05 输出的词频统计表；都没有时返回 None
+    keywords = dictionary.group_keywords
+    dtm_path = os.path.join(output_dir, f"分词矩阵_{year}.npz")
+    if os.path.exists(dtm_path):
+        dtm = DocTermMatrix.load(dtm_path)
+        if all(kw in dtm.term_index for kw in keywords):
+            totals = dtm.column_totals(keywords)
+            return {kw: int(totals[kw]) for kw in keywords}
+    counts_path = os.path.join(output_dir, f"词频统计_{year}.xlsx")
+    if os.path.exists(counts_path):
+        df = pd.read_excel(counts_path)
+        counts = dict(zip(df["关键词"], df["原始计数"]))
+        if all(kw in counts for kw in keywords):
+            return {kw: int(counts[kw]) for kw in keywords}
+    return None
+
+
+# ========== 单张图 ==========
+def _figure(size):
+    # 复用同一个 Figure 对象，只清空内容
+    fig = _plt.figure(num="render", figsize=size, clear=True)
+    fig.set_size_inches(*size)
+    return fig
+
+
+def _save(path, dpi):
+    _plt.tight_layout()
+    _plt.savefig(path, dpi=dpi, bbox_inches='tight')
+
+
+def bar_chart(df, year, path, dpi):
+    # 关键词柱状图
+    words = df["关键词"]
+    freqs = df["原始计数"]
+
+    _figure((13, 7))
+    colors = [
+        "#E24A33" if any(x in w for x in HIGHLIGHT_WORDS) else "#4A90E2"
+        for w in words
+    ]
+    bars = _plt.bar(words, freqs, color=colors, edgecolor="black", alpha=0.85)
+
+    _plt.title(f"{year} 年企业年报高频词统计\n（区块链 / 加密算法 / 可信计算相关词汇高亮）", fontsize=18, fontweight="bold", pad=20)
+    _plt.xlabel("关键词", fontsize=14)
+    _plt.ylabel("出现次数", fontsize=14)
+    _plt.xticks(rotation=45, ha='right', fontsize=12)
+    _plt.yticks(fontsize=12)
+    _plt.grid(axis='y', linestyle='--', alpha=0.5)
+
+    for bar in bars:
+        _plt.text(bar.get_x() + bar.get_width()/2,
+                  bar.get_height() + 1,
+                  f"{int(bar.get_height())}",
+                  ha='center', va='bottom', fontsize=10)
+    _save(path, dpi)
+
+
+def word_cloud(all_counts, path):
+    _wordcloud.generate_from_frequencies(all_counts)
+    _wordcloud.to_file(path)
+
+
+def trust_histogram(trust_df, year, path, dpi):
+    # 分布图
+    _figure((10, 6))
+    _plt.hist(trust_df["Trust_Index"], bins=30, color="#6EC6CA", edgecolor="black", alpha=0.8)
+    _plt.title(f"{year} 年企业年报“数据可信度指数”分布", fontsize=18, fontweight="bold", pad=20)
+    _plt.xlabel("Trust_Index（可信度指数）", fontsize=14)
+    _plt.ylabel("企业数量", fontsize=14)
+    _plt.grid(axis='y', linestyle='--', alpha=0.5)
+    _save(path, dpi)
+
+
+def trust_top20(trust_df, year, path, dpi):
+    # Top 20
+    top20 = trust_df.sort_values(by="Trust_Index", ascending=False).head(20)
+    _figure((12, 8))
+    bars = _plt.barh(top20["公司简称"], top20["Trust_Index"], color="#FFB74D", alpha=0.85)
+    _plt.gca().invert_yaxis()
+    _plt.title(f"{year} 年“可信度指数”最高的20家企业", fontsize=18, fontweight="bold", pad=20)
+    _plt.xlabel("Trust_Index", fontsize=14)
+    _plt.ylabel("公司简称", fontsize=14)
+    for bar in bars:
+        _plt.text(bar.get_width() + 0.0005,
+                  bar.get_y() + bar.get_height()/2,
+                  f"{bar.get_width():.4f}",
+                  va='center', fontsize=10)
+    _save(path, dpi)
+
+
+# ========== 一年的全部图表 ==========
+def _fingerprint(*parts):
+    data = json.dumps([RENDER_VERSION, *parts], ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def render_year(job):
+    # job: {"year", "output_dir", "counts": {关键词: 次数}, "trust": 可信度指数表或 None, "dpi", "force"}
+    if _plt is None:
+        init_renderer()
+    start = time.perf_counter()
+    year, output_dir, dpi = job["year"], job["output_dir"], job["dpi"]
+    os.makedirs(output_dir, exist_ok=True)
+    fp_path = os.path.join(output_dir, FINGERPRINT_NAME)
+    fingerprints = {}
+    if os.path.exists(fp_path) and not job.get("force"):
+        with open(fp_path, encoding="utf-8") as f:
+            fingerprints = json.load(f)
+
+    all_counts = job["counts"]
+    df = counts_table(all_counts)
+    counts_key = list(all_counts.items())
+    charts = [
+        (f"词频统计_{year}.xlsx", _fingerprint(year, counts_key),
+         lambda path: df.to_excel(path, index=False)),
+        (f"词频统计_{year}.png", _fingerprint(year, dpi, counts_key),
+         lambda path: bar_chart(df, year, path, dpi)),
+        (f"词云_{year}.png", _fingerprint(counts_key, _wordcloud.font_path),
+         lambda path: word_cloud(all_counts, path)),
+    ]
+    trust_df = job.get("trust")
+    if trust_df is not None:
+        trust_key = trust_df[["公司简称", "Trust_Index"]].to_json(orient="values", force_ascii=False)
+        charts += [
+            (f"可信度指数分布_{year}.png", _fingerprint(year, dpi, trust_key),
+             lambda path: trust_histogram(trust_df, year, path, dpi)),
+            (f"可信度前20企业_{year}.png", _fingerprint(year, dpi, trust_key),
+             lambda path: trust_top20(trust_df, year, path, dpi)),
+        ]
+
+    rendered, skipped = [], []
+    for name, key, draw in charts:
+        path = os.path.join(output_dir, name)
+        if fingerprints.get(name) == key and os.path.exists(path):
+            skipped.append(name)
+            continue
+        draw(path)
+        fingerprints[name] = key
+        rendered.append(name)
+
+    if rendered:
+        tmp = fp_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fingerprints, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, fp_path)
+    return {"year": year, "rendered": rendered, "skipped": skipped, "trust": trust_df is not None,
+            "seconds": time.perf_counter() - start}
+
+
+def render_many(jobs, workers=1, font_path=WORDCLOUD_FONT):
+    # 多个年份并行绘制，按 jobs 顺序产出结果
+    if workers <= 1 or len(jobs) <= 1:
+        init_renderer(font_path)
+        for job in jobs:
+            yield render_year(job)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=init_renderer,
+                             initargs=(font_path,)) as executor:
+        yield from executor.map(render_year, jobs)
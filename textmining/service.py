@@ -0,0 +1,444 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import jieba
+from aiohttp import web
+from . import analysis
+from .analysis import count_keywords, init_worker, trust_index
+from .corpus import document_sha256, open_year, read_document
+from .keyword_matcher import KeywordMatcher
+from .keywords import dictionary
+from .manifest import doc_key, parse_doc_name
+from .metrics import inc, observe
+from .pdf_extract import EXTRACTOR_VERSION, pdf_bytes_to_text
+from .token_cache import TokenCache, count_encoded, count_terms, encode_tokens
+
+# ===== 在线评分服务（score_server.py） =====
+# 常驻进程池里 jieba 词典与匹配器只加载一次，单篇年报的关键词组计数与 Trust_Index 按需计算：
+#   POST /score             上传 PDF / TXT（multipart 的 file 字段，或直接以请求体发送），
+#                           或 JSON：{"text": ...} / {"code": "000001", "year": 2021}
+#                           可另附 keyword_groups / trust_words 试算临时关键词表（不改动 关键词词典.json）
+#   GET  /score/{year}/{code}  语料库中的年报；分词缓存有效时不再分词
+#   GET  /health            词典版本、缓存命中与批次统计
+# 短时间内到达的请求合并为一批送入进程池；结果按 (文档哈希, 词典版本) 存入 LRU 缓存。
+# 关键词词典.json 修改后自动重新加载，并重建进程池使 jieba 自定义词生效；工作进程异常退出时同样重建进程池。
+# 打开年份、列目录、检查词典等文件操作在线程池中完成，不阻塞事件循环。
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_BATCH_WAIT = 0.005  # 秒
+MAX_MATCHERS = 16
+DICTIONARY_CHECK_INTERVAL = 1.0  # 秒：词典文件变化最多每隔这么久检查一次
+REFRESH_INTERVAL = 30.0  # 秒：查不到公司代码时重新打开该年的最短间隔，避免连续的 404 反复重读目录
+
+
+class ScoringError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LRUCache:
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        if key not in self._data:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ========== 临时关键词表 ==========
+_matchers = OrderedDict()  # 关键词表 JSON -> 编译好的匹配器，主进程与工作进程各一份
+
+
+def compile_matcher(config):
+    # config: {"keyword_groups": {...}, "trust_words": [...]}；临时关键词表不注册为 jieba 自定义词，
+    # 分词计数按相邻词拼接，与词典内关键词的计数语义一致
+    key = json.dumps(config, ensure_ascii=False, sort_keys=True)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = _matchers[key] = KeywordMatcher(config["keyword_groups"], config.get("trust_words", []))
+        while len(_matchers) > MAX_MATCHERS:
+            _matchers.popitem(last=False)
+    _matchers.move_to_end(key)
+    return matcher
+
+
+# ========== 工作进程 ==========
+def init_scorer(matcher):
+    init_worker(matcher, matcher.trust_words)
+
+
+def score_document(task):
+    # task: {"kind": "text" / "pdf" / "ref", "data": 文本 / PDF 字节 / 文档引用,
+    #        "config": 临时关键词表或 None, "cached": (tokens_path, offset, length, term_plan) 或 None}
+    start = time.perf_counter()
+    try:
+        matcher = compile_matcher(task["config"]) if task["config"] else analysis._matcher
+        if task["kind"] == "pdf":
+            text = pdf_bytes_to_text(task["data"])
+        elif task["kind"] == "ref":
+            text = read_document(task["data"], errors="ignore")
+        else:
+            text = task["data"]
+        counts = count_keywords(text, matcher)
+        if task["cached"] is not None:
+            tokens_path, offset, length, plan = task["cached"]
+            ids = analysis._cached_ids(tokens_path, offset, length)
+            token_counts = count_terms(ids, plan)
+        else:
+            local_vocab, ids = encode_tokens(jieba.cut(text))
+            token_counts = count_encoded(local_vocab, ids, matcher.keywords)
+        return {
+            "groups": {g: counts[g] for g in matcher.keyword_groups},
+            "总字数": counts["总字数"],
+            "Trust_Index": trust_index(token_counts, matcher.trust_words, len(ids)),
+            "分词总数": len(ids),
+            "分词计数": token_counts,
+            "token_cache": task["cached"] is not None,
+            "compute_ms": (time.perf_counter() - start) * 1000,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def score_batch(tasks):
+    return [score_document(task) for task in tasks]
+
+
+# ========== 服务 ==========
+class ScoringService:
+    def __init__(self, base_dir, workers=2, cache_size=DEFAULT_CACHE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT):
+        self.base_dir = base_dir
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.cache = LRUCache(cache_size)
+        self.batches = 0
+        self._years = {}     # 年份 -> (语料库或 TXT 目录, 分词缓存, {公司代码: 最新一份的文档名}, 打开时间)
+        self._years_lock = threading.Lock()
+        self._dictionary_checked = 0.0
+        self._inflight = {}  # 缓存键 -> 正在计算的 Future，同一文档的并发请求只算一次
+        self._pool = None
+        self._queue = None
+        self._slots = None
+        self._batcher = None
+        self._running = set()
+
+    # ---- 生命周期 ----
+    def _start_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_scorer,
+                                         initargs=(dictionary.matcher,))
+        # 预热：每个工作进程加载 jieba 词典
+        for _ in range(self.workers):
+            self._pool.submit(time.sleep, 0)
+
+    async def start(self, app=None):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._start_pool()
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def stop(self, app=None):
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        for _, token_cache, _, _ in self._years.values():
+            token_cache.close()
+
+    async def _reload_dictionary(self):
+        # 读取、编译词典在线程池中完成；重建进程池在事件循环中进行
+        now = time.monotonic()
+        if now - self._dictionary_checked < DICTIONARY_CHECK_INTERVAL:
+            return
+        self._dictionary_checked = now
+        try:
+            changed = await asyncio.get_running_loop().run_in_executor(None, dictionary.reload)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ 关键词词典加载失败，沿用当前版本：{e}")
+            return
+        if changed:
+            print(f"🔄 关键词词典已更新（版本 {dictionary.version[:12]}），重建进程池")
+            self._start_pool()
+
+    # ---- 批处理 ----
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch):
+        pool = self._pool
+        start = time.perf_counter()
+
+        async def run_chunk(chunk):
+            # 进程池已损坏时 submit 本身就会抛出 BrokenProcessPool，在协程内抛出由 gather 收集
+            return await asyncio.get_running_loop().run_in_executor(pool, score_batch, [task for task, _ in chunk])
+
+        try:
+            # 一批按工作进程数切分，每份只需一次进程间往返
+            chunks = [batch[i::self.workers] for i in range(min(self.workers, len(batch)))]
+            outputs = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks), return_exceptions=True)
+            if any(isinstance(output, BrokenProcessPool) for output in outputs) and self._pool is pool:
+                print("⚠️ 评分工作进程异常退出，重建进程池")
+                inc("pool_restarts", stage="score")
+                self._start_pool()
+            for chunk, output in zip(chunks, outputs):
+                for i, (_, future) in enumerate(chunk):
+                    if future.done():
+                        continue
+                    if isinstance(output, BrokenProcessPool):
+                        future.set_exception(ScoringError(503, "评分进程异常退出，已重建进程池，请稍后重试"))
+                    elif isinstance(output, BaseException):
+                        future.set_exception(output)
+                    else:
+                        future.set_result(output[i])
+        finally:
+            # 任何意外都不能让等待中的请求悬挂
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ScoringError(503, "评分批次异常中止，请稍后重试"))
+            self._slots.release()
+            self.batches += 1
+            observe("score_batch", time.perf_counter() - start, size=len(batch))
+
+    async def score(self, key, task):
+        # 返回 (结果, 是否命中缓存)
+        result = self.cache.get(key)
+        if result is not None:
+            inc("score_requests", source=task["kind"], cache="hit")
+            return result, True
+        inc("score_requests", source=task["kind"], cache="miss")
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.get_running_loop().create_future()
+            await self._queue.put((task, future))
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            self._inflight.pop(key, None)
+        if "error" in result:
+            raise ScoringError(422, result["error"])
+        self.cache.put(key, result)
+        return result, False
+
+    # ---- 请求解析 ----
+    def _open_year(self, year):
+        # 打开一年的文档与分词缓存，并建立 公司代码 -> 最新披露的文档名（同一公司有多份时取公告 ID 最大的一份）
+        docs = open_year(self.base_dir, year)
+        latest = {}
+        for name in docs.names():
+            code, _, ann_id = parse_doc_name(name)
+            if code not in latest or int(ann_id or 0) > int(parse_doc_name(latest[code])[2] or 0):
+                latest[code] = name
+        return docs, TokenCache(os.path.join(self.base_dir, f"分词缓存_{year}")), latest, time.monotonic()
+
+    def _find(self, year, code):
+        # 在线程池中调用。找不到时重新打开该年（期间可能新增了 TXT 或语料库分片），
+        # 同一年份每 REFRESH_INTERVAL 秒最多重新打开一次
+        with self._years_lock:
+            entry = self._years.get(year)
+            if entry is None or (code not in entry[2] and time.monotonic() - entry[3] >= REFRESH_INTERVAL):
+                if entry is not None:
+                    entry[1].close()
+                entry = self._years[year] = self._open_year(year)
+        docs, token_cache, latest, _ = entry
+        if code not in latest:
+            raise ScoringError(404, f"未找到 {year} 年公司代码 {code} 的年报")
+        return docs.ref(latest[code]), token_cache, doc_key(latest[code])
+
+    def _version(self, config):
+        if config is None:
+            return dictionary.version, dictionary.matcher
+        matcher = compile_matcher(config)
+        return "custom:" + matcher.fingerprint, matcher
+
+    async def prepare(self, kind, data, config=None, code=None, year=None):
+        # 返回 (缓存键, 任务)；ref 模式下分词缓存有效时附上词 ID 位置，工作进程不再分词。
+        # 查找文档、上传内容与 TXT 文件的哈希在线程池中计算，不阻塞事件循环
+        await self._reload_dictionary()
+        version, matcher = self._version(config)
+        loop = asyncio.get_running_loop()
+        cached = None
+        if kind == "ref":
+            data, token_cache, key = await loop.run_in_executor(None, self._find, year, code)
+            sha256 = await loop.run_in_executor(None, document_sha256, data)
+            if token_cache.has(key, sha256):
+                offset, length = token_cache.span(key)
+                cached = (token_cache.tokens_path, offset, length, token_cache.term_plan(matcher.keywords))
+        elif kind == "pdf":
+            sha256 = await loop.run_in_executor(None, _sha256, data) + ":" + EXTRACTOR_VERSION
+        else:
+            sha256 = await loop.run_in_executor(None, _sha256, data.encode("utf-8"))
+        return (sha256, version), {"kind": kind, "data": data, "config": config, "cached": cached}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ref_args(code, year):
+    # 公司代码为字符串或整数，年份为整数或数字字符串
+    if year is None:
+        raise ScoringError(400, "按公司代码评分需同时给出 year")
+    if isinstance(code, bool) or not isinstance(code, (str, int)) or not str(code).strip():
+        raise ScoringError(400, "code 应为公司代码字符串")
+    if isinstance(year, bool) or not isinstance(year, (str, int)) or not str(year).strip().isdigit():
+        raise ScoringError(400, "year 应为年份（整数）")
+    return str(code).strip(), int(year)
+
+
+def _is_words(value):
+    return isinstance(value, list) and all(isinstance(w, str) for w in value)
+
+
+def _config_from(fields):
+    if not fields.get("keyword_groups"):
+        return None
+    groups = fields["keyword_groups"]
+    trust = fields.get("trust_words") or []
+    if isinstance(groups, str):
+        groups = json.loads(groups)
+    if isinstance(trust, str):
+        trust = json.loads(trust)
+    if not isinstance(groups, dict) or not all(_is_words(ws) for ws in groups.values()):
+        raise ScoringError(400, "keyword_groups 应为 {组名: [关键词, ...]}")
+    if not _is_words(trust):
+        raise ScoringError(400, "trust_words 应为 [关键词, ...]")
+    return {"keyword_groups": groups, "trust_words": trust}
+
+
+def _is_pdf(data, filename=None, content_type=None):
+    return (data[:5] == b"%PDF-" or (filename or "").lower().endswith(".pdf")
+            or content_type == "application/pdf")
+
+
+async def _read_request(request):
+    # 返回 (kind, data, config, code, year)
+    if request.content_type == "multipart/form-data":
+        fields, kind, data = {}, None, None
+        async for part in await request.multipart():
+            value = await part.read()
+            if part.name == "file":
+                kind = "pdf" if _is_pdf(value, part.filename, part.headers.get("Content-Type")) else "text"
+                data = value if kind == "pdf" else value.decode("utf-8", errors="ignore")
+            else:
+                fields[part.name] = value.decode("utf-8")
+        if data is None and fields.get("text"):
+            kind, data = "text", fields["text"]
+        if data is None and fields.get("code"):
+            return ("ref", None, _config_from(fields)) + _ref_args(fields["code"], fields.get("year"))
+        if data is None:
+            raise ScoringError(400, "缺少 file 字段")
+        return kind, data, _config_from(fields), None, None
+    if request.content_type == "application/json":
+        try:
+            body = await request.json()
+        except ValueError:
+            raise ScoringError(400, "请求体不是合法的 JSON")
+        if not isinstance(body, dict):
+            raise ScoringError(400, "JSON 请求体应为对象")
+        config = _config_from(body)
+        if "text" in body:
+            if not isinstance(body["text"], str):
+                raise ScoringError(400, "text 应为字符串")
+            return "text", body["text"], config, None, None
+        if "code" in body:
+            return ("ref", None, config) + _ref_args(body["code"], body.get("year"))
+        raise ScoringError(400, "JSON 请求需包含 text，或 code 与 year")
+    data = await request.read()
+    if not data:
+        raise ScoringError(400, "请求体为空")
+    if _is_pdf(data, content_type=request.content_type):
+        return "pdf", data, None, None, None
+    return "text", data.decode("utf-8", errors="ignore"), None, None, None
+
+
+def _json(obj, status=200):
+    return web.json_response(obj, status=status, dumps=lambda o: json.dumps(o, ensure_ascii=False))
+
+
+def _response(key, result, cached, start):
+    return _json(dict(result, sha256=key[0].split(":")[0], dictionary=key[1], cached=cached,
+                      ms=(time.perf_counter() - start) * 1000))
+
+
+def create_app(service):
+    async def score(request):
+        start = time.perf_counter()
+        try:
+            kind, data, config, code, year = await _read_request(request)
+            key, task = await service.prepare(kind, data, config, code, year)
+            result, cached = await service.score(key, task)
+        except ScoringError as e:
+            return _json({"error": str(e)}, e.status)
+        except (ValueError, KeyError) as e:
+            return _json({"error": f"请求格式错误：{e}"}, 400)
+        return _response(key, result, cached, start)
+
+    async def score_ref(request):
+        start = time.perf_counter()
+        try:
+            key, task = await service.prepare("ref", None, None, *_ref_args(request.match_info["code"],
+                                                                             request.match_info["year"]))
+            result, cached = await service.score(key, task)
+        except ScoringError as e:
+            return _json({"error": str(e)}, e.status)
+        except (ValueError, KeyError) as e:
+            return _json({"error": f"请求格式错误：{e}"}, 400)
+        return _response(key, result, cached, start)
+
+    async def health(request):
+        return _json({
+            "dictionary": dictionary.version, "keywords": len(dictionary.keywords),
+            "workers": service.workers, "batches": service.batches,
+            "cache": {"size": len(service.cache), "hits": service.cache.hits, "misses": service.cache.misses},
+        })
+
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.router.add_post("/score", score)
+    app.router.add_get(r"/score/{year:\d{4}}/{code}", score_ref)
+    app.router.add_get("/health", health)
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    return app
@@ -0,0 +1,110 @@
+import os
+import re
+import random
+import fitz  # PyMuPDF
+from .keywords import dictionary
+
+# ===== 合成年报语料（基准测试用） =====
+# 以 示例数据/ 中的年报片段为底本，按固定随机种子拼接成任意篇数、任意长度的年报，
+# 并按给定密度插入关键词，可同时生成 PDF。种子与参数相同则输出逐字节相同。
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_TXT = os.path.join(REPO_DIR, "示例数据", "示例_000001_平安银行.txt")
+
+# 底本较短，补充一些年报常见句式
+FILLER_SENTENCES = [
+    "报告期内，公司实现营业收入与净利润同比稳步增长",
+    "公司持续优化资产负债结构，经营活动现金流量保持稳健",
+    "董事会严格按照公司章程履行职责，保障全体股东的合法权益",
+    "公司进一步完善内部控制体系，提升经营管理的规范化水平",
+    "本年度研发投入占营业收入的比例较上年有所提高",
+    "公司积极履行社会责任，推动绿色低碳与可持续发展",
+    "报告期内，公司主营业务未发生重大变化",
+    "公司与主要客户保持长期稳定的合作关系",
+]
+PAGE_CHARS = 1200  # 每页约 1200 字，与真实年报接近
+LINE_CHARS = 40
+
+
+def load_sentences(sample_path=SAMPLE_TXT):
+    with open(sample_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    sentences = [s.strip() for s in re.split(r"[。\n]", text) if len(s.strip()) > 4]
+    return sentences + FILLER_SENTENCES
+
+
+def make_report(rng, sentences, chars, density, keywords):
+    # density：每千字插入的关键词个数
+    lines = []
+    total = 0
+    while total < chars:
+        sentence = rng.choice(sentences)
+        n_inserts = sum(1 for _ in range(len(sentence)) if rng.random() < density / 1000)
+        for _ in range(n_inserts):
+            pos = rng.randrange(len(sentence) + 1)
+            sentence = sentence[:pos] + rng.choice(keywords) + sentence[pos:]
+        lines.append(sentence + "。")
+        total += len(sentence) + 1
+    # 按页切分，每页再按行折行，模拟 PDF 抽取出的版面
+    pages = []
+    page, size = [], 0
+    for line in lines:
+        page.append(line)
+        size += len(line)
+        if size >= PAGE_CHARS:
+            pages.append(page)
+            page, size = [], 0
+    if page:
+        pages.append(page)
+    return ["\n".join(_wrap("".join(p))) for p in pages]
+
+
+def _wrap(text):
+    return [text[i:i + LINE_CHARS] for i in range(0, len(text), LINE_CHARS)]
+
+
+def write_pdf(pages, pdf_path):
+    doc = fitz.open()
+    for page_text in pages:
+        page = doc.new_page()
+        y = 50
+        for line in page_text.split("\n"):
+            page.insert_text((40, y), line, fontname="china-s", fontsize=11)
+            y += 15
+            if y > page.rect.height - 40:
+                page = doc.new_page()
+                y = 50
+    # 清空元数据、不生成新文件 ID，相同参数生成的 PDF 逐字节相同
+    doc.set_metadata({})
+    doc.save(pdf_path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+
+
+def generate_corpus(base_dir, year, n_docs, chars=60000, density=2.0, seed=0, pdf=True):
+    # 生成 {base_dir}/年报TXT_{year}/ 与（pdf=True 时）年报PDF_{year}_有效/，返回各文档信息
+    rng = random.Random(seed)
+    sentences = load_sentences()
+    keywords = dictionary.group_keywords + list(dictionary.trust_words)
+    txt_dir = os.path.join(base_dir, f"年报TXT_{year}")
+    pdf_dir = os.path.join(base_dir, f"年报PDF_{year}_有效")
+    os.makedirs(txt_dir, exist_ok=True)
+    if pdf:
+        os.makedirs(pdf_dir, exist_ok=True)
+
+    docs = []
+    codes = rng.sample(range(1, 1000000), n_docs)
+    for i, code in enumerate(sorted(codes)):
+        name = f"{code:06d}_样本公司{i}"
+        # 篇幅在 chars 上下浮动，模拟真实年报长短不一
+        pages = make_report(rng, sentences, int(chars * rng.uniform(0.5, 1.5)), density, keywords)
+        txt_path = os.path.join(txt_dir, name + ".txt")
+        with open(txt_path, "w", encoding="utf-8") as f:
+            for page_text in pages:
+                f.write(page_text + "\n")
+        doc = {"name": name, "txt": txt_path, "pages": len(pages), "txt_bytes": os.path.getsize(txt_path)}
+        if pdf:
+            doc["pdf"] = os.path.join(pdf_dir, name + ".pdf")
+            write_pdf(pages, doc["pdf"])
+            doc["pdf_bytes"] = os.path.getsize(doc["pdf"])
+        docs.append(doc)
+    return docs
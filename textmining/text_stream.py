@@ -0,0 +1,95 @@
+import re
+import jieba
+from .corpus import open_document
+from .token_cache import TermCounter
+
+# ===== 大文件流式处理 =====
+# 按块读取 TXT，关键词匹配与分词都逐块进行，单篇年报的内存占用与文件大小无关：
+#   - 关键词：每块去空白后与上一块末尾 (最长关键词长度 - 1) 个字符拼接再扫描，
+#     跨块、甚至中间夹有空白/换行的关键词都能正确计数，结果与整篇 str.count 一致
+#   - 分词：只在换行处切块。jieba 先按汉字/字母数字连续段切分再分别分词，
+#     换行不属于任何连续段，因此逐块分词与整篇 jieba.lcut 的结果完全相同
+
+DEFAULT_CHUNK_SIZE = 1 << 20  # 约 1M 字符
+_NON_BLOCK = re.compile("[^\u4E00-\u9FD5a-zA-Z0-9+#&\\._%\\-]")  # jieba 连续段字符集之外的字符
+
+
+def iter_text_chunks(ref, chunk_size=DEFAULT_CHUNK_SIZE):
+    # 与 open(..., "r", encoding="utf-8", errors="ignore").read() 读到的内容相同，只是分块产出；
+    # ref 为 TXT 路径或语料库文档引用
+    with open_document(ref, errors="ignore") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_segmentable(chunks):
+    # 把任意切分的文本块重新切分到“分词安全”的边界（换行之后）
+    carry = ""
+    for chunk in chunks:
+        buf = carry + chunk
+        cut = buf.rfind("\n") + 1
+        if cut == 0:
+            # 整块没有换行：退而在最后一个非连续段字符之后切分（避开 \r\n 之间）
+            last = None
+            for m in _NON_BLOCK.finditer(buf):
+                if m.group() != "\r":
+                    last = m
+            cut = last.end() if last else 0
+        if cut:
+            yield buf[:cut]
+            carry = buf[cut:]
+        else:
+            carry = buf
+    if carry:
+        yield carry
+
+
+class StreamingKeywordCounter:
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.counts = dict.fromkeys(matcher.keywords, 0)
+        self.chars = 0
+        self._carry = ""
+        self._next_allowed = {}
+
+    def _scan(self, buf, end):
+        partial = self.matcher.scan(buf, 0, end, self._next_allowed)
+        for w, n in partial.items():
+            self.counts[w] += n
+        # 下一轮的缓冲区从 end 开始，位置整体前移
+        for w in self._next_allowed:
+            self._next_allowed[w] -= end
+
+    def feed(self, chunk):
+        stripped = self.matcher.strip(chunk)
+        self.chars += len(stripped)
+        buf = self._carry + stripped
+        # 起点在 end 之前的匹配已完全落在缓冲区内，可以确定
+        end = max(0, len(buf) - max(self.matcher.max_len - 1, 0))
+        self._scan(buf, end)
+        self._carry = buf[end:]
+
+    def finish(self):
+        if self._carry:
+            self._scan(self._carry, len(self._carry))
+            self._carry = ""
+        groups, trust = self.matcher.summarize(self.counts)
+        return {"keywords": self.counts, "groups": groups, "trust": trust, "chars": self.chars}
+
+
+def analyze_stream(ref, matcher, token_terms, chunk_size=DEFAULT_CHUNK_SIZE, segment=True):
+    # 一次流式读取同时完成关键词计数与分词计数；token_terms 为需要统计分词次数的词，
+    # segment=False 时只做关键词计数（如分词结果已有缓存）
+    keyword_counter = StreamingKeywordCounter(matcher)
+    term_counter = TermCounter(token_terms)
+    for piece in iter_segmentable(iter_text_chunks(ref, chunk_size)):
+        keyword_counter.feed(piece)
+        if segment:
+            term_counter.feed(jieba.cut(piece))
+    result = keyword_counter.finish()
+    result["tokens"] = term_counter.tokens
+    result["token_counts"] = term_counter.counts
+    return result
@@ -0,0 +1,239 @@
+import os
+import json
+import numpy as np
+
+# ===== 分词缓存 =====
+# 每年一个目录，jieba 分词结果只计算一次，供 04 / 05 等阶段共用：
+#   vocab.json  共享词表（词 ID = 下标）
+#   tokens.u32  所有文档的词 ID 依次拼接（uint32），读取时内存映射
+#   index.json  文档键 -> {offset, length, sha256, segmenter}（segmenter 为分词时 jieba 自定义词的版本）
+# 文档重新分词时追加新片段并改写索引，旧片段作废，tokens.u32 只增不减；
+# compact()（04 --compact-cache）把有效片段复制到新文件回收空间。词表同样只增不减（词 ID 保持不变），
+# 其大小受不同词的个数限制，不随重新分词增长。
+#
+# 分词计数：关键词出现一次 = 连续若干个词拼起来恰为该关键词。关键词已注册为 jieba 自定义词时
+# 它整体切出、就是单个词；加入词典之前写入的分词缓存中它可能被切成几个词，拼接计数即可，无需重新分词。
+
+TOKEN_DTYPE = np.uint32
+
+
+def encode_tokens(words):
+    # 在工作进程内把分词结果编码为（局部词表, 局部 ID 数组），避免回传大量 str 对象
+    index = {}
+    ids = np.fromiter((index.setdefault(w, len(index)) for w in words), dtype=TOKEN_DTYPE)
+    return list(index), ids
+
+
+def _splits(word):
+    # 把词切成连续片段的全部方式："abc" -> [abc] [a, bc] [ab, c] [a, b, c]
+    for mask in range(1 << max(len(word) - 1, 0)):
+        parts, start = [], 0
+        for i in range(1, len(word)):
+            if mask >> (i - 1) & 1:
+                parts.append(word[start:i])
+                start = i
+        parts.append(word[start:])
+        yield parts
+
+
+def term_plan(words, word_ids):
+    # {词: [词 ID 序列, ...]}：按词表能拼出该词的全部切分方式，整词在词表中时即单元素序列
+    plan = {}
+    for w in words:
+        seqs = []
+        for parts in _splits(w):
+            ids = [word_ids.get(p) for p in parts]
+            if None not in ids:
+                seqs.append(ids)
+        plan[w] = seqs
+    return plan
+
+
+def count_terms(ids, plan):
+    # plan 由 term_plan 生成；返回 {词: 出现次数}
+    if len(ids) == 0:
+        return {w: 0 for w in plan}
+    bins = np.bincount(ids)
+    counts = {}
+    for w, seqs in plan.items():
+        n = 0
+        for seq in seqs:
+            if any(i >= len(bins) or bins[i] == 0 for i in seq):
+                continue
+            if len(seq) == 1:
+                n += int(bins[seq[0]])
+                continue
+            # 多个词拼成：从首词出现的位置出发，逐个核对后续的词
+            pos = np.flatnonzero(ids[:len(ids) - len(seq) + 1] == seq[0])
+            for j, i in enumerate(seq[1:], 1):
+                pos = pos[ids[pos + j] == i]
+            n += len(pos)
+        counts[w] = n
+    return counts
+
+
+def count_encoded(local_vocab, ids, words):
+    # encode_tokens 结果上的分词计数
+    return count_terms(ids, term_plan(words, {w: i for i, w in enumerate(local_vocab)}))
+
+
+class TermCounter:
+    # 逐词输入的分词计数（流式模式），与 count_terms 的语义一致
+    def __init__(self, words):
+        self.counts = dict.fromkeys(words, 0)
+        self.max_len = max((len(w) for w in words), default=0)
+        self.tokens = 0
+        self._tail = []  # 最近的若干个词，总字数不超过最长关键词
+
+    def feed(self, words):
+        for w in words:
+            self.tokens += 1
+            self._tail.append(w)
+            while sum(map(len, self._tail)) > self.max_len:
+                self._tail.pop(0)
+            joined = ""
+            for t in reversed(self._tail):
+                joined = t + joined
+                if joined in self.counts:
+                    self.counts[joined] += 1
+
+
+class TokenCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vocab_path = os.path.join(cache_dir, "vocab.json")
+        self.tokens_path = os.path.join(cache_dir, "tokens.u32")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.compact_index_path = os.path.join(cache_dir, "index.compact.json")
+        self._recover_compaction()
+
+        self.vocab = self._load_json(self.vocab_path, [])
+        self.word_ids = {w: i for i, w in enumerate(self.vocab)}
+        self.index = self._load_json(self.index_path, {})
+        self._mmap = None
+        self._dirty = False
+
+    @staticmethod
+    def _load_json(path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _dump_json(path, obj):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _token_count(self):
+        if not os.path.exists(self.tokens_path):
+            return 0
+        return os.path.getsize(self.tokens_path) // TOKEN_DTYPE().itemsize
+
+    def _recover_compaction(self):
+        # compact() 先写 index.compact.json，再替换 tokens.u32，最后替换 index.json；
+        # 中途中断时按 tokens.u32 的长度判断替换是否已完成，使索引与 tokens.u32 保持一致
+        if not os.path.exists(self.compact_index_path):
+            return
+        index = self._load_json(self.compact_index_path, {})
+        if self._token_count() == sum(e["length"] for e in index.values()):
+            os.replace(self.compact_index_path, self.index_path)
+        else:
+            os.remove(self.compact_index_path)
+
+    # ---- 读 ----
+    def has(self, key, sha256=None):
+        entry = self.index.get(key)
+        return entry is not None and (sha256 is None or entry["sha256"] == sha256)
+
+    def span(self, key):
+        entry = self.index[key]
+        return entry["offset"], entry["length"]
+
+    def tokens(self):
+        # 整个 tokens.u32 的只读内存映射
+        if self._mmap is None:
+            if not os.path.exists(self.tokens_path) or os.path.getsize(self.tokens_path) == 0:
+                return np.zeros(0, dtype=TOKEN_DTYPE)
+            self._mmap = np.memmap(self.tokens_path, dtype=TOKEN_DTYPE, mode="r")
+        return self._mmap
+
+    def get(self, key):
+        offset, length = self.span(key)
+        return self.tokens()[offset:offset + length]
+
+    def words(self, key):
+        return [self.vocab[i] for i in self.get(key)]
+
+    def segmenter(self, key):
+        return self.index[key].get("segmenter")
+
+    def term_plan(self, words):
+        return term_plan(words, self.word_ids)
+
+    # ---- 写 ----
+    def put(self, key, sha256, local_vocab, local_ids, segmenter=None):
+        # 把工作进程的局部编码映射到共享词表后追加写入
+        mapping = np.empty(len(local_vocab), dtype=TOKEN_DTYPE)
+        for i, w in enumerate(local_vocab):
+            wid = self.word_ids.get(w)
+            if wid is None:
+                wid = self.word_ids[w] = len(self.vocab)
+                self.vocab.append(w)
+            mapping[i] = wid
+        ids = mapping[local_ids] if len(local_ids) else np.zeros(0, dtype=TOKEN_DTYPE)
+
+        offset = os.path.getsize(self.tokens_path) // TOKEN_DTYPE().itemsize if os.path.exists(self.tokens_path) else 0
+        with open(self.tokens_path, "ab") as f:
+            ids.tofile(f)
+        self.index[key] = {"offset": offset, "length": int(len(ids)), "sha256": sha256, "segmenter": segmenter}
+        self._mmap = None
+        self._dirty = True
+
+    def dead_fraction(self):
+        # tokens.u32 中作废片段所占比例
+        total = self._token_count()
+        live = sum(e["length"] for e in self.index.values())
+        return 1 - live / total if total else 0.0
+
+    def compact(self):
+        # 按偏移顺序把索引中的有效片段复制到新文件并替换 tokens.u32，返回回收的词 ID 个数。
+        # 打分服务等读取方按路径与偏移访问 tokens.u32：压缩时不要同时运行；关键词位置索引随后按新偏移重建
+        self.flush()
+        total = self._token_count()
+        tokens = self.tokens()
+        index = {}
+        offset = 0
+        tmp = self.tokens_path + ".tmp"
+        with open(tmp, "wb") as f:
+            for key, entry in sorted(self.index.items(), key=lambda kv: kv[1]["offset"]):
+                np.asarray(tokens[entry["offset"]:entry["offset"] + entry["length"]]).tofile(f)
+                index[key] = dict(entry, offset=offset)
+                offset += entry["length"]
+        del tokens
+        self._mmap = None
+        self._dump_json(self.compact_index_path, index)
+        os.replace(tmp, self.tokens_path)
+        os.replace(self.compact_index_path, self.index_path)
+        self.index = index
+        return total - offset
+
+    def flush(self):
+        # 先写词表再写索引：中途中断时索引引用的 ID 一定已在词表中
+        if self._dirty:
+            self._dump_json(self.vocab_path, self.vocab)
+            self._dump_json(self.index_path, self.index)
+            self._dirty = False
+
+    def close(self):
+        self.flush()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()